@@ -0,0 +1,70 @@
+import heapq
+import itertools
+import threading
+from typing import Dict, List, Tuple
+
+# C teleserver.h 와 동일 (ms), 마지막 수신 후 이 시간이 지난 채널은 제거
+MAX_CHANNEL_AGE = 60 * 60 * 1000 * 72
+
+FLAG_RUNNING = 1
+
+
+class ChannelExpiry:
+    """채널 만료 예정 시각 힙 (check_channels 는 만료 시각이 지난 채널만 확인)
+
+    채널마다 다음 확인 시각을 하나 예약합니다. 세션 중이면 server_data_tick + timeout,
+    아니면 마지막 수신/핑 + max_age 입니다. 수신으로 시각이 늦춰지는 경우 힙을 고치지 않고
+    꺼낼 때 다시 계산해 재예약하므로, 패킷마다 드는 비용은 예약 시각 조회 한 번입니다.
+    """
+
+    def __init__(self, timeout: int, max_age: int = MAX_CHANNEL_AGE):
+        self.timeout = timeout
+        self.max_age = max_age
+        self.heap: List[Tuple[int, int, str]] = []  # (예약 시각, 순번, 채널 ID)
+        self.scheduled: Dict[str, int] = {}  # 채널 ID -> 유효한 예약 시각
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.scheduled)
+
+    def deadline(self, channel) -> int:
+        """채널 만료 시각 (ms)"""
+        if channel.flags & FLAG_RUNNING:
+            return channel.server_data_tick + self.timeout
+        return max(channel.server_data_tick, channel.server_ping_tick) + self.max_age
+
+    def schedule(self, channel):
+        """채널 확인 시각 예약 (이미 같거나 더 이른 예약이 있으면 그대로)"""
+        deadline = self.deadline(channel)
+        current = self.scheduled.get(channel.id)
+        if current is not None and current <= deadline:
+            return
+        with self.lock:
+            current = self.scheduled.get(channel.id)
+            if current is None or deadline < current:
+                # 이전 항목은 힙에 남지만 scheduled 와 다르므로 꺼낼 때 무시됨
+                self.scheduled[channel.id] = deadline
+                heapq.heappush(self.heap, (deadline, next(self.seq), channel.id))
+
+    def discard(self, channel_id: str):
+        """예약 취소 (채널 제거)"""
+        with self.lock:
+            self.scheduled.pop(channel_id, None)
+
+    def due(self, now: int) -> List[str]:
+        """예약 시각이 now 이전인 채널 ID (꺼낸 채널은 예약이 해제되므로 필요하면 다시 schedule)"""
+        channel_ids = []
+        with self.lock:
+            heap = self.heap
+            while heap and heap[0][0] <= now:
+                deadline, _, channel_id = heapq.heappop(heap)
+                if self.scheduled.get(channel_id) == deadline:
+                    del self.scheduled[channel_id]
+                    channel_ids.append(channel_id)
+            # 무시할 항목이 많이 쌓이면 힙 재구성
+            if len(heap) > 2 * len(self.scheduled) + 1024:
+                self.heap = [(deadline, next(self.seq), channel_id)
+                             for channel_id, deadline in self.scheduled.items()]
+                heapq.heapify(self.heap)
+        return channel_ids
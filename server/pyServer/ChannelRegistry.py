@@ -0,0 +1,155 @@
+import itertools
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class ChannelRegistry:
+    """채널 저장소 (devid, VIN, 숫자 채널 ID 해시 인덱스)"""
+
+    def __init__(self, max_channels: int = 100, num_base: int = 1, num_step: int = 1):
+        self.max_channels = max_channels
+        self.lock = threading.RLock()
+        self.channels: Dict[str, object] = {}
+        self.by_devid: Dict[str, object] = {}
+        self.by_vin: Dict[str, object] = {}
+        self.by_num: Dict[int, object] = {}
+        # 여러 프로세스가 채널을 나눠 가질 때 num_base + k * num_step 으로 겹치지 않게 할당
+        self.next_num = num_base
+        self.num_step = num_step
+        # 변경 버전 (채널이 바뀔 때마다 증가, API 델타 응답용)
+        self.versions = itertools.count(1)
+        self.version = 0
+        self.removed = deque(maxlen=1024)  # (버전, 채널 ID)
+        self.expiry = None  # ChannelExpiry (변경 시 만료 시각 예약)
+
+    def __len__(self) -> int:
+        return len(self.channels)
+
+    def __contains__(self, channel_id: str) -> bool:
+        return channel_id in self.channels
+
+    def values(self) -> List[object]:
+        """채널 목록 스냅샷"""
+        with self.lock:
+            return list(self.channels.values())
+
+    def get(self, channel_id: str):
+        """채널 ID로 채널 찾기"""
+        return self.channels.get(channel_id)
+
+    def find_by_devid(self, devid: str):
+        """디바이스 ID로 채널 찾기"""
+        return self.by_devid.get(devid)
+
+    def find_by_vin(self, vin: str):
+        """VIN으로 채널 찾기"""
+        return self.by_vin.get(vin)
+
+    def find_by_num(self, num: int):
+        """숫자 채널 ID로 채널 찾기"""
+        return self.by_num.get(num)
+
+    def touch(self, channel) -> int:
+        """채널 변경 표시, 새 버전 반환 (변경을 모두 반영한 뒤 호출)"""
+        version = next(self.versions)
+        channel.version = version
+        if version > self.version:
+            self.version = version
+        if self.expiry is not None:
+            self.expiry.schedule(channel)
+        return version
+
+    def removed_since(self, version: int) -> Optional[List[str]]:
+        """version 이후 제거된 채널 ID, 기록이 잘려 알 수 없으면 None"""
+        removed = list(self.removed)
+        if len(removed) == self.removed.maxlen and removed[0][0] > version:
+            return None
+        return [channel_id for v, channel_id in removed if v > version]
+
+    def _allocate_num(self) -> int:
+        # C findEmptyChannel 과 같이 1부터 증가하는 ID 할당, 32비트 범위에서 순환
+        while self.next_num in self.by_num or self.next_num == 0:
+            self.next_num = (self.next_num + self.num_step) & 0xFFFFFFFF
+        num = self.next_num
+        self.next_num = (num + self.num_step) & 0xFFFFFFFF
+        return num
+
+    def _index(self, channel):
+        if not channel.num or channel.num in self.by_num:
+            channel.num = self._allocate_num()
+        self.channels[channel.id] = channel
+        self.by_num[channel.num] = channel
+        if channel.devid:
+            self.by_devid[channel.devid] = channel
+        if channel.vin:
+            self.by_vin[channel.vin] = channel
+        self.touch(channel)
+
+    def add(self, channel):
+        """채널 등록 (최대 채널 수 제한 없음, DB 로드용)"""
+        with self.lock:
+            self._index(channel)
+
+    def get_or_create(self, devid: str, factory: Callable[[str], object]) -> Tuple[Optional[object], bool]:
+        """디바이스 ID로 채널을 찾거나 새로 생성, (채널, 생성 여부) 반환"""
+        channel = self.by_devid.get(devid)
+        if channel:
+            return channel, False
+        with self.lock:
+            channel = self.by_devid.get(devid)
+            if channel:
+                return channel, False
+            if len(self.channels) >= self.max_channels:
+                return None, False
+            channel = factory(devid)
+            self._index(channel)
+            return channel, True
+
+    def put(self, channel):
+        """다른 프로세스가 발행한 채널로 교체 (채널 번호/버전 그대로 사용)"""
+        with self.lock:
+            old = self.channels.get(channel.id)
+            if old:
+                self._unindex(old)
+            self.channels[channel.id] = channel
+            self.by_num[channel.num] = channel
+            if channel.devid:
+                self.by_devid[channel.devid] = channel
+            if channel.vin:
+                self.by_vin[channel.vin] = channel
+
+    def set_vin(self, channel, vin: str):
+        """채널 VIN 변경 및 인덱스 갱신"""
+        with self.lock:
+            if channel.vin == vin:
+                return
+            if channel.vin and self.by_vin.get(channel.vin) is channel:
+                del self.by_vin[channel.vin]
+            channel.vin = vin
+            if vin:
+                self.by_vin[vin] = channel
+            self.touch(channel)
+
+    def _unindex(self, channel):
+        if self.by_num.get(channel.num) is channel:
+            del self.by_num[channel.num]
+        if self.by_devid.get(channel.devid) is channel:
+            del self.by_devid[channel.devid]
+        if channel.vin and self.by_vin.get(channel.vin) is channel:
+            del self.by_vin[channel.vin]
+
+    def remove(self, channel_id: str, version: Optional[int] = None):
+        """채널 제거, 제거된 채널 반환 (version: 발행된 제거 버전, 없으면 새 버전)"""
+        with self.lock:
+            channel = self.channels.pop(channel_id, None)
+            if not channel:
+                return None
+            self._unindex(channel)
+            if self.expiry is not None:
+                self.expiry.discard(channel_id)
+            if version is None:
+                version = next(self.versions)
+            self.removed.append((version, channel_id))
+            self.version = max(self.version, version)
+            return channel
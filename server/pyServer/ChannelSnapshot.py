@@ -0,0 +1,223 @@
+import os
+import time
+import struct
+import logging
+import threading
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from Metrics import metrics, DB_BUCKETS
+from SampleBuffer import MAX_PID_DATA_LEN
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b'FMCS'
+SNAPSHOT_REVISION = 1
+# magic, 버전, 채널 수, 저장 시각 (ms)
+_PREAMBLE = struct.Struct('<4sIIq')
+# 채널 고정 필드 (문자열/PID/샘플은 뒤에 가변 길이로 기록)
+_INT_FIELDS = ('num', 'flags', 'device_tick', 'server_data_tick', 'server_ping_tick', 'session_start_tick',
+               'server_sync_tick', 'elapsed_time', 'recv_count', 'tx_count', 'data_received', 'rssi',
+               'device_temp', 'devflags', 'cache_size', 'cmd_count')
+_STR_FIELDS = ('id', 'devid', 'vin', 'ip_addr', 'created_at')
+_FIXED = struct.Struct('<' + 'q' * len(_INT_FIELDS) + 'dqII')  # ... sample_rate, UDP 포트, PID 수, 샘플 수
+_STR = struct.Struct('<H')
+_PID = struct.Struct('<HqH')  # pid, ts, 값 길이
+
+snapshot_saves = metrics.counter('channel_snapshots_written_total', '기록한 채널 상태 스냅샷 수')
+snapshot_errors = metrics.counter('channel_snapshot_errors_total', '채널 상태 스냅샷 저장/로드 실패 수')
+snapshot_latency = metrics.histogram('channel_snapshot_seconds', '채널 상태 스냅샷 저장 시간 (초)', DB_BUCKETS)
+
+
+def _pack_str(text: str) -> bytes:
+    data = (text or '').encode('utf-8')[:0xFFFF]
+    return _STR.pack(len(data)) + data
+
+
+def _value_mask(length: np.ndarray) -> np.ndarray:
+    """샘플별 유효 값 바이트 마스크 (n x MAX_PID_DATA_LEN)"""
+    return np.arange(MAX_PID_DATA_LEN, dtype=np.uint8) < length[:, None]
+
+
+class RecordReader:
+    """바이트 버퍼 순차 읽기"""
+
+    __slots__ = ('data', 'pos')
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def take(self, size: int) -> bytes:
+        end = self.pos + size
+        if end > len(self.data):
+            raise ValueError("채널 레코드가 잘렸습니다")
+        chunk = self.data[self.pos:end]
+        self.pos = end
+        return chunk
+
+    def unpack(self, fmt: struct.Struct) -> tuple:
+        return fmt.unpack(self.take(fmt.size))
+
+    def text(self) -> str:
+        return self.take(self.unpack(_STR)[0]).decode('utf-8', 'replace')
+
+
+def pack_channel(channel, max_samples: Optional[int] = None, versions: bool = False) -> bytes:
+    """채널 상태 레코드 (max_samples: 최근 샘플만 기록, versions: PID 변경 버전 포함)"""
+    data = list(channel.data.items())
+    count, ts, pid, length, values = channel.cache.dump()
+    if max_samples is not None and count > max_samples:
+        skip = count - max_samples
+        count = max_samples
+        ts, pid, length = ts[skip * 8:], pid[skip * 2:], length[skip:]
+        values = values[skip * MAX_PID_DATA_LEN:]
+    peer = channel.udp_peer
+    ints = [int(getattr(channel, name) or 0) for name in _INT_FIELDS]
+    parts = [_FIXED.pack(*ints, float(channel.sample_rate or 0), peer[1] if peer else 0, len(data), count)]
+    parts += [_pack_str(getattr(channel, name)) for name in _STR_FIELDS]
+    parts.append(_pack_str(peer[0] if peer else ''))
+    for pid_num, pid_data in data:
+        value = pid_data.value.encode('utf-8')[:0xFFFF]
+        parts.append(_PID.pack(pid_num, pid_data.ts, len(value)) + value)
+    if count:
+        # 값은 샘플별 길이만큼만 기록 (빈 바이트 제외)
+        lengths = np.frombuffer(length, dtype=np.uint8)
+        packed = np.frombuffer(values, dtype=np.uint8).reshape(count, MAX_PID_DATA_LEN)[_value_mask(lengths)]
+        parts += [ts, pid, length, packed.tobytes()]
+    if versions:
+        parts.append(np.array([pid_data.version for _, pid_data in data], dtype=np.int64).tobytes())
+    return b''.join(parts)
+
+
+def unpack_channel(reader: 'RecordReader', channel_factory, pid_factory, versions: bool = False):
+    """pack_channel 레코드에서 채널 생성"""
+    fixed = reader.unpack(_FIXED)
+    ints = fixed[:len(_INT_FIELDS)]
+    sample_rate, port, pid_count, count = fixed[len(_INT_FIELDS):]
+    texts = {name: reader.text() for name in _STR_FIELDS}
+    host = reader.text()
+    channel = channel_factory(id=texts['id'], devid=texts['devid'],
+                              cache_size=ints[_INT_FIELDS.index('cache_size')])
+    for name, value in zip(_INT_FIELDS, ints):
+        setattr(channel, name, value)
+    for name in ('vin', 'ip_addr', 'created_at'):
+        setattr(channel, name, texts[name])
+    channel.sample_rate = sample_rate
+    channel.udp_peer = (host, port) if host else None
+    pids = []
+    for _ in range(pid_count):
+        pid, ts, length = reader.unpack(_PID)
+        channel.data[pid] = pid_factory(ts=ts, value=reader.take(length).decode('utf-8', 'replace'))
+        pids.append(pid)
+    if count:
+        ts = reader.take(8 * count)
+        pid = reader.take(2 * count)
+        length = reader.take(count)
+        lengths = np.frombuffer(length, dtype=np.uint8)
+        mask = _value_mask(lengths)
+        values = np.zeros((count, MAX_PID_DATA_LEN), dtype=np.uint8)
+        values[mask] = np.frombuffer(reader.take(int(lengths.sum(dtype=np.int64))), dtype=np.uint8)
+        channel.cache.restore(count, ts, pid, length, values.tobytes())
+    if versions:
+        for pid, version in zip(pids, np.frombuffer(reader.take(8 * pid_count), dtype=np.int64).tolist()):
+            channel.data[pid].version = version
+    return channel
+
+
+class ChannelSnapshot:
+    """채널 상태 바이너리 스냅샷 (최신 PID 값과 샘플 버퍼 포함)
+
+    재시작 시 DB 를 기다리지 않고 바로 채널 상태를 복원하기 위해 주기적으로 data_dir 에
+    기록합니다. 임시 파일에 쓴 뒤 os.replace 로 교체하므로 중간에 죽어도 이전 스냅샷이 남습니다.
+    """
+
+    def __init__(self, path: str, interval: float = 60.0):
+        self.path = path
+        self.interval = interval
+        self.get_channels = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self, get_channels: Callable[[], List[object]]):
+        """주기 저장 스레드 시작"""
+        self.get_channels = get_channels
+        if self.interval <= 0:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        logger.info(f"채널 상태 스냅샷 저장 시작 ({self.path}, {self.interval}s)")
+
+    def stop(self):
+        """저장 스레드 중지 후 마지막 상태 저장"""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=30)
+            self.thread = None
+        if self.get_channels:
+            self.save(self.get_channels())
+
+    def _loop(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.save(self.get_channels())
+            except Exception as e:
+                snapshot_errors.inc()
+                logger.error(f"채널 상태 스냅샷 오류: {e}")
+
+    def save(self, channels: List[object]) -> int:
+        """채널 목록 저장, 기록한 바이트 수 반환 (실패 시 0)"""
+        with snapshot_latency.time():
+            records = []
+            for channel in channels:
+                try:
+                    records.append(pack_channel(channel))
+                except (struct.error, OverflowError) as e:
+                    # 기록할 수 없는 값 (범위를 벗어난 PID/ts) 이 있는 채널만 제외
+                    snapshot_errors.inc()
+                    logger.error(f"채널 상태 스냅샷 기록 불가: {channel.devid} ({e})")
+            data = b''.join([_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_REVISION, len(records),
+                                            int(time.time() * 1000))] + records)
+            tmp = f'{self.path}.{os.getpid()}.tmp'
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+            except OSError as e:
+                snapshot_errors.inc()
+                logger.error(f"채널 상태 스냅샷 저장 실패: {self.path} ({e})")
+                return 0
+        snapshot_saves.inc()
+        return len(data)
+
+    def load(self, channel_factory: Callable[..., object], pid_factory: Callable[..., object]) -> List[object]:
+        """스냅샷의 채널 목록 (파일이 없거나 형식이 다르면 빈 목록)"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        except OSError as e:
+            snapshot_errors.inc()
+            logger.error(f"채널 상태 스냅샷 읽기 실패: {self.path} ({e})")
+            return []
+        reader = RecordReader(data)
+        channels = []
+        try:
+            magic, revision, count, saved_at = reader.unpack(_PREAMBLE)
+            if magic != SNAPSHOT_MAGIC or revision != SNAPSHOT_REVISION:
+                raise ValueError(f"지원하지 않는 스냅샷 형식 ({magic!r}, {revision})")
+            for _ in range(count):
+                channels.append(unpack_channel(reader, channel_factory, pid_factory))
+        except (ValueError, struct.error) as e:
+            snapshot_errors.inc()
+            logger.error(f"채널 상태 스냅샷 로드 실패: {self.path} ({e})")
+            return []
+        logger.info(f"채널 상태 스냅샷 로드: {len(channels)}개 채널 "
+                    f"({(time.time() * 1000 - saved_at) / 1000:.0f}초 전 저장)")
+        return channels
@@ -0,0 +1,148 @@
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from Metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# C teleserver.h 와 동일
+MAX_PENDING_COMMANDS = 4
+CMD_FLAG_RESPONDED = 1
+CMD_FLAG_CHECKED = 2
+CMD_FLAG_EXPIRED = 4
+
+commands_issued = metrics.counter('commands_issued_total', '전송된 명령 수')
+commands_acked = metrics.counter('commands_acked_total', 'EV=6 응답을 받은 명령 수')
+commands_retransmitted = metrics.counter('commands_retransmitted_total', '재전송된 명령 수')
+commands_expired = metrics.counter('commands_expired_total', '응답 없이 만료된 명령 수')
+
+
+@dataclass
+class CommandBlock:
+    """대기 명령 (C COMMAND_BLOCK)"""
+    token: int
+    command: str
+    tick: int  # 최초 전송 시각 (ms)
+    sent_tick: int  # 마지막 전송 시각 (ms)
+    retries: int = 0
+    elapsed: int = 0  # 응답까지 걸린 시간 (ms)
+    message: str = ""
+    flags: int = 0
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+
+class CommandTable:
+    """디바이스별 대기 명령 테이블 (토큰으로 EV=6 응답 매칭, 재전송, 만료)"""
+
+    def __init__(self, max_pending: int = MAX_PENDING_COMMANDS, retry_interval: float = 5.0,
+                 max_retries: int = 2, expire: float = 300.0):
+        self.max_pending = max_pending
+        self.retry_interval = int(retry_interval * 1000)
+        self.max_retries = max_retries
+        self.expire = int(expire * 1000)
+        self.lock = threading.Lock()
+        self.blocks: Dict[str, List[CommandBlock]] = {}
+        self.resend: Optional[Callable[[str, CommandBlock], bool]] = None
+        self.thread = None
+        self.running = False
+
+    def issue(self, devid: str, token: int, command: str) -> CommandBlock:
+        """전송된 명령 등록 (빈 슬롯 또는 확인된 슬롯, 없으면 가장 오래된 슬롯 재사용)"""
+        now = int(time.time() * 1000)
+        block = CommandBlock(token=token, command=command, tick=now, sent_tick=now)
+        with self.lock:
+            slots = self.blocks.setdefault(devid, [])
+            for i, old in enumerate(slots):
+                if old.token == token or old.flags & (CMD_FLAG_CHECKED | CMD_FLAG_EXPIRED):
+                    slots[i] = block
+                    break
+            else:
+                if len(slots) < self.max_pending:
+                    slots.append(block)
+                else:
+                    slots[min(range(len(slots)), key=lambda i: slots[i].tick)] = block
+        commands_issued.inc()
+        return block
+
+    def find(self, devid: str, token: int) -> Tuple[int, Optional[CommandBlock]]:
+        """토큰으로 명령 찾기, (슬롯 번호, 명령) 반환"""
+        with self.lock:
+            for i, block in enumerate(self.blocks.get(devid, ())):
+                if block.token == token:
+                    return i, block
+        return -1, None
+
+    def respond(self, devid: str, token: int, message: str) -> bool:
+        """EV=6 응답 기록 및 대기 중인 요청 깨우기"""
+        index, block = self.find(devid, token)
+        if not block:
+            return False
+        if not block.flags & CMD_FLAG_RESPONDED:
+            block.elapsed = int(time.time() * 1000) - block.tick
+            block.message = message
+            block.flags = (block.flags | CMD_FLAG_RESPONDED) & ~CMD_FLAG_EXPIRED
+            commands_acked.inc()
+        block.done.set()
+        return True
+
+    def wait(self, devid: str, token: int, timeout: float) -> Tuple[int, Optional[CommandBlock]]:
+        """응답 또는 만료까지 최대 timeout 초 대기 (long-poll)"""
+        index, block = self.find(devid, token)
+        if block and timeout > 0 and not block.flags & (CMD_FLAG_RESPONDED | CMD_FLAG_EXPIRED):
+            block.done.wait(timeout)
+        return index, block
+
+    def start(self, resend: Callable[[str, CommandBlock], bool]):
+        """재전송/만료 처리 스레드 시작"""
+        self.resend = resend
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def _loop(self):
+        interval = min(max(self.retry_interval / 4000, 0.1), 1.0)
+        while self.running:
+            time.sleep(interval)
+            try:
+                self.service()
+            except Exception as e:
+                logger.error(f"명령 재전송 처리 오류: {e}")
+
+    def service(self, now: Optional[int] = None):
+        """응답 없는 명령 재전송, 재전송 횟수 초과 명령 만료, 오래된 명령 제거"""
+        now = now or int(time.time() * 1000)
+        due = []
+        with self.lock:
+            for devid, slots in list(self.blocks.items()):
+                for block in slots[:]:
+                    if now - block.tick >= self.expire:
+                        slots.remove(block)
+                        block.done.set()
+                        continue
+                    if block.flags & (CMD_FLAG_RESPONDED | CMD_FLAG_EXPIRED):
+                        continue
+                    if now - block.sent_tick < self.retry_interval:
+                        continue
+                    if block.retries >= self.max_retries:
+                        block.flags |= CMD_FLAG_EXPIRED
+                        block.done.set()
+                        commands_expired.inc()
+                        logger.warning(f"명령 응답 없음: {devid} {block.command} (토큰: {block.token})")
+                        continue
+                    block.retries += 1
+                    block.sent_tick = now
+                    due.append((devid, block))
+                if not slots:
+                    del self.blocks[devid]
+        for devid, block in due:
+            if self.resend and self.resend(devid, block):
+                commands_retransmitted.inc()
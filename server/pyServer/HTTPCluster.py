@@ -0,0 +1,146 @@
+import signal
+import socket
+import logging
+import http.client
+import multiprocessing
+from typing import Callable
+
+from flask import Response, jsonify, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.serving import make_server
+
+from ChannelRegistry import ChannelRegistry
+from SharedState import SharedStateWriter, SharedStateReader
+
+logger = logging.getLogger(__name__)
+
+# 전달하지 않는 hop-by-hop 헤더
+HOP_HEADERS = {'connection', 'keep-alive', 'proxy-connection', 'te', 'trailer', 'transfer-encoding', 'upgrade'}
+# 요청/응답 본문 전달 단위
+FORWARD_CHUNK = 64 * 1024
+
+
+class HTTPCluster:
+    """멀티 프로세스 HTTP API 서버
+
+    HTTP 워커 프로세스들이 공개 포트의 리슨 소켓을 공유하고, 조회 요청은 수신 프로세스가
+    발행한 공유 채널 상태(SharedState)로 직접 처리합니다. 채널 상태를 바꾸는 요청은
+    수신 프로세스의 내부 포트(127.0.0.1)로 전달합니다. 수신 프로세스는 UDP 수신, DB 저장 등
+    기존 작업과 내부 포트 처리만 하므로 조회 처리량이 워커 수만큼 늘어납니다.
+    """
+
+    def __init__(self, hub, port: int, workers: int, state_path: str, slot_size: int,
+                 interval: float = 0.1, local: Callable[[], bool] = lambda: False,
+                 forward_timeout: float = 60.0):
+        self.hub = hub
+        self.port = port
+        self.workers = workers
+        self.state_path = state_path
+        self.interval = interval
+        self.local = local  # 워커에서 직접 처리할 요청인지 (요청 컨텍스트에서 호출)
+        self.forward_timeout = forward_timeout
+        self.writer = SharedStateWriter(state_path, hub.config['max_channels'], slot_size, interval)
+        self.context = multiprocessing.get_context('fork')
+        self.processes = []
+        self.listener = None
+        self.internal = None
+
+    def start(self) -> bool:
+        """공유 상태 파일과 소켓을 만들고 워커 프로세스 시작 (다른 스레드보다 먼저 호출)"""
+        try:
+            self.writer.create()
+            # 내부 포트는 워커가 전달한 요청만 받으므로 X-Forwarded-For 를 신뢰
+            self.internal = make_server('127.0.0.1', 0, ProxyFix(self.hub.app, x_for=1), threaded=True)
+            self.listener = socket.create_server(('0.0.0.0', self.port), backlog=socket.SOMAXCONN)
+            for index in range(self.workers):
+                process = self.context.Process(target=self._worker_main, args=(index,),
+                                               name=f"http-worker-{index}", daemon=True)
+                process.start()
+                self.processes.append(process)
+        except Exception as e:
+            logger.error(f"HTTP 워커 시작 실패: {e}")
+            self.stop()
+            return False
+        logger.info(f"HTTP 워커 {self.workers}개가 포트 {self.port}에서 시작되었습니다. "
+                    f"(내부 포트 {self.internal.server_port})")
+        return True
+
+    def serve(self):
+        """채널 상태 발행을 시작하고 수신 프로세스의 내부 포트 처리 (종료될 때까지 대기)"""
+        self.writer.start(self.hub.channels)
+        self.internal.serve_forever()
+
+    def stop(self):
+        """워커 프로세스 중지"""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join(timeout=5)
+        self.processes = []
+        self.writer.stop()
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+        if self.internal:
+            self.internal.server_close()
+            self.internal = None
+        logger.info("HTTP 워커가 중지되었습니다.")
+
+    # 워커 프로세스
+
+    def _worker_main(self, index):
+        """워커 프로세스 메인 (fork 로 앱을 물려받고, 채널 상태는 공유 상태에서 읽음)"""
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        hub = self.hub
+        registry = ChannelRegistry(hub.config['max_channels'])
+        hub.channels = registry
+        hub.channel_lock = registry.lock
+        reader = SharedStateReader(self.state_path, self.interval)
+        reader.open()
+        reader.start(registry, hub.ChannelData, hub.PIDData)
+        hub.app.before_request(self._forward)
+        server = make_server('0.0.0.0', self.port, hub.app, threaded=True, fd=self.listener.fileno())
+        logger.info(f"HTTP 워커 {index} 시작 (채널 {len(registry)}개)")
+        server.serve_forever()
+
+    def _forward(self):
+        """직접 처리하지 않는 요청은 수신 프로세스로 전달하고 응답을 그대로 스트리밍
+
+        요청 본문도 워커 메모리에 모으지 않고 그대로 흘려 보냅니다 (길이를 모르면 chunked 전송).
+        /api/upload 의 압축 해제 크기 제한은 수신 프로세스가 읽으면서 적용합니다.
+        """
+        if self.local():
+            return None
+        headers = {name: value for name, value in request.headers.items()
+                   if name.lower() not in HOP_HEADERS and name.lower() not in ('host', 'content-length')}
+        headers['X-Forwarded-For'] = request.remote_addr or ''
+        body = None
+        if request.content_length:
+            headers['Content-Length'] = str(request.content_length)
+            body = request.stream
+        elif request.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            stream = request.stream
+            body = iter(lambda: stream.read(FORWARD_CHUNK), b'')
+        conn = http.client.HTTPConnection('127.0.0.1', self.internal.server_port, timeout=self.forward_timeout,
+                                          blocksize=FORWARD_CHUNK)
+        try:
+            conn.request(request.method, request.full_path, body, headers)
+            upstream = conn.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            logger.error(f"요청 전달 실패: {request.path} ({e})")
+            return jsonify({'result': 'failed', 'error': 'Upstream unavailable'}), 502
+
+        def generate():
+            try:
+                while True:
+                    chunk = upstream.read1(FORWARD_CHUNK)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                conn.close()
+
+        response_headers = [(name, value) for name, value in upstream.getheaders()
+                            if name.lower() not in HOP_HEADERS]
+        return Response(generate(), status=upstream.status, headers=response_headers)
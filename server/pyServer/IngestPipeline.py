@@ -0,0 +1,117 @@
+import time
+import logging
+import threading
+from collections import deque
+from typing import Callable, List
+
+from Metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 대기열이 가득 찼을 때 정책
+POLICY_BLOCK = 'block'  # 자리가 날 때까지 수신 스레드 대기 (block_timeout 초과 시 새 항목 폐기)
+POLICY_DROP_NEWEST = 'drop_newest'  # 새 항목 폐기
+POLICY_DROP_OLDEST = 'drop_oldest'  # 가장 오래된 항목 폐기 후 추가
+POLICIES = (POLICY_BLOCK, POLICY_DROP_NEWEST, POLICY_DROP_OLDEST)
+
+# 작업 스레드가 한 번에 꺼내는 최대 항목 수
+TAKE_BATCH = 256
+
+pipeline_blocked = metrics.counter('ingest_blocked_seconds_total', '처리 대기열이 가득 차 수신 스레드가 대기한 시간 (초)')
+pipeline_errors = metrics.counter('ingest_errors_total', '처리 단계에서 예외가 발생한 항목 수')
+
+
+class _Shard:
+    __slots__ = ('items', 'cond', 'thread')
+
+    def __init__(self):
+        self.items = deque()
+        self.cond = threading.Condition(threading.Lock())
+        self.thread = None
+
+
+class IngestPipeline:
+    """키(디바이스)별 순서를 유지하는 샤드 작업 스레드 풀
+
+    같은 키는 항상 같은 샤드에 들어가므로 디바이스별 처리 순서가 유지되고, 다른 디바이스는
+    다른 샤드에서 동시에 처리됩니다. 샤드 대기열은 capacity 로 제한되며 가득 차면 policy 에
+    따라 수신 스레드를 기다리게 하거나 항목을 버립니다.
+    """
+
+    def __init__(self, handler: Callable, workers: int = 4, capacity: int = 10000,
+                 policy: str = POLICY_DROP_NEWEST, block_timeout: float = 1.0, name: str = 'ingest'):
+        if policy not in POLICIES:
+            raise ValueError(f"알 수 없는 대기열 정책: {policy}")
+        self.handler = handler
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.name = name
+        self.shards = [_Shard() for _ in range(max(int(workers), 1))]
+        self.capacity = max(int(capacity) // len(self.shards), 1)  # 샤드별 최대 대기 항목 수
+        self.running = False
+
+    def start(self):
+        """작업 스레드 시작"""
+        self.running = True
+        for index, shard in enumerate(self.shards):
+            shard.thread = threading.Thread(target=self._run, args=(shard,), daemon=True,
+                                            name=f"{self.name}-{index}")
+            shard.thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """대기 중인 항목을 모두 처리한 뒤 작업 스레드 종료"""
+        self.running = False
+        for shard in self.shards:
+            with shard.cond:
+                shard.cond.notify_all()
+        for shard in self.shards:
+            if shard.thread:
+                shard.thread.join(timeout=timeout)
+                shard.thread = None
+
+    def submit(self, key, *item) -> int:
+        """key 의 샤드 대기열에 항목 추가, 정책에 따라 버린 항목 수 반환 (0 또는 1)"""
+        shard = self.shards[hash(key) % len(self.shards)]
+        with shard.cond:
+            items = shard.items
+            dropped = 0
+            if len(items) >= self.capacity:
+                if self.policy == POLICY_DROP_OLDEST:
+                    items.popleft()
+                    dropped = 1
+                elif self.policy == POLICY_BLOCK and self.running:
+                    started = time.perf_counter()
+                    shard.cond.wait_for(lambda: len(items) < self.capacity, self.block_timeout)
+                    pipeline_blocked.inc(time.perf_counter() - started)
+                    if len(items) >= self.capacity:
+                        return 1
+                else:
+                    return 1
+            items.append(item)
+            shard.cond.notify_all()
+        return dropped
+
+    def depths(self) -> List[int]:
+        """샤드별 대기 항목 수"""
+        return [len(shard.items) for shard in self.shards]
+
+    def __len__(self) -> int:
+        return sum(self.depths())
+
+    def _run(self, shard: _Shard):
+        items = shard.items
+        while True:
+            with shard.cond:
+                while not items and self.running:
+                    shard.cond.wait()
+                if not items:
+                    return
+                batch = [items.popleft() for _ in range(min(len(items), TAKE_BATCH))]
+                # 자리가 생겼으므로 대기 중인 수신 스레드 깨움
+                shard.cond.notify_all()
+            for item in batch:
+                try:
+                    self.handler(*item)
+                except Exception as e:
+                    pipeline_errors.inc()
+                    logger.error(f"{self.name} 처리 오류: {e}")
@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from typing import Dict, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 패킷 단위 로그 (수신/파싱/응답) 전용 로거
+PACKET_LOGGER = 'packet'
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """포맷하지 않고 레코드를 큐에 넣는 핸들러 (큐가 가득 차면 버림)"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 메시지 포맷은 기록 스레드에서 수행, 예외 정보만 문자열로 변환
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """큐 기반 비동기 로깅 (파일/콘솔 기록은 백그라운드 스레드에서 수행)"""
+
+    def __init__(self, log_file: Optional[str] = 'teleserver.log', level: str = 'INFO',
+                 levels: str = '', queue_size: int = 10000, console: bool = True):
+        self.log_file = log_file
+        self.level = level
+        self.levels = parse_levels(levels)
+        self.queue_size = queue_size
+        self.console = console
+        self.handler = None
+        self.listener = None
+
+    def start(self):
+        """루트 로거를 큐 핸들러로 교체하고 기록 스레드 시작"""
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = []
+        if self.log_file:
+            handlers.append(logging.FileHandler(self.log_file))
+        if self.console:
+            handlers.append(logging.StreamHandler(sys.stderr))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        self.handler = _QueueHandler(queue.Queue(self.queue_size))
+        self.listener = logging.handlers.QueueListener(self.handler.queue, *handlers,
+                                                       respect_handler_level=True)
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(_level(self.level))
+        for name, level in self.levels.items():
+            logging.getLogger(name).setLevel(level)
+
+        self.listener.start()
+        atexit.register(self.stop)
+        # fork 된 자식 프로세스(UDP 워커)는 기록 스레드를 새로 시작
+        os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def stop(self):
+        """남은 로그를 모두 기록하고 기록 스레드 종료"""
+        if self.listener and self.listener._thread:
+            self.listener.stop()
+
+    def _restart_in_child(self):
+        if not self.listener:
+            return
+        self.handler.queue = queue.Queue(self.queue_size)
+        self.listener = logging.handlers.QueueListener(self.handler.queue, *self.listener.handlers,
+                                                       respect_handler_level=True)
+        self.listener.start()
+
+    @property
+    def dropped(self) -> int:
+        """큐가 가득 차서 버려진 로그 수"""
+        return self.handler.dropped if self.handler else 0
+
+
+class PacketSampler:
+    """채널별 패킷 로그 샘플링 (구간마다 처음 N개만 기록, 나머지는 요약)"""
+
+    def __init__(self, logger: logging.Logger, per_interval: int = 5, interval: float = 10.0):
+        self.logger = logger
+        self.per_interval = per_interval
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.windows: Dict[str, list] = {}  # 키 -> [구간 시작, 기록 수, 생략 수]
+
+    def log(self, key: str, msg: str, *args):
+        """키(채널) 별로 샘플링하여 INFO 로그 기록, 포맷은 기록 스레드에서 수행"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        if self.per_interval <= 0:
+            self.logger.info(msg, *args)
+            return
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None:
+                window = self.windows[key] = [now, 0, 0]
+            elif now - window[0] >= self.interval:
+                if window[2]:
+                    self.logger.info("[%s] 패킷 로그 %d건 생략 (최근 %.0f초)", key, window[2], now - window[0])
+                window[0], window[1], window[2] = now, 0, 0
+            if window[1] >= self.per_interval:
+                window[2] += 1
+                return
+            window[1] += 1
+        self.logger.info(msg, *args)
+
+    def summarize(self):
+        """생략된 로그가 있는 채널의 요약 기록 (주기적 호출)"""
+        now = time.monotonic()
+        with self.lock:
+            for key, window in list(self.windows.items()):
+                if now - window[0] < self.interval:
+                    continue
+                if window[2]:
+                    self.logger.info("[%s] 패킷 로그 %d건 생략 (최근 %.0f초)", key, window[2], now - window[0])
+                    window[0], window[1], window[2] = now, 0, 0
+                else:
+                    # 조용한 채널은 상태 제거
+                    del self.windows[key]
+
+
+def _level(name: str) -> int:
+    level = logging.getLevelName(name.strip().upper())
+    return level if isinstance(level, int) else logging.INFO
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """'UDPServer=WARNING,packet=INFO' 형식의 서브시스템별 로그 레벨"""
+    levels = {}
+    for item in spec.split(','):
+        name, sep, level = item.partition('=')
+        if sep and name.strip():
+            levels[name.strip()] = _level(level)
+    return levels
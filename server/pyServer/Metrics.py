@@ -0,0 +1,212 @@
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Optional[Dict[str, object]]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+class Counter:
+    """단조 증가 카운터 (락 없이 증가, GIL 하에서 값 손실 무시 가능)"""
+
+    __slots__ = ('name', 'help', 'value')
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    """누적 버킷 히스토그램"""
+
+    __slots__ = ('name', 'help', 'buckets', 'counts', 'sum')
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # 마지막은 +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def time(self):
+        """with 블록 실행 시간 기록"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class TimedLock:
+    """락 대기 시간을 측정하는 락 래퍼 (경합이 없으면 시간 측정 없이 획득)"""
+
+    def __init__(self, lock, acquisitions: Counter, contended: Counter, wait: Counter):
+        self.lock = lock
+        self.acquisitions = acquisitions
+        self.contended = contended
+        self.wait = wait
+
+    def acquire(self, blocking=True, timeout=-1):
+        self.acquisitions.value += 1
+        if self.lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        self.contended.value += 1
+        start = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        self.wait.value += time.perf_counter() - start
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+
+class MetricsRegistry:
+    """Prometheus 텍스트 형식 메트릭 저장소"""
+
+    def __init__(self, prefix: str = 'teleserver'):
+        self.prefix = prefix
+        self.counters: Dict[str, Counter] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.collectors: List[Callable[[], List[tuple]]] = []
+        self.remote: Dict[object, dict] = {}  # 워커 프로세스별 스냅샷
+        self.lock = threading.Lock()
+
+    def counter(self, name: str, help: str) -> Counter:
+        name = f"{self.prefix}_{name}"
+        if name not in self.counters:
+            self.counters[name] = Counter(name, help)
+        return self.counters[name]
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...]) -> Histogram:
+        name = f"{self.prefix}_{name}"
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(name, help, buckets)
+        return self.histograms[name]
+
+    def timed_lock(self, lock, name: str) -> TimedLock:
+        """락 획득 횟수, 경합 횟수, 대기 시간 카운터가 붙은 락"""
+        return TimedLock(lock,
+                         self.counter(f"{name}_acquisitions_total", f"{name} 획득 횟수"),
+                         self.counter(f"{name}_contended_total", f"{name} 대기가 필요했던 획득 횟수"),
+                         self.counter(f"{name}_wait_seconds_total", f"{name} 대기 시간 합계 (초)"))
+
+    def register_collector(self, collector: Callable[[], List[tuple]]):
+        """조회 시점에 계산하는 게이지 등록, collector 는 (이름, 설명, [(라벨, 값)]) 목록 반환"""
+        self.collectors.append(collector)
+
+    def reset(self):
+        """모든 카운터/히스토그램 초기화 (fork 된 워커 프로세스에서 호출)"""
+        for counter in self.counters.values():
+            counter.value = 0
+        for histogram in self.histograms.values():
+            histogram.counts = [0] * len(histogram.counts)
+            histogram.sum = 0.0
+        with self.lock:
+            self.remote.clear()
+
+    def snapshot(self) -> dict:
+        """카운터/히스토그램 현재 값 (워커 -> 코디네이터 전달용)"""
+        return {
+            'counters': {name: c.value for name, c in self.counters.items()},
+            'histograms': {name: (list(h.counts), h.sum) for name, h in self.histograms.items()},
+        }
+
+    def merge_remote(self, source, snapshot: dict):
+        """워커 프로세스의 스냅샷 저장 (조회 시 합산)"""
+        with self.lock:
+            self.remote[source] = snapshot
+
+    def render(self) -> str:
+        """Prometheus 텍스트 노출 형식"""
+        with self.lock:
+            remotes = list(self.remote.values())
+        lines = []
+        for name, counter in self.counters.items():
+            value = counter.value + sum(r['counters'].get(name, 0) for r in remotes)
+            lines.append(f"# HELP {name} {counter.help}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+        for name, histogram in self.histograms.items():
+            counts = list(histogram.counts)
+            total_sum = histogram.sum
+            for remote in remotes:
+                remote_counts, remote_sum = remote['histograms'].get(name, (None, 0.0))
+                if remote_counts and len(remote_counts) == len(counts):
+                    counts = [a + b for a, b in zip(counts, remote_counts)]
+                    total_sum += remote_sum
+            lines.append(f"# HELP {name} {histogram.help}")
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{name}_bucket{{le="+Inf"}} {cumulative}')
+            lines.append(f"{name}_sum {total_sum}")
+            lines.append(f"{name}_count {cumulative}")
+        for collector in self.collectors:
+            for name, help, samples in collector():
+                name = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def udp_socket_drops(port: int) -> Optional[int]:
+    """포트에 바인드된 UDP 소켓의 커널 수신 버퍼 초과 폐기 수 합계 (Linux /proc/net/udp)"""
+    total = None
+    for path in ('/proc/net/udp', '/proc/net/udp6'):
+        try:
+            with open(path) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if int(fields[1].rsplit(':', 1)[1], 16) == port:
+                        total = (total or 0) + int(fields[-1])
+        except (OSError, StopIteration, IndexError, ValueError):
+            continue
+    return total
+
+
+# 프로세스 전역 메트릭 저장소
+metrics = MetricsRegistry()
+
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+DB_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
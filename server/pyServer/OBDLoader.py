@@ -0,0 +1,183 @@
+import io
+import time
+import datetime
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MASTER_TABLE = 'cavbase.tbl_obd_data_master'
+DETAIL_TABLE = 'cavbase.tbl_obd_data'
+MASTER_SEQUENCE = 'cavbase.seq_obd_data_mst_id'
+
+# 1 = 자동(OBD 설정), 2 = 조회(특정 PID요청)
+GATR_SCN_AUTO = 1
+SVC_MODE_NO = 1
+
+
+def copy_text(value: str) -> str:
+    """COPY TEXT 포맷용 문자열 이스케이프"""
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_bytea(value: bytes) -> str:
+    """COPY TEXT 포맷용 bytea 값 (hex 포맷)"""
+    return '\\\\x' + value.hex()
+
+
+class OBDLoader:
+    """cavbase OBD 테이블 일괄 적재 (COPY 사용)"""
+
+    def __init__(self, engine, batch_size: int = 5000, flush_interval: float = 1.0,
+                 max_pending: int = 200000):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending: List[Tuple[tuple, list]] = []
+        self.pending_rows = 0
+        self.lock = threading.Lock()
+        self.flush_event = threading.Event()
+        self.thread = None
+        self.running = False
+        self.enabled = False
+
+    def start(self) -> Optional[bool]:
+        """적재 스레드 시작 (cavbase 테이블이 없으면 비활성화), DB 에 연결할 수 없으면 None"""
+        tables = self._check_tables()
+        if tables is None:
+            return None
+        if not tables:
+            logger.warning("cavbase OBD 테이블이 없어 OBD 데이터 적재를 사용하지 않습니다.")
+            return False
+        self.enabled = True
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        logger.info(f"OBD 데이터 적재 시작 (batch={self.batch_size}, interval={self.flush_interval}s)")
+        return True
+
+    def stop(self):
+        """적재 스레드 중지 (남은 데이터 적재)"""
+        self.running = False
+        self.flush_event.set()
+        if self.thread:
+            self.thread.join(timeout=10)
+            self.thread = None
+        if self.enabled:
+            self.flush()
+
+    def _check_tables(self) -> Optional[bool]:
+        try:
+            conn = self.engine.raw_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT to_regclass(%s), to_regclass(%s)", (MASTER_TABLE, DETAIL_TABLE))
+                master, detail = cur.fetchone()
+                return master is not None and detail is not None
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.error(f"OBD 테이블 확인 실패: {e}")
+            return None
+
+    def add(self, vin: str, samples):
+        """페이로드의 타임스탬프 그룹마다 master 1행 + PID별 상세 행으로 버퍼에 추가
+
+        (data_id, svc_mode_no, pid_dec) 가 기본키이므로 그룹 안에서 같은 PID 가 다시 나오면
+        새 master 행으로 나눕니다. master 의 data_gatr_expl 에는 그룹의 `0:ts,...` 를 기록합니다.
+        """
+        if not self.enabled or not samples:
+            return
+        vin = (vin or '')[:17]
+        now = datetime.datetime.now()
+        groups = []
+        group_ts = None
+        details = {}
+        for ts, pid, value in samples:
+            if ts != group_ts or pid in details:
+                if details:
+                    groups.append((group_ts, details))
+                group_ts = ts
+                details = {}
+            details[pid] = value
+        if details:
+            groups.append((group_ts, details))
+        rows = 0
+        entries = []
+        for ts, details in groups:
+            items = ','.join(f'{pid:X}:{value}' for pid, value in details.items())
+            entries.append(((vin, f'0:{ts},{items}', now), list(details.items())))
+            rows += 1 + len(details)
+        with self.lock:
+            if self.pending_rows + rows > self.max_pending:
+                logger.error("OBD 데이터 적재 버퍼 초과, 데이터 폐기")
+                return
+            self.pending.extend(entries)
+            self.pending_rows += rows
+            if self.pending_rows >= self.batch_size:
+                self.flush_event.set()
+
+    def _loop(self):
+        while self.running:
+            self.flush_event.wait(self.flush_interval)
+            self.flush_event.clear()
+            self.flush()
+
+    def flush(self):
+        """버퍼의 데이터를 COPY 로 적재"""
+        with self.lock:
+            if not self.pending:
+                return
+            batch = self.pending
+            rows = self.pending_rows
+            self.pending = []
+            self.pending_rows = 0
+
+        start = time.time()
+        try:
+            self._copy(batch)
+        except Exception as e:
+            logger.error(f"OBD 데이터 적재 실패: {e}")
+            with self.lock:
+                # 버퍼 한도 내에서 재시도
+                if self.pending_rows + rows <= self.max_pending:
+                    self.pending = batch + self.pending
+                    self.pending_rows += rows
+                else:
+                    logger.error(f"OBD 데이터 {rows}행 폐기")
+            return
+        logger.debug(f"OBD 데이터 {len(batch)}건 ({rows}행) 적재: {(time.time() - start) * 1000:.1f}ms")
+
+    def _copy(self, batch):
+        conn = self.engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            # master 행의 data_id 를 시퀀스에서 한번에 할당
+            cur.execute(f"SELECT nextval('{MASTER_SEQUENCE}') FROM generate_series(1, %s)", (len(batch),))
+            data_ids = [row[0] for row in cur.fetchall()]
+
+            master_buf = io.StringIO()
+            detail_buf = io.StringIO()
+            for data_id, (master, details) in zip(data_ids, batch):
+                vin, payload, rgst_dtm = master
+                dtm = rgst_dtm.isoformat(' ')
+                master_buf.write(f"{data_id}\t{GATR_SCN_AUTO}\t{copy_text(vin)}\t{copy_text(payload)}\t{dtm}\n")
+                for pid, value in details:
+                    pid_hex = copy_bytea(format(pid, 'x').encode())
+                    detail_buf.write(f"{data_id}\t{SVC_MODE_NO}\t{pid}\t{pid_hex}\t{copy_text(value)}\t{dtm}\n")
+            master_buf.seek(0)
+            detail_buf.seek(0)
+
+            cur.copy_expert(f"COPY {MASTER_TABLE} (data_id, gatr_scn, vin, data_gatr_expl, rgst_dtm) FROM STDIN",
+                            master_buf)
+            cur.copy_expert(f"COPY {DETAIL_TABLE} (data_id, svc_mode_no, pid_dec, pid_hex, obd_data, rgst_dtm) FROM STDIN",
+                            detail_buf)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
@@ -0,0 +1,61 @@
+from collections import deque
+
+# check() 결과
+PACKET_NEW = 0
+PACKET_DUPLICATE = 1
+PACKET_LATE = 2
+
+
+def payload_tick(data: str) -> int:
+    """페이로드 첫 타임스탬프 (`0:ts`), 파싱 전에 확인하므로 앞부분만 봄 (없으면 0)"""
+    if not data.startswith('0:'):
+        return 0
+    end = data.find(',', 2)
+    try:
+        return int(data[2:end if end > 0 else len(data)])
+    except ValueError:
+        return 0
+
+
+class PacketWindow:
+    """채널별 최근 데이터그램 창 (디바이스 ts, 내용 해시)
+
+    최근 size 개 데이터그램의 키를 기억해 재전송된 같은 데이터그램을 파싱 전에 걸러냅니다.
+    지금까지 받은 가장 큰 ts 보다 이전이지만 reorder ms 이내인 데이터그램은 늦게 도착한
+    것으로 보고, 그보다 많이 되돌아간 ts 는 디바이스 리셋으로 보고 창을 비웁니다.
+    """
+
+    __slots__ = ('size', 'reorder', 'keys', 'order', 'high')
+
+    def __init__(self, size: int = 64, reorder: int = 60000):
+        self.size = size
+        self.reorder = reorder
+        self.keys = set()
+        self.order = deque()
+        self.high = 0  # 받은 가장 큰 디바이스 ts
+
+    def check(self, tick: int, data: str) -> int:
+        """데이터그램 분류, 중복이 아니면 창에 추가"""
+        key = (tick, hash(data))
+        if key in self.keys:
+            return PACKET_DUPLICATE
+        result = PACKET_NEW
+        if tick:
+            if tick >= self.high:
+                self.high = tick
+            elif self.high - tick <= self.reorder:
+                result = PACKET_LATE
+            else:
+                # 디바이스 리셋 (ts 가 크게 되돌아감)
+                self.reset()
+                self.high = tick
+        self.keys.add(key)
+        self.order.append(key)
+        if len(self.order) > self.size:
+            self.keys.discard(self.order.popleft())
+        return result
+
+    def reset(self):
+        self.keys.clear()
+        self.order.clear()
+        self.high = 0
@@ -0,0 +1,120 @@
+import re
+from typing import Dict, List
+
+# PID:값 또는 PID=값 항목 (C hex2uint16 과 같이 최대 4자리 16진수 PID)
+_ITEM = re.compile(r'(?:^|,)([0-9A-Fa-f]{1,4})[:=]([^,]*)')
+
+# 유효한 PID 문자열 (int(x, 16) 은 부호, 공백, _ 도 허용하므로 따로 확인)
+_PID = re.compile(r'[0-9A-Fa-f]{1,4}')
+
+# 16진수 PID 문자열 -> 정수 캐시 (int(x, 16) 반복 방지)
+_PID_CACHE: Dict[str, int] = {}
+_PID_CACHE_SIZE = 4096
+
+
+def decode_value(value: str):
+    """PID 값을 숫자로 변환, 다중 값(x;y;z)은 튜플, 숫자가 아니면 None"""
+    try:
+        if ';' in value:
+            return tuple(float(v) if '.' in v else int(v) for v in value.split(';'))
+        return float(value) if '.' in value else int(value)
+    except ValueError:
+        return None
+
+
+class ParseResult:
+    """페이로드 파싱 결과 (ts, pid, value 병렬 리스트)"""
+
+    __slots__ = ('ts', 'pid', 'value', 'last_ts', '_numbers')
+
+    def __init__(self):
+        self.ts: List[int] = []
+        self.pid: List[int] = []
+        self.value: List[str] = []
+        self.last_ts = 0
+        self._numbers = None
+
+    def __len__(self) -> int:
+        return len(self.pid)
+
+    def __iter__(self):
+        """(ts, pid, value) 레코드"""
+        return zip(self.ts, self.pid, self.value)
+
+    def number(self, index: int):
+        """index 번째 값의 숫자 변환 (처음 요청 시 변환)"""
+        if self._numbers is None:
+            self._numbers = [None] * len(self.value)
+        n = self._numbers[index]
+        if n is None:
+            n = self._numbers[index] = decode_value(self.value[index])
+        return n
+
+    def latest(self) -> Dict[int, int]:
+        """PID별 마지막 값의 인덱스"""
+        return {pid: i for i, pid in enumerate(self.pid)}
+
+
+def _pid_values(pid_strs) -> List[int]:
+    try:
+        return list(map(_PID_CACHE.__getitem__, pid_strs))
+    except KeyError:
+        if not all(map(_PID.fullmatch, pid_strs)):
+            raise ValueError('invalid PID')
+        pids = [int(p, 16) for p in pid_strs]
+        if len(_PID_CACHE) < _PID_CACHE_SIZE:
+            _PID_CACHE.update(zip(pid_strs, pids))
+        return pids
+
+
+def _split_items(payload: str):
+    """(PID 문자열, 값) 분리, 모든 항목이 PID:값 형식이면 split 만으로 처리"""
+    flat = payload.replace('=', ':').replace(',', ':').split(':')
+    if len(flat) == 2 * (payload.count(',') + 1):
+        pid_strs = flat[0::2]
+        try:
+            pids = _pid_values(pid_strs)
+            return pids, flat[1::2]
+        except ValueError:
+            pass
+    # 형식이 맞지 않는 항목이 있으면 정규식으로 유효한 항목만 추출
+    pairs = _ITEM.findall(payload)
+    if not pairs:
+        return [], []
+    pid_strs, values = zip(*pairs)
+    return _pid_values(pid_strs), values
+
+
+def parse_payload(payload: str) -> ParseResult:
+    """Freematics 페이로드 파싱
+
+    `0:ts` 항목마다 새 타임스탬프 그룹이 시작되며, 첫 타임스탬프 이전 항목은 무시합니다.
+    항목 분리와 PID 변환, 그룹 단위 복사가 모두 C 레벨(split, map, slice)에서 수행됩니다.
+    """
+    result = ParseResult()
+    pids, values = _split_items(payload)
+    ts_list = result.ts
+    pid_list = result.pid
+    value_list = result.value
+    count = len(pids)
+    ts = 0
+    try:
+        start = pids.index(0)
+    except ValueError:
+        return result
+    while start < count:
+        try:
+            end = pids.index(0, start + 1)
+        except ValueError:
+            end = count
+        try:
+            ts = int(values[start])
+        except ValueError:
+            pass
+        if ts and end > start + 1:
+            ts_list.extend([ts] * (end - start - 1))
+            pid_list.extend(pids[start + 1:end])
+            value_list.extend(values[start + 1:end])
+        start = end
+    result.last_ts = ts
+    return result
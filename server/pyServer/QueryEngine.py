@@ -0,0 +1,165 @@
+import datetime
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from Metrics import metrics, DB_BUCKETS
+from TripIndex import trip_file, number_array
+
+logger = logging.getLogger(__name__)
+
+AGGREGATES = ('min', 'max', 'avg', 'sum', 'count', 'first', 'last')
+
+query_latency = metrics.histogram('query_seconds', '/api/query 집계 시간 (초)', DB_BUCKETS)
+query_samples = metrics.counter('query_samples_total', '/api/query 에서 집계한 샘플 수')
+
+
+def utc_datetime(ms: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(ms / 1000, datetime.timezone.utc).replace(tzinfo=None)
+
+
+def parse_aggregates(text: str) -> Optional[List[str]]:
+    """'min,max,p95' -> 집계 목록, 알 수 없는 집계가 있으면 None"""
+    aggs = [a.strip().lower() for a in text.split(',') if a.strip()] or ['avg']
+    for agg in aggs:
+        if agg in AGGREGATES or agg == 'median':
+            continue
+        if agg[0] == 'p' and agg[1:].replace('.', '', 1).isdigit() and 0 <= float(agg[1:]) <= 100:
+            continue
+        return None
+    return aggs
+
+
+def select(ts: np.ndarray, values: np.ndarray, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """숫자 값만 (다중 값은 dim 번째 값)"""
+    if values.ndim > 1:
+        values = values[:, dim] if dim < values.shape[1] else np.full(len(values), np.nan)
+    values = values.astype(np.float64)
+    mask = ~np.isnan(values)
+    return ts[mask], values[mask]
+
+
+def aggregate(ts: np.ndarray, values: np.ndarray, start: int, bucket: int,
+              aggs: List[str]) -> List[list]:
+    """시간 구간별 집계 [[구간 시작, 집계1, 집계2, ...], ...] (빈 구간 제외)
+
+    구간 번호와 값으로 한 번 정렬한 뒤 reduceat 과 순위 인덱스로 모든 집계를 계산합니다.
+    """
+    if not len(ts):
+        return []
+    if len(ts) > 1 and (np.diff(ts) < 0).any():
+        # 시간순 정렬 (트립 파일 순서대로면 이미 정렬되어 있음)
+        order = np.argsort(ts, kind='stable')
+        ts, values = ts[order], values[order]
+    slots = (ts - start) // bucket
+    starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+    ends = np.r_[starts[1:], len(slots)]
+    counts = ends - starts
+    columns = [start + slots[starts] * bucket]
+    sorted_values = None
+    for agg in aggs:
+        if agg == 'min':
+            columns.append(np.minimum.reduceat(values, starts))
+        elif agg == 'max':
+            columns.append(np.maximum.reduceat(values, starts))
+        elif agg == 'sum':
+            columns.append(np.add.reduceat(values, starts))
+        elif agg == 'avg':
+            columns.append(np.add.reduceat(values, starts) / counts)
+        elif agg == 'count':
+            columns.append(counts)
+        elif agg == 'first':
+            columns.append(values[starts])
+        elif agg == 'last':
+            columns.append(values[ends - 1])
+        else:
+            if sorted_values is None:
+                # 구간 안에서 값 순서로 정렬 (구간 경계는 그대로)
+                sorted_values = values[np.lexsort((values, slots))]
+            q = 0.5 if agg == 'median' else float(agg[1:]) / 100
+            rank = (counts - 1) * q
+            lo = np.floor(rank).astype(np.int64)
+            hi = np.ceil(rank).astype(np.int64)
+            low = sorted_values[starts + lo]
+            high = sorted_values[starts + hi]
+            columns.append(low + (high - low) * (rank - lo))
+    rows = np.column_stack(columns)
+    return [[int(row[0])] + [round(v, 4) for v in row[1:]] for row in rows.tolist()]
+
+
+class QueryEngine:
+    """PID 시간 구간 집계 (/api/query), 채널 메모리 버퍼 또는 트립 파일/아카이브에서 읽음"""
+
+    def __init__(self, trip_index, max_points: int = 500):
+        self.trip_index = trip_index
+        self.max_points = max_points
+
+    def bucket_size(self, start: int, end: int, bucket: int) -> int:
+        """구간 크기 (ms), 구간 수가 max_points 를 넘지 않도록 조정"""
+        minimum = -(-(end - start) // self.max_points)
+        return max(bucket, minimum, 1)
+
+    def buffer_samples(self, channel, pid: int, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+        """채널 링 버퍼 샘플 (서버 시각 ms 로 변환)"""
+        samples, _ = channel.cache.read(pid=pid)
+        if not samples:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        ts = np.array([s[0] for s in samples], dtype=np.int64)
+        # 마지막 수신 시각의 디바이스 ts 를 기준으로 서버 시각 계산
+        wall = channel.server_data_tick - (channel.device_tick - ts)
+        return select(wall, number_array([s[2] for s in samples]), dim)
+
+    def trip_samples(self, devid: str, pid: int, start: int, end: int,
+                     dim: int) -> Tuple[np.ndarray, np.ndarray]:
+        """기간과 겹치는 트립의 샘플 (트립 시작 시각 + 디바이스 ts 경과, ms)"""
+        begin = utc_datetime(start) - datetime.timedelta(days=1)
+        until = utc_datetime(end)
+        ts_parts, value_parts = [], []
+        for trip in self.trip_index.history(devid, begin, until):
+            trip_start = trip['key'] * 1000
+            if trip_start > end or trip_start + trip['duration'] < start:
+                continue
+            path = trip_file(self.trip_index.data_dir, devid, trip['id'])
+            meta = self.trip_index.meta(path)
+            if meta is None or pid not in meta.pids:
+                continue
+            offset = trip_start - meta.first_ts
+            ts, values = select(*self.trip_index.column(path, pid, max(start - offset, 1), end - offset), dim)
+            ts_parts.append(ts + offset)
+            value_parts.append(values)
+        if not ts_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate(ts_parts), np.concatenate(value_parts)
+
+    def query(self, devid: str, channel, pid: int, start: int, end: int, bucket: int, aggs: List[str],
+              source: str = 'auto', dim: int = 0) -> dict:
+        with query_latency.time():
+            bucket = self.bucket_size(start, end, bucket)
+            ts = values = None
+            used = source
+            if source in ('auto', 'buffer') and channel is not None:
+                ts, values = self.buffer_samples(channel, pid, dim)
+                # 버퍼가 요청 기간 시작까지 덮지 못하면 트립 데이터 사용
+                if source == 'auto' and (not len(ts) or ts.min() > start):
+                    ts = None
+                used = 'buffer'
+            if ts is None and source in ('auto', 'trips'):
+                ts, values = self.trip_samples(devid, pid, start, end, dim)
+                used = 'trips'
+            if ts is None:
+                ts, values = np.empty(0, dtype=np.int64), np.empty(0)
+            mask = (ts >= start) & (ts < end)
+            ts, values = ts[mask], values[mask]
+            query_samples.inc(len(ts))
+            return {
+                'devid': devid,
+                'pid': pid,
+                'from': start,
+                'to': end,
+                'bucket': bucket,
+                'agg': aggs,
+                'source': used,
+                'samples': int(len(ts)),
+                'data': aggregate(ts, values, start, bucket, aggs),
+            }
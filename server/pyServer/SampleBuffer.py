@@ -0,0 +1,233 @@
+import heapq
+import threading
+from array import array
+from typing import List, Optional, Tuple
+
+# C 버전 CACHE_DATA.data 크기와 동일
+MAX_PID_DATA_LEN = 24
+
+# 변경 기록 종류 (journal)
+JOURNAL_EXTEND = 'extend'
+JOURNAL_INSERT = 'insert'
+JOURNAL_CLEAR = 'clear'
+
+
+def format_value(value: str):
+    """PID 값을 JSON 값으로 변환 (C copyData 와 동일한 규칙)"""
+    is_num = bool(value)
+    is_array = False
+    for c in value:
+        if c == ';':
+            is_array = True
+        elif not c.isdigit() and c != '-' and c != '.':
+            is_num = False
+            break
+    if not is_num:
+        return value
+    try:
+        if is_array:
+            return [float(v) if '.' in v else int(v) for v in value.split(';')]
+        return float(value) if '.' in value else int(value)
+    except ValueError:
+        return value
+
+
+class SampleBuffer:
+    """채널별 샘플 링 버퍼 (ts, pid, value 를 미리 할당된 배열에 저장)"""
+
+    def __init__(self, size: int = 1000):
+        self.size = max(int(size), 2)
+        self.ts = array('q', bytes(8 * self.size))
+        self.pid = array('H', bytes(2 * self.size))
+        self.length = array('B', bytes(self.size))
+        self.values = bytearray(MAX_PID_DATA_LEN * self.size)
+        self.read_pos = 0
+        self.write_pos = 0
+        self.total = 0  # 누적 추가 샘플 수
+        self.journal = None  # 변경 기록 [(종류, 샘플 목록)], None 이면 기록 안 함 (멀티 프로세스 워커 -> 코디네이터 복제)
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return (self.write_pos - self.read_pos) % self.size
+
+    def clear(self):
+        """버퍼 초기화"""
+        with self.lock:
+            self.read_pos = 0
+            self.write_pos = 0
+            if self.journal is not None:
+                self.journal.append((JOURNAL_CLEAR, []))
+
+    def _append(self, ts: int, pid: int, value: str):
+        if self.read_pos != self.write_pos and self.ts[(self.write_pos - 1) % self.size] > ts:
+            # 타임스탬프가 되돌아감 (디바이스 리셋), 기존 데이터 폐기
+            self.read_pos = 0
+            self.write_pos = 0
+        self._put(ts, pid, value.encode('utf-8', errors='ignore')[:MAX_PID_DATA_LEN])
+
+    def _put(self, ts: int, pid: int, data: bytes):
+        pos = self.write_pos
+        offset = pos * MAX_PID_DATA_LEN
+        self.values[offset:offset + len(data)] = data
+        self.ts[pos] = ts
+        self.pid[pos] = pid & 0xFFFF
+        self.length[pos] = len(data)
+        self.write_pos = (pos + 1) % self.size
+        self.total += 1
+        if self.write_pos == self.read_pos:
+            # 한 바퀴 앞질렀으므로 가장 오래된 데이터 폐기
+            self.read_pos = (self.read_pos + 1) % self.size
+
+    def append(self, ts: int, pid: int, value: str):
+        """샘플 추가"""
+        with self.lock:
+            self._append(ts, pid, value)
+            if self.journal is not None:
+                self.journal.append((JOURNAL_EXTEND, [(ts, pid, value)]))
+
+    def extend(self, samples):
+        """(ts, pid, value) 샘플 여러개 추가"""
+        with self.lock:
+            if self.journal is not None:
+                samples = list(samples)
+                self.journal.append((JOURNAL_EXTEND, samples))
+            for ts, pid, value in samples:
+                self._append(ts, pid, value)
+
+    def insert(self, samples) -> int:
+        """늦게 도착한 (ts, pid, value) 샘플을 시간 순서 위치에 추가, 추가한 샘플 수 반환
+
+        삽입 위치 뒤의 샘플만 꺼냈다가 다시 기록합니다. 버퍼가 가득 찼을 때 가장 오래된
+        샘플보다 이전인 샘플은 바로 밀려나므로 버립니다.
+        """
+        samples = list(samples)
+        new = sorted((ts, pid, value.encode('utf-8', errors='ignore')[:MAX_PID_DATA_LEN])
+                     for ts, pid, value in samples)
+        with self.lock:
+            if self.journal is not None:
+                self.journal.append((JOURNAL_INSERT, samples))
+            count = len(self)
+            if count == self.size - 1:
+                oldest = self.ts[self.read_pos]
+                new = [s for s in new if s[0] >= oldest]
+            if not new:
+                return 0
+            # 같은 ts 의 기존 샘플 뒤에 삽입
+            index = self._bisect(new[0][0] + 1)
+            tail = []
+            for i in range(index, count):
+                pos = (self.read_pos + i) % self.size
+                offset = pos * MAX_PID_DATA_LEN
+                tail.append((self.ts[pos], self.pid[pos],
+                             bytes(self.values[offset:offset + self.length[pos]])))
+            self.write_pos = (self.read_pos + index) % self.size
+            for ts, pid, data in heapq.merge(tail, new, key=lambda s: s[0]):
+                self._put(ts, pid, data)
+            self.total -= len(tail)
+        return len(new)
+
+    def start_journal(self) -> List[tuple]:
+        """변경 기록 시작, 지금까지의 샘플을 첫 기록 (추가) 으로 반환"""
+        with self.lock:
+            self.journal = []
+            return [(JOURNAL_EXTEND, self._tail(len(self)))]
+
+    def drain_journal(self) -> List[tuple]:
+        """쌓인 변경 기록을 꺼내고 비움 [(종류, [(ts, pid, value), ...])]"""
+        with self.lock:
+            entries = self.journal or []
+            if self.journal is not None:
+                self.journal = []
+            return entries
+
+    def apply_journal(self, entries: List[tuple]):
+        """다른 프로세스 버퍼의 변경 기록을 같은 순서로 적용 (같은 크기 버퍼는 같은 내용이 됨)"""
+        for kind, samples in entries:
+            if kind == JOURNAL_CLEAR:
+                self.clear()
+            elif kind == JOURNAL_INSERT:
+                self.insert(samples)
+            else:
+                self.extend(samples)
+
+    def dump(self) -> Tuple[int, bytes, bytes, bytes, bytes]:
+        """저장된 샘플을 오래된 순서로 (개수, ts, pid, 길이, 값 바이트) 반환 (스냅샷용)"""
+        with self.lock:
+            read_pos, write_pos = self.read_pos, self.write_pos
+            if write_pos >= read_pos:
+                segments = [(read_pos, write_pos)]
+            else:
+                segments = [(read_pos, self.size), (0, write_pos)]
+            return (len(self),
+                    b''.join(self.ts[a:b].tobytes() for a, b in segments),
+                    b''.join(self.pid[a:b].tobytes() for a, b in segments),
+                    b''.join(self.length[a:b].tobytes() for a, b in segments),
+                    b''.join(self.values[a * MAX_PID_DATA_LEN:b * MAX_PID_DATA_LEN] for a, b in segments))
+
+    def restore(self, count: int, ts: bytes, pid: bytes, length: bytes, values: bytes):
+        """dump 결과 복원 (버퍼보다 많으면 오래된 샘플부터 버림)"""
+        with self.lock:
+            skip = max(count - (self.size - 1), 0)
+            n = count - skip
+            self.ts[0:n] = array('q', ts[skip * 8:])
+            self.pid[0:n] = array('H', pid[skip * 2:])
+            self.length[0:n] = array('B', length[skip:])
+            self.values[0:n * MAX_PID_DATA_LEN] = values[skip * MAX_PID_DATA_LEN:]
+            self.read_pos = 0
+            self.write_pos = n
+            self.total = n
+
+    def _value(self, pos: int) -> str:
+        offset = pos * MAX_PID_DATA_LEN
+        return self.values[offset:offset + self.length[pos]].decode('utf-8', errors='ignore')
+
+    def _bisect(self, ts: int) -> int:
+        """ts 이상인 첫번째 샘플의 논리 인덱스 (이진 탐색)"""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if self.ts[(self.read_pos + mid) % self.size] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def tail(self, count: int) -> List[tuple]:
+        """마지막 count 개 샘플 (ts, pid, value) 조회"""
+        with self.lock:
+            return self._tail(count)
+
+    def _tail(self, count: int) -> List[tuple]:
+        count = min(count, len(self))
+        result = []
+        for i in range(len(self) - count, len(self)):
+            pos = (self.read_pos + i) % self.size
+            result.append((self.ts[pos], self.pid[pos], self._value(pos)))
+        return result
+
+    def last_ts(self) -> int:
+        """마지막 샘플의 타임스탬프"""
+        with self.lock:
+            if self.read_pos == self.write_pos:
+                return 0
+            return self.ts[(self.write_pos - 1) % self.size]
+
+    def read(self, start_ts: int = 0, end_ts: int = 0, pid: int = 0,
+             limit: Optional[int] = None) -> Tuple[List[list], bool]:
+        """시간 범위 샘플 조회, (데이터, 끝까지 읽었는지 여부) 반환"""
+        result = []
+        with self.lock:
+            count = len(self)
+            i = self._bisect(start_ts) if start_ts else 0
+            while i < count:
+                pos = (self.read_pos + i) % self.size
+                ts = self.ts[pos]
+                if end_ts and ts >= end_ts:
+                    break
+                if limit is not None and len(result) >= limit:
+                    break
+                if self.length[pos] and (pid == 0 or pid == self.pid[pos]):
+                    result.append([ts, self.pid[pos], self._value(pos)])
+                i += 1
+            eos = i >= count
+        return result, eos
@@ -0,0 +1,267 @@
+import os
+import mmap
+import time
+import struct
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from Metrics import metrics, DB_BUCKETS
+from ChannelSnapshot import RecordReader, pack_channel, unpack_channel
+
+logger = logging.getLogger(__name__)
+
+STATE_MAGIC = b'FMSS'
+STATE_REVISION = 1
+# magic, 버전, 슬롯 수, 슬롯 크기
+_HEADER = struct.Struct('<4sIII')
+HEADER_SIZE = 64
+# 헤더 뒤의 int64 값: 채널 저장소 버전, 발행 시각 (ms), 발행 프로세스 ID
+_HEAD_OFFSET = 16
+# 슬롯 테이블 (seq 가 홀수면 기록 중)
+SLOT_DTYPE = np.dtype([('seq', '<u8'), ('version', '<i8'), ('length', '<u4'), ('pad', '<u4')])
+
+publish_latency = metrics.histogram('shared_state_publish_seconds', '공유 채널 상태 발행 시간 (초)', DB_BUCKETS)
+slots_written = metrics.counter('shared_state_slots_written_total', '공유 상태에 기록한 채널 슬롯 수')
+slot_overflows = metrics.counter('shared_state_overflows_total', '슬롯이 부족하거나 레코드가 너무 커서 발행하지 못한 횟수')
+publish_errors = metrics.counter('shared_state_publish_errors_total', '기록할 수 없는 값이 있어 발행하지 못한 채널 수')
+
+
+def _layout(slots: int, slot_size: int) -> Tuple[int, int]:
+    """(데이터 영역 시작, 파일 크기)"""
+    base = HEADER_SIZE + slots * SLOT_DTYPE.itemsize
+    base = (base + mmap.PAGESIZE - 1) // mmap.PAGESIZE * mmap.PAGESIZE
+    return base, base + slots * slot_size
+
+
+class SharedStateWriter:
+    """채널 상태를 메모리 매핑 파일에 발행 (수신 프로세스)
+
+    채널마다 고정 크기 슬롯 하나에 ChannelSnapshot 레코드를 기록합니다. 슬롯별 seq 를
+    기록 전후로 증가시키는 seqlock 방식이라 읽는 프로세스는 락 없이 읽고, 기록 중이거나
+    읽는 도중 바뀐 슬롯은 다음 동기화에서 다시 읽습니다.
+    """
+
+    def __init__(self, path: str, slots: int, slot_size: int, interval: float = 0.1):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.interval = interval
+        self.mm = None
+        self.table = None
+        self.head = None
+        self.base = 0
+        self.slot_of: Dict[str, int] = {}  # 채널 ID -> 슬롯
+        self.published: Dict[str, int] = {}  # 채널 ID -> 발행한 채널 버전
+        self.free: List[int] = list(range(slots - 1, -1, -1))
+        self.registry = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def create(self):
+        """공유 상태 파일 생성 (빈 슬롯)"""
+        self.base, size = _layout(self.slots, self.slot_size)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        _HEADER.pack_into(self.mm, 0, STATE_MAGIC, STATE_REVISION, self.slots, self.slot_size)
+        self.head = np.ndarray(3, dtype='<i8', buffer=self.mm, offset=_HEAD_OFFSET)
+        self.head[2] = os.getpid()
+        self.table = np.ndarray(self.slots, dtype=SLOT_DTYPE, buffer=self.mm, offset=HEADER_SIZE)
+        logger.info(f"공유 채널 상태 파일: {self.path} ({self.slots} x {self.slot_size} bytes)")
+
+    def start(self, registry):
+        """발행 스레드 시작"""
+        self.registry = registry
+        self.publish()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=10)
+            self.thread = None
+
+    def _loop(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"공유 채널 상태 발행 오류: {e}")
+
+    def publish(self) -> int:
+        """바뀐 채널만 슬롯에 기록, 기록한 슬롯 수 반환"""
+        registry = self.registry
+        with publish_latency.time():
+            # 채널을 읽기 전에 버전을 먼저 기록 (읽는 도중 바뀐 채널은 다음 발행에 포함)
+            version = registry.version
+            written = 0
+            current = set()
+            for channel in registry.values():
+                current.add(channel.id)
+                if self.published.get(channel.id) == channel.version:
+                    continue
+                slot = self.slot_of.get(channel.id)
+                if slot is None:
+                    if not self.free:
+                        slot_overflows.inc()
+                        continue
+                    slot = self.slot_of[channel.id] = self.free.pop()
+                channel_version = channel.version
+                try:
+                    record = self._record(channel)
+                except (struct.error, OverflowError) as e:
+                    # 이 채널만 건너뛰고 나머지 채널/제거/전체 버전은 계속 발행
+                    publish_errors.inc()
+                    logger.error(f"공유 채널 상태 기록 불가: {channel.devid} ({e})")
+                    self.published[channel.id] = channel_version  # 채널이 바뀔 때까지 다시 시도하지 않음
+                    continue
+                if record is None:
+                    slot_overflows.inc()
+                    continue
+                self._write(slot, channel_version, record)
+                self.published[channel.id] = channel_version
+                written += 1
+            # 제거된 채널은 빈 슬롯으로 (제거 버전은 지금 버전, 실제 제거 버전보다 크거나 같음)
+            removed_version = registry.version
+            for channel_id in [c for c in self.slot_of if c not in current]:
+                slot = self.slot_of.pop(channel_id)
+                self.published.pop(channel_id, None)
+                self._write(slot, removed_version, b'')
+                self.free.append(slot)
+                written += 1
+            self.head[1] = int(time.time() * 1000)
+            self.head[0] = version
+        slots_written.inc(written)
+        return written
+
+    def _record(self, channel) -> Optional[bytes]:
+        """슬롯에 들어가는 채널 레코드 (크면 오래된 샘플부터 줄임)"""
+        record = pack_channel(channel, versions=True)
+        samples = len(channel.cache)
+        while len(record) > self.slot_size and samples:
+            samples //= 2
+            record = pack_channel(channel, samples, versions=True)
+        return record if len(record) <= self.slot_size else None
+
+    def _write(self, slot: int, version: int, record: bytes):
+        entry = self.table[slot:slot + 1]
+        seq = int(entry['seq'][0])
+        entry['seq'] = seq + 1
+        offset = self.base + slot * self.slot_size
+        self.mm[offset:offset + len(record)] = record
+        entry['length'] = len(record)
+        entry['version'] = version
+        entry['seq'] = seq + 2
+
+
+class SharedStateReader:
+    """공유 채널 상태를 읽어 로컬 채널 저장소에 반영 (HTTP 워커 프로세스)"""
+
+    def __init__(self, path: str, interval: float = 0.1, retries: int = 3):
+        self.path = path
+        self.interval = interval
+        self.retries = retries
+        self.mm = None
+        self.table = None
+        self.head = None
+        self.base = 0
+        self.slot_size = 0
+        self.seen = None  # 슬롯별 마지막으로 반영한 seq
+        self.ids: Dict[int, str] = {}  # 슬롯 -> 채널 ID
+        self.registry = None
+        self.factories = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def open(self):
+        """공유 상태 파일 매핑 (읽기 전용)"""
+        with open(self.path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, revision, slots, self.slot_size = _HEADER.unpack_from(self.mm, 0)
+        if magic != STATE_MAGIC or revision != STATE_REVISION:
+            raise ValueError(f"지원하지 않는 공유 상태 형식: {self.path}")
+        self.base, _ = _layout(slots, self.slot_size)
+        self.head = np.ndarray(3, dtype='<i8', buffer=self.mm, offset=_HEAD_OFFSET)
+        self.table = np.ndarray(slots, dtype=SLOT_DTYPE, buffer=self.mm, offset=HEADER_SIZE)
+        self.seen = np.zeros(slots, dtype=np.uint64)
+
+    def start(self, registry, channel_factory, pid_factory):
+        """동기화 스레드 시작 (처음 한 번은 바로 동기화)"""
+        self.registry = registry
+        self.factories = (channel_factory, pid_factory)
+        self.sync()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=10)
+            self.thread = None
+
+    def _loop(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"공유 채널 상태 동기화 오류: {e}")
+
+    def sync(self) -> int:
+        """seq 가 바뀐 슬롯만 읽어 반영, 반영한 슬롯 수 반환"""
+        registry = self.registry
+        # 슬롯보다 먼저 전체 버전을 읽음 (이 버전까지의 변경은 이미 슬롯에 있음)
+        version = int(self.head[0])
+        changed = np.flatnonzero(self.table['seq'] != self.seen)
+        applied = 0
+        for slot in changed.tolist():
+            entry = self._read(slot)
+            if entry is None:
+                continue
+            seq, slot_version, record = entry
+            old_id = self.ids.get(slot)
+            if record:
+                try:
+                    channel = unpack_channel(RecordReader(record), *self.factories, versions=True)
+                except (ValueError, struct.error) as e:
+                    logger.error(f"공유 채널 상태 슬롯 {slot} 읽기 실패: {e}")
+                    self.seen[slot] = seq
+                    continue
+                channel.version = slot_version
+                if old_id and old_id != channel.id:
+                    registry.remove(old_id, slot_version)
+                registry.put(channel)
+                self.ids[slot] = channel.id
+            elif old_id:
+                registry.remove(old_id, slot_version)
+                del self.ids[slot]
+            self.seen[slot] = seq
+            applied += 1
+        if version > registry.version:
+            registry.version = version
+        return applied
+
+    def _read(self, slot: int) -> Optional[Tuple[int, int, bytes]]:
+        """seqlock 읽기, 기록 중이거나 읽는 도중 바뀌면 재시도 (계속 실패하면 None)"""
+        entry = self.table[slot:slot + 1]
+        offset = self.base + slot * self.slot_size
+        for _ in range(self.retries):
+            seq = int(entry['seq'][0])
+            if seq & 1:
+                time.sleep(0)
+                continue
+            version = int(entry['version'][0])
+            length = int(entry['length'][0])
+            record = self.mm[offset:offset + min(length, self.slot_size)]
+            if int(entry['seq'][0]) == seq:
+                return seq, version, record
+        return None
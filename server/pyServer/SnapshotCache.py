@@ -0,0 +1,98 @@
+import json
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# 값이 바뀌는 중인 PID 의 버전 (변경 반영이 끝나면 채널 버전으로 바뀜, 델타 조회 시 항상 포함)
+PID_PENDING = sys.maxsize
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def channel_ages(channel, now: int) -> Tuple[int, int]:
+    """(마지막 데이터 경과 시간, 마지막 핑 경과 시간) ms"""
+    age_data = now - channel.server_data_tick if channel.server_data_tick > 0 else 0
+    age_ping = now - channel.server_ping_tick if channel.server_ping_tick > 0 else 0
+    return age_data, age_ping
+
+
+class SnapshotCache:
+    """채널별 JSON 직렬화 결과 캐시 (채널 버전이 바뀔 때만 다시 직렬화)
+
+    경과 시간(age)은 조회 시각에 따라 달라지므로 캐시된 조각 뒤에 붙입니다.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats: Dict[Tuple[str, bool], Tuple[int, str]] = {}
+        self.data: Dict[str, Tuple[int, List[Tuple[int, str, Optional[int]]]]] = {}
+
+    def discard(self, channel_id: str):
+        """제거된 채널의 캐시 삭제"""
+        with self.lock:
+            self.stats.pop((channel_id, False), None)
+            self.stats.pop((channel_id, True), None)
+            self.data.pop(channel_id, None)
+
+    def _stats_head(self, channel, extend: bool) -> str:
+        key = (channel.id, extend)
+        # 필드를 읽는 동안 버전이 바뀌면 다음 조회에서 다시 만들도록 먼저 읽은 버전으로 저장
+        version = channel.version
+        entry = self.stats.get(key)
+        if entry is None or entry[0] != version:
+            info = {
+                'id': channel.id,
+                'num': channel.num,
+                'devid': channel.devid,
+                'recv': channel.data_received,
+                'rate': int(channel.sample_rate),
+                'tick': channel.server_data_tick,
+                'devtick': channel.device_tick,
+                'elapsed': channel.elapsed_time,
+                'rssi': channel.rssi,
+                'flags': channel.devflags,
+                'parked': 0 if (channel.flags & 1) else 1,
+                'version': version,
+            }
+            if extend:
+                if channel.vin:
+                    info['vin'] = channel.vin
+                if channel.ip_addr:
+                    info['ip'] = channel.ip_addr
+            entry = (version, _dumps(info)[:-1])
+            with self.lock:
+                self.stats[key] = entry
+        return entry[1]
+
+    def _data_parts(self, channel) -> List[Tuple[int, str, Optional[int]]]:
+        """PID별 ('[pid,value,' 조각, device_tick - ts) 목록"""
+        version = channel.version
+        entry = self.data.get(channel.id)
+        if entry is None or entry[0] != version:
+            parts = []
+            for pid, pid_data in list(channel.data.items()):
+                if pid_data.ts > 0:
+                    rel = channel.device_tick - pid_data.ts if channel.device_tick >= pid_data.ts else None
+                    parts.append((pid_data.version, f"[{pid},{_dumps(pid_data.value)},", rel))
+            entry = (version, parts)
+            with self.lock:
+                self.data[channel.id] = entry
+        return entry[1]
+
+    def data_json(self, channel, age_data: int, since: int = 0) -> str:
+        """[[pid, value, age], ...] JSON, since 지정 시 그 이후 바뀐 PID 만"""
+        items = []
+        for version, prefix, rel in self._data_parts(channel):
+            if version > since:
+                items.append(f"{prefix}{age_data + rel if rel is not None else 0}]")
+        return '[' + ','.join(items) + ']'
+
+    def stats_json(self, channel, now: int, extend: bool = False, data: bool = False, since: int = 0) -> str:
+        """/api/channels 채널 항목 JSON"""
+        age_data, age_ping = channel_ages(channel, now)
+        text = f'{self._stats_head(channel, extend)},"age":{{"data":{age_data},"ping":{age_ping}}}'
+        if data:
+            text += ',"data":' + self.data_json(channel, age_data, since)
+        return text + '}'
@@ -0,0 +1,105 @@
+import json
+import queue
+import logging
+import threading
+from typing import Iterable, List, Optional, Set
+
+from Metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+stream_events = metrics.counter('stream_events_total', 'SSE 구독자에게 전달된 이벤트 수')
+stream_dropped = metrics.counter('stream_subscribers_dropped_total', '대기열 초과로 끊은 SSE 구독자 수')
+
+
+class Subscriber:
+    """SSE 구독자 (디바이스/PID 필터, 크기 제한 대기열)"""
+
+    def __init__(self, devids: Optional[Set[str]], pids: Optional[Set[int]], queue_size: int):
+        self.devids = devids
+        self.pids = pids
+        self.queue = queue.Queue(queue_size)
+        self.closed = False
+
+    def get(self, timeout: float) -> Optional[str]:
+        """다음 이벤트, timeout 동안 없으면 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class StreamHub:
+    """채널 변경 이벤트를 SSE 구독자에게 전달 (구독자가 없으면 아무 작업도 하지 않음)"""
+
+    def __init__(self, queue_size: int = 256, max_subscribers: int = 1000):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.lock = threading.Lock()
+        self.subscribers: List[Subscriber] = []
+
+    def __len__(self) -> int:
+        return len(self.subscribers)
+
+    def subscribe(self, devids: Optional[Set[str]] = None, pids: Optional[Set[int]] = None) -> Optional[Subscriber]:
+        """구독자 등록, 최대 구독자 수 초과 시 None"""
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                return None
+            subscriber = Subscriber(devids or None, pids or None, self.queue_size)
+            # 발행 스레드는 락 없이 목록을 읽으므로 항상 새 리스트로 교체
+            self.subscribers = self.subscribers + [subscriber]
+            return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscriber.closed = True
+        with self.lock:
+            self.subscribers = [s for s in self.subscribers if s is not subscriber]
+
+    def publish(self, channel, samples: Iterable[tuple] = ()):
+        """채널 통계와 새 PID 값 (pid, ts, value) 발행"""
+        subscribers = self.subscribers
+        if not subscribers:
+            return
+        samples = list(samples)
+        event = {
+            'id': channel.id,
+            'devid': channel.devid,
+            'recv': channel.data_received,
+            'rate': int(channel.sample_rate),
+            'tick': channel.server_data_tick,
+            'devtick': channel.device_tick,
+            'elapsed': channel.elapsed_time,
+            'rssi': channel.rssi,
+            'parked': 0 if (channel.flags & 1) else 1,
+        }
+        encoded = None
+        for subscriber in subscribers:
+            if subscriber.devids and channel.devid not in subscriber.devids:
+                continue
+            if subscriber.pids:
+                data = [[pid, value, ts] for pid, ts, value in samples if pid in subscriber.pids]
+                if not data:
+                    continue
+                message = self._format(dict(event, data=data))
+            else:
+                if encoded is None:
+                    encoded = self._format(dict(event, data=[[pid, value, ts] for pid, ts, value in samples]))
+                message = encoded
+            try:
+                subscriber.queue.put_nowait(message)
+                stream_events.inc()
+            except queue.Full:
+                # 느린 구독자는 끊음 (재접속 시 /api/channels 로 다시 동기화)
+                self._drop(subscriber)
+
+    def _drop(self, subscriber: Subscriber):
+        if subscriber.closed:
+            return
+        logger.warning("SSE 구독자 대기열 초과, 연결 종료")
+        stream_dropped.inc()
+        self.unsubscribe(subscriber)
+
+    @staticmethod
+    def _format(event: dict) -> str:
+        return f"event: channel\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
@@ -0,0 +1,389 @@
+import os
+import json
+import mmap
+import time
+import zlib
+import queue
+import struct
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from Metrics import metrics
+from PayloadParser import parse_payload, decode_value
+from TripWriter import is_trip_id
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = '.col'
+ARCHIVE_MAGIC = b'FMTC'
+ARCHIVE_REVISION = 3
+# 읽을 수 있는 버전 (1: float32 값, 원본 줄 없음, 2: ts 차분은 항상 int32)
+ARCHIVE_REVISIONS = (1, 2, 3)
+# magic, 버전, 헤더(JSON) 길이
+_PREAMBLE = struct.Struct('<4sII')
+
+trips_archived = metrics.counter('trip_archives_written_total', '컬럼 아카이브로 변환한 트립 수')
+archive_bytes_in = metrics.counter('trip_archive_input_bytes_total', '아카이브로 변환한 트립 파일 바이트')
+archive_bytes_out = metrics.counter('trip_archive_output_bytes_total', '기록한 아카이브 파일 바이트')
+archive_errors = metrics.counter('trip_archive_errors_total', '아카이브 변환 실패 수')
+archive_mismatches = metrics.counter('trip_archive_mismatches_total', '아카이브로 원본을 다시 만들 수 없어 원본을 유지한 트립 수')
+
+
+def archive_path(path: str) -> str:
+    """트립 데이터 파일(.txt)의 아카이브 경로"""
+    return path[:-4] + ARCHIVE_SUFFIX
+
+
+def _numeric(array: np.ndarray) -> Optional[Tuple[np.ndarray, str]]:
+    """정수는 int32/int64, 실수는 float64 (값 손실 없음)"""
+    if array.dtype.kind == 'i':
+        if np.abs(array).max() < 2 ** 31:
+            return array.astype(np.int32), 'int32'
+        return array.astype(np.int64), 'int64'
+    if array.dtype.kind == 'f':
+        return array.astype(np.float64), 'float64'
+    return None
+
+
+def value_texts(values: np.ndarray) -> List[str]:
+    """아카이브 값 배열 -> 트립 파일 값 문자열 (다중 값은 x;y;z)"""
+    if values.dtype == object:
+        return values.tolist()
+    # float64 는 str() 이 원래 값으로 돌아오는 가장 짧은 표기 (float32 아카이브는 7자리)
+    fmt = '{:.7g}' if values.dtype == np.float32 else '{}'
+    if values.ndim > 1:
+        return [';'.join(map(fmt.format, row)) for row in values.tolist()]
+    return list(map(fmt.format, values.tolist()))
+
+
+
+def _column_values(values: List[str]) -> Tuple[np.ndarray, str]:
+    """PID 값 목록 -> (배열, 종류) 숫자는 int32/int64/float64, 같은 길이의 다중 값은 2차원, 그 외는 문자열
+
+    숫자 배열을 다시 문자열로 만들었을 때 원본과 다르면 (앞자리 0, 끝자리 0 등) 문자열로 저장합니다.
+    """
+    numbers = [decode_value(v) for v in values]
+    first = numbers[0]
+    column = None
+    try:
+        if isinstance(first, tuple):
+            width = len(first)
+            if all(isinstance(n, tuple) and len(n) == width for n in numbers):
+                column = _numeric(np.array(numbers))
+        elif first is not None and all(isinstance(n, (int, float)) and not isinstance(n, bool) for n in numbers):
+            column = _numeric(np.array(numbers))
+    except OverflowError:
+        column = None
+    if column is not None and value_texts(column[0]) != list(values):
+        column = None
+    return column or (np.array(values, dtype=object), 'str')
+
+
+def _render(result) -> str:
+    """파싱 결과를 트립 파일 줄 형식으로 (원본과 같으면 컬럼만으로 줄을 복원할 수 있음)"""
+    items = []
+    last = None
+    for ts, pid, value in result:
+        if ts != last:
+            items.append(f'0:{ts}')
+            last = ts
+        items.append(f'{pid:X}:{value}')
+    return ','.join(items)
+
+
+def _pack(array: np.ndarray, kind: str) -> bytes:
+    if kind == 'str':
+        return zlib.compress('\n'.join(array.tolist()).encode('utf-8'), 6)
+    return zlib.compress(array.tobytes(), 6)
+
+
+def write_archive(path: str, out_path: str, info: dict) -> int:
+    """트립 데이터 파일을 PID별 컬럼 아카이브로 변환, 기록한 바이트 수 반환
+
+    ts 는 차분(int32, 범위를 넘는 차분이 있으면 int64) 으로, 값은 int32/int64/float64 배열로 저장하고 컬럼별로 zlib 압축합니다.
+    헤더에 컬럼별 위치가 있어 필요한 PID 만 mmap 으로 읽을 수 있습니다. 파싱 결과로 다시 만들 수
+    없는 줄 (첫 줄의 GPS 위치, 파싱에서 무시되는 항목이 있는 줄) 은 줄 번호와 함께 원본 그대로 저장합니다.
+    """
+    columns: Dict[int, Tuple[List[int], List[str]]] = {}
+    extra: List[Tuple[int, str]] = []
+    counts: List[int] = []  # 줄별 샘플 수
+    order: List[int] = []  # 파일 순서의 샘플 PID
+    with open(path, 'rb') as f:
+        for number, line in enumerate(f):
+            text = line.decode('latin-1').rstrip('\n')
+            result = parse_payload(text)
+            if _render(result) != text:
+                extra.append((number, text))
+            counts.append(len(result))
+            order.extend(result.pid)
+            for ts, pid, value in result:
+                column = columns.get(pid)
+                if column is None:
+                    column = columns[pid] = ([], [])
+                column[0].append(ts)
+                column[1].append(value)
+
+    blobs = []
+    header_pids = {}
+    offset = 0
+    for pid in sorted(columns):
+        ts_list, values = columns[pid]
+        ts = np.array(ts_list, dtype=np.int64)
+        deltas = np.diff(ts, prepend=ts[0])
+        # 디바이스 시계 리셋이나 epoch ms ts 처럼 큰 차분은 잘리지 않게 int64 로 저장
+        ts_kind = 'int32' if np.abs(deltas).max() < 2 ** 31 else 'int64'
+        ts_blob = zlib.compress(deltas.astype(ts_kind).tobytes(), 6)
+        array, kind = _column_values(values)
+        value_blob = _pack(array, kind)
+        header_pids[f'{pid:X}'] = {
+            'count': len(ts), 'first_ts': int(ts[0]), 'min_ts': int(ts.min()), 'max_ts': int(ts.max()),
+            'ts': [offset, len(ts_blob), ts_kind],
+            'value': [offset + len(ts_blob), len(value_blob), kind, list(array.shape[1:])],
+        }
+        blobs += [ts_blob, value_blob]
+        offset += len(ts_blob) + len(value_blob)
+
+    # 줄 구성 (줄별 샘플 수, 샘플 PID 순서) 으로 컬럼에서 원본 파일을 다시 만들 수 있음
+    counts_blob = zlib.compress(np.array(counts, dtype=np.int32).tobytes(), 6)
+    order_blob = zlib.compress(np.array(order, dtype=np.uint16).tobytes(), 6)
+    header_layout = [offset, len(counts_blob), len(order_blob)]
+    blobs += [counts_blob, order_blob]
+    offset += len(counts_blob) + len(order_blob)
+
+    header_lines = None
+    if extra:
+        lines_blob = zlib.compress('\n'.join(text for _, text in extra).encode('latin-1'), 6)
+        header_lines = {'numbers': [number for number, _ in extra], 'text': [offset, len(lines_blob)]}
+        blobs.append(lines_blob)
+        offset += len(lines_blob)
+
+    header = json.dumps(dict(info, rev=ARCHIVE_REVISION, pids=header_pids, raw_lines=header_lines,
+                             layout=header_layout),
+                        separators=(',', ':')).encode()
+    tmp = out_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_PREAMBLE.pack(ARCHIVE_MAGIC, ARCHIVE_REVISION, len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp, out_path)
+    return _PREAMBLE.size + len(header) + offset
+
+
+class ArchiveReader:
+    """컬럼 아카이브 읽기 (헤더만 읽고, 컬럼은 요청 시 mmap 범위에서 압축 해제)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, revision, length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+            if magic != ARCHIVE_MAGIC or revision not in ARCHIVE_REVISIONS:
+                raise ValueError(f"지원하지 않는 아카이브 형식: {path}")
+            self.header = json.loads(f.read(length))
+        self.base = _PREAMBLE.size + length
+        self.pids = {int(pid, 16): column for pid, column in self.header['pids'].items()}
+
+    def column(self, pid: int, begin: int = 0, end: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """(ts 배열, 값 배열), begin/end 로 디바이스 ts 범위 지정"""
+        column = self.pids.get(pid)
+        if column is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        ts_offset, ts_length = column['ts'][:2]
+        ts_kind = column['ts'][2] if len(column['ts']) > 2 else 'int32'
+        value_offset, value_length, kind, shape = column['value']
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ts_raw = zlib.decompress(mm[self.base + ts_offset:self.base + ts_offset + ts_length])
+            value_raw = zlib.decompress(mm[self.base + value_offset:self.base + value_offset + value_length])
+        ts = np.cumsum(np.frombuffer(ts_raw, dtype=ts_kind), dtype=np.int64) + column['first_ts']
+        if kind == 'str':
+            values = np.array(value_raw.decode('utf-8').split('\n'), dtype=object)
+        else:
+            values = np.frombuffer(value_raw, dtype=kind).reshape([-1] + shape)
+        if begin or end:
+            mask = ts >= begin if begin else np.ones(len(ts), dtype=bool)
+            if end:
+                mask &= ts <= end
+            ts, values = ts[mask], values[mask]
+        return ts, values
+
+    def raw_lines(self) -> List[Tuple[int, str]]:
+        """컬럼으로 복원할 수 없어 원본 그대로 저장한 줄 [(줄 번호, 내용)]"""
+        lines = self.header.get('raw_lines')
+        if not lines:
+            return []
+        offset, length = lines['text']
+        with open(self.path, 'rb') as f:
+            f.seek(self.base + offset)
+            texts = zlib.decompress(f.read(length)).decode('latin-1').split('\n')
+        return list(zip(lines['numbers'], texts))
+
+    def lines(self) -> Iterator[str]:
+        """원본 트립 파일의 줄 (줄 구성 정보가 없는 이전 아카이브는 ValueError)"""
+        layout = self.header.get('layout')
+        if not layout:
+            raise ValueError(f"원본 줄 구성이 없는 아카이브: {self.path}")
+        offset, counts_length, order_length = layout
+        with open(self.path, 'rb') as f:
+            f.seek(self.base + offset)
+            counts = np.frombuffer(zlib.decompress(f.read(counts_length)), dtype=np.int32).tolist()
+            order = np.frombuffer(zlib.decompress(f.read(order_length)), dtype=np.uint16).tolist()
+        columns = {}
+        for pid in self.pids:
+            ts, values = self.column(pid)
+            columns[pid] = (ts.tolist(), value_texts(values))
+        next_index = dict.fromkeys(self.pids, 0)
+        raw = dict(self.raw_lines())
+        start = 0
+        for number, count in enumerate(counts):
+            samples = []
+            for pid in order[start:start + count]:
+                i = next_index[pid]
+                next_index[pid] = i + 1
+                samples.append((columns[pid][0][i], pid, columns[pid][1][i]))
+            start += count
+            text = raw.get(number)
+            yield _render(samples) if text is None else text
+
+    def text_chunks(self, lines: int = 4096) -> Iterator[bytes]:
+        """원본 트립 파일 내용 (lines 줄씩)"""
+        chunk = []
+        for text in self.lines():
+            chunk.append(text)
+            if len(chunk) >= lines:
+                yield ('\n'.join(chunk) + '\n').encode('latin-1')
+                chunk = []
+        if chunk:
+            yield ('\n'.join(chunk) + '\n').encode('latin-1')
+
+    def matches(self, path: str) -> bool:
+        """아카이브에서 다시 만든 내용이 원본 트립 파일과 같은지 (원본 삭제 전 확인)"""
+        try:
+            with open(path, 'rb') as f:
+                for chunk in self.text_chunks():
+                    if f.read(len(chunk)) != chunk:
+                        return False
+                return f.read(1) == b''
+        except (ValueError, KeyError, IndexError, UnicodeEncodeError):
+            return False
+
+
+def _matches(archive: str, path: str) -> bool:
+    try:
+        return ArchiveReader(archive).matches(path)
+    except (OSError, ValueError):
+        return False
+
+
+class TripCompactor:
+    """종료된 트립을 컬럼 아카이브로 변환하는 백그라운드 작업
+
+    TripWriter 가 트립을 닫을 때 (로그아웃, 타임아웃, 세션 간격 초과, 종료) 변환 요청을 받습니다.
+    이전 실행에서 변환하지 못한 트립 (비정상 종료 등) 은 시작 시 한 번만 data_dir 을 검사해 변환합니다.
+    """
+
+    def __init__(self, data_dir: str, trip_index, keep_text: bool = False):
+        self.data_dir = data_dir
+        self.trip_index = trip_index
+        self.keep_text = keep_text
+        self.queue = queue.Queue()
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, args=(time.time(),), daemon=True)
+        self.thread.start()
+        logger.info("트립 아카이브 변환 시작")
+
+    def stop(self):
+        self.running = False
+        self.queue.put(None)
+        if self.thread:
+            self.thread.join(timeout=30)
+            self.thread = None
+
+    def submit(self, path: str):
+        """닫힌 트립 파일 변환 요청"""
+        if self.running:
+            self.queue.put(path)
+
+    def _loop(self, started: float):
+        try:
+            self.scan(started)
+        except Exception as e:
+            logger.error(f"트립 아카이브 검사 오류: {e}")
+        while self.running:
+            path = self.queue.get()
+            if not path:
+                continue
+            try:
+                self.compact(path)
+            except Exception as e:
+                logger.error(f"트립 아카이브 변환 오류: {e}")
+
+    def scan(self, before: float) -> int:
+        """before 이전에 마지막으로 기록된 (이미 닫힌) 트립 파일 변환, 변환한 수 반환"""
+        count = 0
+        for root, _, files in os.walk(self.data_dir):
+            for name in files:
+                if not self.running:
+                    return count
+                if name.endswith('.txt') and is_trip_id(name[:-4]):
+                    path = os.path.join(root, name)
+                    try:
+                        if os.stat(path).st_mtime < before and self.compact(path):
+                            count += 1
+                    except OSError:
+                        continue
+        if count:
+            logger.info(f"이전 실행에서 남은 트립 {count}개 아카이브 변환")
+        return count
+
+    def compact(self, path: str) -> bool:
+        """트립 파일 하나를 아카이브로 변환 (이미 최신 아카이브가 있으면 건너뜀)"""
+        out_path = archive_path(path)
+        try:
+            st = os.stat(path)
+            if os.path.exists(out_path) and os.stat(out_path).st_mtime_ns >= st.st_mtime_ns:
+                if self.keep_text:
+                    return False
+                if _matches(out_path, path):
+                    self._remove_text(path)
+                    return False
+                # 이전 버전 (줄 구성 없음) 이나 손상된 아카이브는 다시 변환
+            meta = self.trip_index.meta(path)
+            if meta is None or not meta.samples:
+                return False
+            info = dict(meta.info(), lines=meta.lines, tripid=os.path.basename(path)[:-4])
+            written = write_archive(path, out_path, info)
+        except (OSError, ValueError, OverflowError) as e:
+            archive_errors.inc()
+            logger.error(f"트립 아카이브 변환 실패: {path} ({e})")
+            return False
+        trips_archived.inc()
+        archive_bytes_in.inc(st.st_size)
+        archive_bytes_out.inc(written)
+        logger.info(f"트립 아카이브: {out_path} ({st.st_size} -> {written} bytes)")
+        if not self.keep_text:
+            # 아카이브에서 원본과 똑같은 내용이 나올 때만 원본 삭제
+            if _matches(out_path, path):
+                self._remove_text(path)
+            else:
+                archive_mismatches.inc()
+                logger.warning(f"트립 아카이브가 원본과 달라 원본을 유지합니다: {path}")
+        return True
+
+    def _remove_text(self, path: str):
+        """원본 트립 파일과 인덱스/내보내기 캐시 삭제 (아카이브만 남김)"""
+        directory, name = os.path.split(path)
+        tripid = name[:-4]
+        for other in os.listdir(directory):
+            if other.startswith(tripid + '.') and not other.endswith(ARCHIVE_SUFFIX):
+                try:
+                    os.unlink(os.path.join(directory, other))
+                except OSError:
+                    pass
+        self.trip_index.forget(path)
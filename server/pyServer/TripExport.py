@@ -0,0 +1,281 @@
+import os
+import json
+import math
+import time
+import logging
+from typing import Iterator, Optional
+
+import numpy as np
+
+from Metrics import metrics
+from TripWriter import PID_GPS_LATITUDE, PID_GPS_LONGITUDE, PID_GPS_ALTITUDE
+
+logger = logging.getLogger(__name__)
+
+# C PID_GPS_SPEED
+PID_GPS_SPEED = 0xD
+
+# 출력 조각당 좌표 수
+CHUNK_POINTS = 2000
+
+# 출력 형식이 바뀌면 올려서 이전 캐시 파일을 무효화
+CACHE_REVISION = 2
+
+export_cache_hits = metrics.counter('trip_export_cache_hits_total', '디스크 캐시에서 응답한 트립 내보내기 수')
+export_cache_misses = metrics.counter('trip_export_cache_misses_total', '새로 생성한 트립 내보내기 수')
+
+KML_HEAD = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">\n'
+            '<Document><name>{name}</name>'
+            '<Schema id="schema"><gx:SimpleArrayField name="{speed:X}" type="float">'
+            '<displayName>Speed (km/h)</displayName></gx:SimpleArrayField></Schema>\n'
+            '<Style id="track"><LineStyle><color>ff0000ff</color><width>4</width></LineStyle></Style>\n'
+            '<Folder><Placemark><name>{name}</name><styleUrl>#track</styleUrl><gx:Track>')
+KML_TAIL = '</gx:Track></Placemark></Folder></Document></kml>\n'
+
+
+class Track:
+    """GPS 궤적 (ts, 위도, 경도, 고도, 속도 배열)"""
+
+    def __init__(self, ts, lat, lng, alt, speed):
+        self.ts = ts
+        self.lat = lat
+        self.lng = lng
+        self.alt = alt
+        self.speed = speed
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def take(self, keep) -> 'Track':
+        return Track(self.ts[keep], self.lat[keep], self.lng[keep], self.alt[keep], self.speed[keep])
+
+    def distance(self) -> float:
+        """이동 거리 (m, 등장방형 근사)"""
+        if len(self) < 2:
+            return 0.0
+        x, y = _project(self.lat, self.lng)
+        return float(np.hypot(np.diff(x), np.diff(y)).sum())
+
+
+def load_track(records) -> Track:
+    """(ts, pid, value) 레코드에서 GPS 궤적 추출 (C WriteKMLData)
+
+    위도/경도가 모두 있는 ts 마다 한 점을 만들고, 이전 점에서 1도 이상 튄 좌표는 버립니다.
+    """
+    ts_list, lat_list, lng_list, alt_list, speed_list = [], [], [], [], []
+    cur_ts = 0
+    lat = lng = None
+    alt = speed = 0.0
+    dirty = False
+
+    def emit():
+        if lat_list and (abs(lat - lat_list[-1]) > 1 or abs(lng - lng_list[-1]) > 1):
+            return
+        if ts_list and ts_list[-1] == cur_ts:
+            return
+        ts_list.append(cur_ts)
+        lat_list.append(lat)
+        lng_list.append(lng)
+        alt_list.append(alt)
+        speed_list.append(speed)
+
+    for ts, pid, value in records:
+        if ts != cur_ts:
+            if dirty and lat is not None and lng is not None:
+                emit()
+            cur_ts = ts
+            dirty = False
+        if pid == PID_GPS_LATITUDE or pid == PID_GPS_LONGITUDE or pid == PID_GPS_ALTITUDE or pid == PID_GPS_SPEED:
+            try:
+                number = float(value)
+            except ValueError:
+                continue
+            if pid == PID_GPS_LATITUDE:
+                lat = number
+                dirty = True
+            elif pid == PID_GPS_LONGITUDE:
+                lng = number
+                dirty = True
+            elif pid == PID_GPS_ALTITUDE:
+                alt = number
+            else:
+                speed = number
+    if dirty and lat is not None and lng is not None:
+        emit()
+    return Track(np.array(ts_list, dtype=np.int64), np.array(lat_list), np.array(lng_list),
+                 np.array(alt_list), np.array(speed_list))
+
+
+def _project(lat, lng):
+    """위경도 -> 평면 좌표 (m, 궤적 중심 위도 기준 등장방형 투영)"""
+    lat0 = math.radians(float(lat.mean())) if len(lat) else 0.0
+    return np.radians(lng) * 6371000.0 * math.cos(lat0), np.radians(lat) * 6371000.0
+
+
+def zoom_tolerance(zoom: int, lat: float) -> float:
+    """지도 줌 레벨의 픽셀당 거리 (m, Web Mercator)"""
+    return 156543.03 * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def simplify(track: Track, tolerance: float) -> Track:
+    """Douglas-Peucker 궤적 단순화 (tolerance: m), 구간별 거리 계산은 NumPy 로 일괄 처리"""
+    n = len(track)
+    if tolerance <= 0 or n < 3:
+        return track
+    x, y = _project(track.lat, track.lng)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx = x[last] - x[first]
+        dy = y[last] - y[first]
+        px = x[first + 1:last] - x[first]
+        py = y[first + 1:last] - y[first]
+        length = math.hypot(dx, dy)
+        if length > 0:
+            dist = np.abs(dx * py - dy * px) / length
+        else:
+            dist = np.hypot(px, py)
+        i = int(dist.argmax())
+        if dist[i] > tolerance:
+            index = first + 1 + i
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return track.take(keep)
+
+
+def _numbers(values, fmt: str) -> str:
+    return ','.join(map(fmt.format, values))
+
+
+def geojson_chunks(track: Track, properties: dict) -> Iterator[str]:
+    """GeoJSON Feature (LineString, [경도, 위도, 고도]) 조각 단위 출력"""
+    yield '{"type":"Feature","properties":' + json.dumps(properties, separators=(',', ':'))[:-1]
+    if len(track):
+        t0 = int(track.ts[0])
+        yield ',"timestamps":['
+        for i in range(0, len(track), CHUNK_POINTS):
+            yield (',' if i else '') + _numbers((track.ts[i:i + CHUNK_POINTS] - t0).tolist(), '{}')
+        yield '],"speeds":['
+        for i in range(0, len(track), CHUNK_POINTS):
+            yield (',' if i else '') + _numbers(track.speed[i:i + CHUNK_POINTS].tolist(), '{:.1f}')
+        yield '],"bbox":[{:.6f},{:.6f},{:.6f},{:.6f}]'.format(
+            track.lng.min(), track.lat.min(), track.lng.max(), track.lat.max())
+    yield '},"geometry":{"type":"LineString","coordinates":['
+    for i in range(0, len(track), CHUNK_POINTS):
+        end = i + CHUNK_POINTS
+        points = zip(track.lng[i:end].tolist(), track.lat[i:end].tolist(), track.alt[i:end].tolist())
+        yield (',' if i else '') + ','.join(f'[{x:.6f},{y:.6f},{int(z)}]' for x, y, z in points)
+    yield ']}}\n'
+
+
+def kml_chunks(track: Track, name: str, start_utc: int) -> Iterator[str]:
+    """KML gx:Track (C ConvertToKML) 조각 단위 출력, 시각은 트립 시작 + 디바이스 ts 경과"""
+    yield KML_HEAD.format(name=name, speed=PID_GPS_SPEED)
+    if len(track):
+        t0 = int(track.ts[0])
+        for i in range(0, len(track), CHUNK_POINTS):
+            end = i + CHUNK_POINTS
+            parts = []
+            points = zip(track.ts[i:end].tolist(), track.lng[i:end].tolist(),
+                         track.lat[i:end].tolist(), track.alt[i:end].tolist())
+            for ts, x, y, z in points:
+                ms = start_utc * 1000 + ts - t0
+                parts.append(time.strftime('<when>%Y-%m-%dT%H:%M:%S', time.gmtime(ms // 1000))
+                             + f'.{ms % 1000:03d}Z</when><gx:coord>{x:.6f} {y:.6f} {int(z)}</gx:coord>')
+            yield ''.join(parts)
+        yield '<ExtendedData><SchemaData schemaUrl="#schema">'
+        yield f'<gx:SimpleArrayData name="{PID_GPS_SPEED:X}">'
+        for i in range(0, len(track), CHUNK_POINTS):
+            yield ''.join(f'<gx:value>{v:.1f}</gx:value>' for v in track.speed[i:i + CHUNK_POINTS].tolist())
+        yield '</gx:SimpleArrayData></SchemaData></ExtendedData>'
+    yield KML_TAIL
+
+
+class TripExporter:
+    """트립 GeoJSON/KML 내보내기 (트립 파일 크기/수정 시각별 디스크 캐시)"""
+
+    def __init__(self, trip_index, cache: bool = True):
+        self.trip_index = trip_index
+        self.cache = cache
+
+    def cache_path(self, path: str, fmt: str, tolerance: float) -> str:
+        """<tripid>.<크기>-<mtime>-<리비전>.<허용 오차>.<형식> (트립 파일 또는 아카이브가 바뀌면 키가 달라짐)"""
+        st = os.stat(self.trip_index.source(path))
+        return (f'{path[:-4]}.{st.st_size:x}-{st.st_mtime_ns:x}-{CACHE_REVISION}'
+                f'.{int(round(tolerance * 10))}.{fmt}')
+
+    def export(self, path: str, fmt: str, tolerance: float, zoom: Optional[int], properties: dict,
+               start_utc: int) -> Iterator[str]:
+        """내보내기 출력 조각 (캐시가 있으면 캐시 파일 내용)"""
+        if zoom is not None:
+            # 줌 레벨 허용 오차는 위도에 따라 달라짐 (트립 GPS 범위 중심 위도 사용)
+            meta = self.trip_index.meta(path)
+            bounds = meta.bounds if meta else None
+            tolerance = zoom_tolerance(zoom, (bounds[0] + bounds[2]) / 2 if bounds else 0.0)
+        cache_path = self.cache_path(path, fmt, tolerance) if self.cache else None
+        if cache_path and os.path.exists(cache_path):
+            export_cache_hits.inc()
+            return self._read_cache(cache_path)
+        export_cache_misses.inc()
+        track = load_track(self.trip_index.read(path))
+        samples = len(track)
+        track = simplify(track, tolerance)
+        if fmt == 'kml':
+            chunks = kml_chunks(track, properties.get('id', ''), start_utc)
+        else:
+            properties = dict(properties, points=len(track), samples=samples,
+                              distance=int(track.distance()), tolerance=round(tolerance, 1))
+            chunks = geojson_chunks(track, properties)
+        return self._write_cache(cache_path, chunks) if cache_path else chunks
+
+    @staticmethod
+    def _read_cache(cache_path: str) -> Iterator[str]:
+        with open(cache_path, encoding='utf-8') as f:
+            while True:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+
+    @staticmethod
+    def _write_cache(cache_path: str, chunks: Iterator[str]) -> Iterator[str]:
+        """출력하면서 캐시 파일 기록, 끝까지 출력된 경우에만 캐시로 교체"""
+        tmp = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            f = open(tmp, 'w', encoding='utf-8')
+        except OSError as e:
+            logger.warning(f"트립 내보내기 캐시 생성 실패: {cache_path} ({e})")
+            yield from chunks
+            return
+        complete = False
+        try:
+            with f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if complete:
+                os.replace(tmp, cache_path)
+                _remove_stale(cache_path)
+            else:
+                os.unlink(tmp)
+
+
+def _remove_stale(cache_path: str):
+    """같은 트립/형식/허용 오차의 이전 캐시 파일 삭제"""
+    directory, name = os.path.split(cache_path)
+    tripid, _, tolerance, fmt = name.split('.')
+    for other in os.listdir(directory):
+        parts = other.split('.')
+        if other != name and len(parts) == 4 and parts[0] == tripid and parts[2:] == [tolerance, fmt]:
+            try:
+                os.unlink(os.path.join(directory, other))
+            except OSError:
+                pass
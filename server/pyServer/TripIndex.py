@@ -0,0 +1,449 @@
+import re
+import os
+import json
+import mmap
+import time
+import bisect
+import logging
+import calendar
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from PayloadParser import parse_payload, decode_value
+from TripWriter import PID_GPS_LATITUDE, PID_GPS_LONGITUDE, is_trip_id
+from TripArchive import ARCHIVE_SUFFIX, ArchiveReader, archive_path, value_texts
+
+logger = logging.getLogger(__name__)
+
+# 인덱스 파일 형식 버전 (바뀌면 다시 생성)
+INDEX_REVISION = 2
+INDEX_SUFFIX = '.idx'
+
+
+def trip_file(data_dir: str, devid: str, tripid: str) -> str:
+    """트립 ID 의 데이터 파일 경로 (C processTripData)"""
+    return os.path.join(data_dir, devid, tripid[:4], tripid[4:6], tripid[6:8], tripid + '.txt')
+
+
+def trip_utc(tripid: str) -> int:
+    """트립 시작 시각 (UTC epoch 초)"""
+    return calendar.timegm(time.strptime(tripid, '%Y%m%d-%H%M%S'))
+
+
+class TripMeta:
+    """트립 메타 정보와 희소 인덱스 (N 줄마다 (이전 최대 ts, 바이트 오프셋), 블록별 최소 ts)
+
+    파일이 커지면 마지막으로 인덱싱한 위치부터 이어서 갱신합니다.
+    """
+
+    __slots__ = ('size', 'mtime', 'indexed', 'lines', 'samples', 'first_ts', 'last_ts', 'max_ts',
+                 'bounds', 'pids', 'index_ts', 'index_pos', 'index_min', 'lock')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.size = 0
+        self.mtime = 0
+        self.indexed = 0  # 인덱싱이 끝난 바이트 위치 (완전한 줄 기준)
+        self.lines = 0
+        self.samples = 0
+        self.first_ts = 0
+        self.last_ts = 0
+        self.max_ts = 0
+        self.bounds: Optional[List[float]] = None  # [min_lat, min_lng, max_lat, max_lng]
+        self.pids: Dict[int, List[int]] = {}  # pid -> [첫 줄 오프셋, 마지막 줄 끝 오프셋, 샘플 수]
+        self.index_ts: List[int] = []
+        self.index_pos: List[int] = []
+        self.index_min: List[Optional[int]] = []  # 블록 안의 최소 ts (샘플이 없으면 None)
+
+    @property
+    def duration(self) -> int:
+        """트립 길이 (ms, 디바이스 ts 기준)"""
+        return self.last_ts - self.first_ts if self.last_ts > self.first_ts else 0
+
+    def info(self) -> dict:
+        return {
+            'size': self.size,
+            'duration': self.duration,
+            'samples': self.samples,
+            'start': self.first_ts,
+            'end': self.last_ts,
+            'bounds': self.bounds,
+            'pids': sorted(self.pids),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'rev': INDEX_REVISION, 'size': self.size, 'mtime': self.mtime, 'indexed': self.indexed,
+            'lines': self.lines, 'samples': self.samples, 'first_ts': self.first_ts,
+            'last_ts': self.last_ts, 'max_ts': self.max_ts, 'bounds': self.bounds,
+            'pids': {f'{pid:X}': v for pid, v in self.pids.items()},
+            'index': [self.index_ts, self.index_pos, self.index_min],
+        }, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text: str) -> Optional['TripMeta']:
+        obj = json.loads(text)
+        if obj.get('rev') != INDEX_REVISION:
+            return None
+        meta = cls()
+        meta.size = obj['size']
+        meta.mtime = obj['mtime']
+        meta.indexed = obj['indexed']
+        meta.lines = obj['lines']
+        meta.samples = obj['samples']
+        meta.first_ts = obj['first_ts']
+        meta.last_ts = obj['last_ts']
+        meta.max_ts = obj['max_ts']
+        meta.bounds = obj['bounds']
+        meta.pids = {int(pid, 16): v for pid, v in obj['pids'].items()}
+        meta.index_ts, meta.index_pos, meta.index_min = obj['index']
+        return meta
+
+    def seek(self, begin: int) -> int:
+        """ts >= begin 인 첫 레코드 이전의 인덱스 오프셋 (이진 탐색)"""
+        i = bisect.bisect_left(self.index_ts, begin) - 1
+        return self.index_pos[i] if i >= 0 else 0
+
+    def stop(self, end: int) -> Optional[int]:
+        """ts <= end 인 레코드가 더 없는 인덱스 오프셋 (마지막 블록까지 읽어야 하면 None)
+
+        줄이 ts 순서가 아닐 수 있으므로 (늦게 도착한 데이터), 최소 ts 가 end 이하인 마지막
+        블록 다음부터 건너뜁니다.
+        """
+        for i in range(len(self.index_min) - 1, -1, -1):
+            low = self.index_min[i]
+            if low is not None and low <= end:
+                return self.index_pos[i + 1] if i + 1 < len(self.index_pos) else None
+        return 0
+
+
+class TripIndex:
+    """트립 데이터 파일 조회 (희소 인덱스 사이드카, 디바이스별 트립 목록 캐시)"""
+
+    def __init__(self, data_dir: str, interval: int = 64, max_cached: int = 1024):
+        self.data_dir = data_dir
+        self.interval = max(interval, 1)
+        self.max_cached = max_cached
+        self.lock = threading.Lock()
+        self.metas: 'OrderedDict[str, TripMeta]' = OrderedDict()
+        self.archives: 'OrderedDict[str, Tuple[int, ArchiveReader, TripMeta]]' = OrderedDict()
+        self.days: Dict[str, Tuple[int, List[str]]] = {}  # 날짜 디렉토리 -> (mtime, 트립 ID 목록)
+
+    # 메타 정보 / 인덱스
+
+    def source(self, path: str) -> Optional[str]:
+        """트립 데이터가 있는 파일 (트립 파일, 변환 후에는 아카이브)"""
+        if os.path.exists(path):
+            return path
+        archive = archive_path(path)
+        return archive if os.path.exists(archive) else None
+
+    def forget(self, path: str):
+        """아카이브로 변환된 트립 파일의 캐시 삭제"""
+        with self.lock:
+            self.metas.pop(path, None)
+
+    def meta(self, path: str) -> Optional[TripMeta]:
+        """트립 파일 메타 정보 (파일이 커졌으면 추가된 부분만 인덱싱)"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            archive = self._archive(path)
+            return archive[2] if archive else None
+        with self.lock:
+            meta = self.metas.get(path)
+            if meta is None:
+                meta = self._load(path) or TripMeta()
+                self.metas[path] = meta
+                while len(self.metas) > self.max_cached:
+                    self.metas.popitem(last=False)
+            self.metas.move_to_end(path)
+        with meta.lock:
+            if meta.size != st.st_size or meta.mtime != st.st_mtime_ns:
+                if st.st_size < meta.indexed:
+                    # 파일이 줄어들었으면 처음부터 다시 인덱싱
+                    meta.reset()
+                self._update(path, meta, st)
+        return meta
+
+    def _archive(self, path: str) -> Optional[Tuple[int, ArchiveReader, TripMeta]]:
+        """아카이브 읽기 객체와 헤더의 메타 정보 (아카이브 mtime 별 캐시)"""
+        archive = archive_path(path)
+        try:
+            mtime = os.stat(archive).st_mtime_ns
+        except OSError:
+            return None
+        with self.lock:
+            cached = self.archives.get(archive)
+            if cached and cached[0] == mtime:
+                self.archives.move_to_end(archive)
+                return cached
+        try:
+            reader = ArchiveReader(archive)
+        except (OSError, ValueError) as e:
+            logger.warning(f"트립 아카이브 읽기 실패: {archive} ({e})")
+            return None
+        header = reader.header
+        meta = TripMeta()
+        meta.size = header['size']
+        meta.lines = header.get('lines', 0)
+        meta.samples = header['samples']
+        meta.first_ts = header['start']
+        meta.last_ts = header['end']
+        meta.bounds = header['bounds']
+        meta.pids = {pid: [0, 0, column['count']] for pid, column in reader.pids.items()}
+        cached = (mtime, reader, meta)
+        with self.lock:
+            self.archives[archive] = cached
+            while len(self.archives) > self.max_cached:
+                self.archives.popitem(last=False)
+        return cached
+
+    def _load(self, path: str) -> Optional[TripMeta]:
+        try:
+            with open(path[:-4] + INDEX_SUFFIX) as f:
+                return TripMeta.from_json(f.read())
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save(self, path: str, meta: TripMeta):
+        index_path = path[:-4] + INDEX_SUFFIX
+        tmp = index_path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                f.write(meta.to_json())
+            os.replace(tmp, index_path)
+        except OSError as e:
+            logger.warning(f"트립 인덱스 저장 실패: {index_path} ({e})")
+
+    def _update(self, path: str, meta: TripMeta, st: os.stat_result):
+        with open(path, 'rb') as f:
+            f.seek(meta.indexed)
+            chunk = f.read(st.st_size - meta.indexed)
+        base = pos = meta.indexed
+        interval = self.interval
+        pids = meta.pids
+        bounds = meta.bounds
+        start = 0
+        end = chunk.find(b'\n')
+        while end >= 0:
+            line_end = base + end + 1
+            if meta.lines % interval == 0:
+                meta.index_ts.append(meta.max_ts)
+                meta.index_pos.append(pos)
+                meta.index_min.append(None)
+            result = parse_payload(chunk[start:end].decode('latin-1'))
+            if len(result):
+                low = min(result.ts)
+                if meta.index_min[-1] is None or low < meta.index_min[-1]:
+                    meta.index_min[-1] = low
+                if not meta.first_ts:
+                    meta.first_ts = result.ts[0]
+                meta.last_ts = result.last_ts
+                meta.max_ts = max(meta.max_ts, max(result.ts))
+                meta.samples += len(result)
+                lat = lng = None
+                for i, pid in enumerate(result.pid):
+                    entry = pids.get(pid)
+                    if entry is None:
+                        pids[pid] = [pos, line_end, 1]
+                    else:
+                        entry[1] = line_end
+                        entry[2] += 1
+                    if pid == PID_GPS_LATITUDE:
+                        lat = result.number(i)
+                    elif pid == PID_GPS_LONGITUDE:
+                        lng = result.number(i)
+                if isinstance(lat, (int, float)) and isinstance(lng, (int, float)) and (lat or lng):
+                    if bounds is None:
+                        bounds = [lat, lng, lat, lng]
+                    else:
+                        bounds = [min(bounds[0], lat), min(bounds[1], lng),
+                                  max(bounds[2], lat), max(bounds[3], lng)]
+            meta.lines += 1
+            pos = line_end
+            start = end + 1
+            end = chunk.find(b'\n', start)
+        meta.bounds = bounds
+        meta.indexed = pos
+        meta.size = st.st_size
+        meta.mtime = st.st_mtime_ns
+        self._save(path, meta)
+
+    # 데이터 조회
+
+    def read(self, path: str, pid: int = 0, begin: int = 0, end: int = 0) -> Iterator[Tuple[int, int, str]]:
+        """(ts, pid, value) 레코드, 인덱스로 시작 위치를 찾아 mmap 범위만 읽음"""
+        if not os.path.exists(path):
+            yield from self._read_archive(path, pid, begin, end)
+            return
+        meta = self.meta(path)
+        if meta is None or not meta.indexed:
+            return
+        lo, hi = 0, meta.indexed
+        if pid:
+            entry = meta.pids.get(pid)
+            if entry is None:
+                return
+            lo, hi = entry[0], entry[1]
+        if begin:
+            lo = max(lo, meta.seek(begin))
+        if end:
+            stop = meta.stop(end)
+            if stop is not None:
+                hi = min(hi, stop)
+        if lo >= hi:
+            return
+        # 파싱 전 PID 항목이 없는 줄 건너뛰기 (소문자, 앞자리 0, PID=값 형식 포함)
+        pid_item = re.compile(rf'(?:^|,)0*{pid:X}[:=]', re.IGNORECASE) if pid else None
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = lo
+            while pos < hi:
+                line_end = mm.find(b'\n', pos, hi)
+                if line_end < 0:
+                    break
+                line = mm[pos:line_end].decode('latin-1')
+                pos = line_end + 1
+                if pid_item and not pid_item.search(line):
+                    continue
+                result = parse_payload(line)
+                for ts, item_pid, value in result:
+                    if begin and ts < begin:
+                        continue
+                    if end and ts > end:
+                        continue
+                    if not pid or item_pid == pid:
+                        yield ts, item_pid, value
+
+    def _read_archive(self, path: str, pid: int, begin: int, end: int) -> Iterator[Tuple[int, int, str]]:
+        archive = self._archive(path)
+        if archive is None:
+            return
+        reader = archive[1]
+        pids = [pid] if pid else sorted(reader.pids)
+        columns = []
+        for item_pid in pids:
+            ts, values = reader.column(item_pid, begin, end)
+            if len(ts):
+                columns.append((ts, np.full(len(ts), item_pid, dtype=np.int32), values))
+        if not columns:
+            return
+        if len(columns) == 1:
+            ts, pid_array, values = columns[0]
+            texts = value_texts(values)
+            order = range(len(ts))
+        else:
+            # 모든 PID 를 ts 순서로 합침 (같은 ts 안에서는 PID 순서)
+            ts = np.concatenate([c[0] for c in columns])
+            pid_array = np.concatenate([c[1] for c in columns])
+            texts = [text for c in columns for text in value_texts(c[2])]
+            order = np.lexsort((pid_array, ts)).tolist()
+        ts = ts.tolist()
+        pid_array = pid_array.tolist()
+        for i in order:
+            yield ts[i], pid_array[i], texts[i]
+
+    def text(self, path: str) -> Optional[Iterator[bytes]]:
+        """아카이브로 변환된 트립의 원본 파일 내용 (줄 구성이 없는 이전 아카이브는 None)"""
+        archive = self._archive(path)
+        if archive is None or not archive[1].header.get('layout'):
+            return None
+        return archive[1].text_chunks()
+
+    def column(self, path: str, pid: int, begin: int = 0, end: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """PID 컬럼 (ts 배열, 값 배열), 숫자가 아닌 값은 NaN
+
+        원본 트립 파일이 남아 있어도 (TRIP_ARCHIVE_KEEP_TEXT) 최신 아카이브가 있으면 컬럼을 그대로 사용합니다.
+        """
+        archive = self._archive(path)
+        if archive is not None and not _text_newer(path, archive[0]):
+            ts, values = archive[1].column(pid, begin, end)
+            if values.dtype == object:
+                values = number_array(values.tolist())
+            return ts, values
+        if not os.path.exists(path):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        ts, texts = [], []
+        for item_ts, _, value in self.read(path, pid, begin, end):
+            ts.append(item_ts)
+            texts.append(value)
+        return np.array(ts, dtype=np.int64), number_array(texts)
+
+    # 트립 목록
+
+    def history(self, devid: str, begin: datetime.datetime, end: datetime.datetime) -> List[dict]:
+        """기간 내 트립 목록 (C uhHistory), 날짜 디렉토리 mtime 이 같으면 캐시된 목록 사용"""
+        begin_id = begin.strftime('%Y%m%d-%H%M%S')
+        end_id = end.strftime('%Y%m%d-%H%M%S')
+        trips = []
+        day = begin.date()
+        while day <= end.date():
+            for tripid in self._day_trips(devid, day):
+                if begin_id <= tripid <= end_id:
+                    path = trip_file(self.data_dir, devid, tripid)
+                    meta = self.meta(path)
+                    if meta is None or not meta.samples:
+                        continue
+                    key = trip_utc(tripid)
+                    trips.append({
+                        'id': tripid,
+                        'key': key,
+                        'utc': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(key)),
+                        'size': meta.size,
+                        'duration': meta.duration,
+                        'samples': meta.samples,
+                    })
+            day += datetime.timedelta(days=1)
+        return trips
+
+    def _day_trips(self, devid: str, day: datetime.date) -> List[str]:
+        path = os.path.join(self.data_dir, devid, f'{day.year:04d}', f'{day.month:02d}', f'{day.day:02d}')
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return []
+        cached = self.days.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        tripids = sorted({os.path.splitext(name)[0] for name in os.listdir(path)
+                          if name.endswith(('.txt', ARCHIVE_SUFFIX)) and is_trip_id(os.path.splitext(name)[0])})
+        self.days[path] = (mtime, tripids)
+        return tripids
+
+
+def _text_newer(path: str, archive_mtime: int) -> bool:
+    """아카이브 변환 후 원본 트립 파일이 바뀌었는지"""
+    try:
+        return os.stat(path).st_mtime_ns > archive_mtime
+    except OSError:
+        return False
+
+
+def number_array(texts: List[str]) -> np.ndarray:
+    """값 문자열 -> float 배열 (다중 값은 2차원, 숫자가 아니면 NaN)"""
+    numbers = [decode_value(text) for text in texts]
+    width = max((len(n) if isinstance(n, tuple) else 1 for n in numbers), default=1)
+    array = np.full((len(numbers), width), np.nan)
+    for i, number in enumerate(numbers):
+        if isinstance(number, tuple):
+            array[i, :len(number)] = number
+        elif number is not None:
+            array[i, 0] = number
+    return array[:, 0] if width == 1 else array
+
+
+def value_json(pid: int, value: str):
+    """/api/data 값 (C uhData: 단일 값은 PID 0x100 이상이면 정수, 다중 값은 정수 배열)"""
+    number = decode_value(value)
+    if isinstance(number, tuple):
+        return [int(v) for v in number[:3]]
+    if number is None:
+        return None
+    return int(number) if pid >= 0x100 else round(float(number), 2)
@@ -0,0 +1,235 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from Metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# C teleserver.h 와 동일 (ms)
+SESSION_GAP = 15 * 60 * 1000
+
+# C PID_GPS_LATITUDE / LONGITUDE / ALTITUDE
+PID_GPS_LATITUDE = 0xA
+PID_GPS_LONGITUDE = 0xB
+PID_GPS_ALTITUDE = 0xC
+
+trip_files_opened = metrics.counter('trip_files_opened_total', '새로 만든 트립 데이터 파일 수')
+trip_bytes_written = metrics.counter('trip_bytes_written_total', '트립 데이터 파일에 기록한 바이트 수')
+trip_flushes = metrics.counter('trip_flushes_total', '트립 데이터 파일 기록(write) 횟수')
+trip_write_errors = metrics.counter('trip_write_errors_total', '트립 데이터 파일 기록 실패 수')
+
+
+def is_trip_id(tripid: str) -> bool:
+    """YYYYMMDD-HHMMSS 형식 트립 ID 인지 확인"""
+    return (len(tripid) == 15 and tripid[8] == '-'
+            and tripid[:8].isdigit() and tripid[9:].isdigit())
+
+
+def trip_path(data_dir: str, devid: str, tick: int) -> str:
+    """C createDataFile 경로: <data_dir>/<devid>/YYYY/MM/DD/YYYYMMDD-HHMMSS.txt (UTC)"""
+    t = time.gmtime(tick / 1000)
+    return os.path.join(data_dir, devid, time.strftime('%Y', t), time.strftime('%m', t),
+                        time.strftime('%d', t), time.strftime('%Y%m%d-%H%M%S.txt', t))
+
+
+class _Trip:
+    """열린 트립 (파일 경로, 버퍼, 파일 핸들)"""
+
+    __slots__ = ('path', 'buffer', 'size', 'handle', 'last_tick', 'lock')
+
+    def __init__(self, path: str, tick: int):
+        self.path = path
+        self.buffer: List[bytes] = []
+        self.size = 0
+        self.handle = None
+        self.last_tick = tick
+        self.lock = threading.Lock()  # 파일 기록 순서 보장
+
+
+class TripWriter:
+    """디바이스별 트립 데이터 파일 기록 (C teleserver 디렉토리 구조)
+
+    페이로드는 메모리 버퍼에 모았다가 백그라운드 스레드가 크기/시간 기준으로
+    파일당 한 번의 write 로 기록합니다. 열린 파일 수는 max_open 으로 제한 (LRU).
+    """
+
+    def __init__(self, data_dir: str, buffer_size: int = 64 * 1024, flush_interval: float = 2.0,
+                 max_open: int = 256, session_gap: int = SESSION_GAP):
+        self.data_dir = data_dir
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_open = max(max_open, 1)
+        self.session_gap = session_gap
+        self.lock = threading.Lock()
+        self.trips: Dict[str, _Trip] = {}
+        self.handles: 'OrderedDict[str, _Trip]' = OrderedDict()  # 열린 파일 (LRU 순서)
+        self.flush_event = threading.Event()
+        self.thread = None
+        self.running = False
+        self.on_close: Optional[Callable[[str], None]] = None  # 트립 파일이 닫힌 뒤 호출 (경로)
+
+    def start(self):
+        """기록 스레드 시작"""
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        logger.info(f"트립 데이터 파일 기록 시작 ({self.data_dir}, open={self.max_open})")
+
+    def stop(self):
+        """기록 스레드 중지 (남은 데이터 기록 후 파일 닫기)"""
+        self.running = False
+        self.flush_event.set()
+        if self.thread:
+            self.thread.join(timeout=10)
+            self.thread = None
+        with self.lock:
+            devids = list(self.trips)
+        for devid in devids:
+            self.close_trip(devid)
+
+    def open_trip(self, channel, tick: Optional[int] = None) -> str:
+        """새 트립 파일 시작 (로그인/세션 간격 초과), 이전 트립은 닫음"""
+        tick = tick or int(time.time() * 1000)
+        self.close_trip(channel.devid)
+        trip = _Trip(trip_path(self.data_dir, channel.devid, tick), tick)
+        # 빈 파일이면 마지막 GPS 위치를 첫 줄로 기록 (C createDataFile)
+        if not os.path.exists(trip.path):
+            line = self._gps_line(channel)
+            if line:
+                trip.buffer.append(line)
+                trip.size = len(line)
+        with self.lock:
+            self.trips[channel.devid] = trip
+        trip_files_opened.inc()
+        logger.info(f"트립 파일 시작: {channel.devid} {trip.path}")
+        return trip.path
+
+    def close_trip(self, devid: str):
+        """트립 종료 (로그아웃), 버퍼 기록 후 파일 닫기"""
+        with self.lock:
+            trip = self.trips.pop(devid, None)
+        if trip:
+            self._flush(devid, trip, close=True)
+            if self.on_close and os.path.exists(trip.path):
+                self.on_close(trip.path)
+
+    def write(self, channel, payload: str, tick: Optional[int] = None):
+        """페이로드 한 줄 추가 (버퍼에만 추가, 파일 기록은 기록 스레드에서)"""
+        tick = tick or int(time.time() * 1000)
+        trip = self.trips.get(channel.devid)
+        if trip is None or tick - trip.last_tick > self.session_gap:
+            self.open_trip(channel, tick)
+            trip = self.trips[channel.devid]
+        line = payload.encode('latin-1', 'replace') + b'\n'
+        with trip.lock:
+            trip.buffer.append(line)
+            trip.size += len(line)
+            trip.last_tick = tick
+            full = trip.size >= self.buffer_size
+        if full:
+            self.flush_event.set()
+
+    def pending(self) -> int:
+        """파일 기록을 기다리는 줄 수 (모든 트립 합)"""
+        with self.lock:
+            trips = list(self.trips.values())
+        return sum(len(trip.buffer) for trip in trips)
+
+    def current(self, devid: str) -> Optional[str]:
+        """현재 기록 중인 트립 파일 경로"""
+        trip = self.trips.get(devid)
+        return trip.path if trip else None
+
+    def flush(self):
+        """모든 트립 버퍼 기록"""
+        with self.lock:
+            trips = list(self.trips.items())
+        for devid, trip in trips:
+            if trip.size:
+                self._flush(devid, trip)
+
+    def _loop(self):
+        while self.running:
+            self.flush_event.wait(self.flush_interval)
+            self.flush_event.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"트립 파일 기록 오류: {e}")
+
+    @staticmethod
+    def _gps_line(channel) -> bytes:
+        data = channel.data
+        lat = data.get(PID_GPS_LATITUDE)
+        lng = data.get(PID_GPS_LONGITUDE)
+        if not (lat and lat.ts and lng and lng.ts):
+            return b''
+        alt = data.get(PID_GPS_ALTITUDE)
+        line = (f"{PID_GPS_LATITUDE:X}:{lat.value},{PID_GPS_LONGITUDE:X}:{lng.value},"
+                f"{PID_GPS_ALTITUDE:X}:{alt.value if alt else ''}\n")
+        return line.encode('latin-1', 'replace')
+
+    def _flush(self, devid: str, trip: _Trip, close: bool = False):
+        with trip.lock:
+            chunk = b''.join(trip.buffer)
+            trip.buffer = []
+            trip.size = 0
+            if chunk:
+                try:
+                    handle = trip.handle
+                    if handle:
+                        with self.lock:
+                            if devid in self.handles:
+                                self.handles.move_to_end(devid)
+                    else:
+                        handle = self._open_handle(devid, trip)
+                    handle.write(chunk)
+                    trip_flushes.inc()
+                    trip_bytes_written.inc(len(chunk))
+                except OSError as e:
+                    trip_write_errors.inc()
+                    logger.error(f"트립 파일 기록 실패: {trip.path} ({e})")
+            if close and trip.handle:
+                self._close_handle(devid, trip)
+
+    def _open_handle(self, devid: str, trip: _Trip):
+        os.makedirs(os.path.dirname(trip.path), exist_ok=True)
+        # 버퍼링은 직접 하므로 파일은 비버퍼 모드로 열기
+        trip.handle = open(trip.path, 'ab', buffering=0)
+        evict = []
+        with self.lock:
+            self.handles[devid] = trip
+            self.handles.move_to_end(devid)
+            while len(self.handles) > self.max_open:
+                evict.append(self.handles.popitem(last=False))
+        busy = []
+        for old_devid, old in evict:
+            # 오래 쓰지 않은 파일 핸들만 닫음 (트립은 유지, 다음 기록 시 다시 열기)
+            if old is trip or not old.lock.acquire(blocking=False):
+                busy.append((old_devid, old))
+                continue
+            try:
+                if old.handle:
+                    old.handle.close()
+                    old.handle = None
+            finally:
+                old.lock.release()
+        if busy:
+            # 기록 중이라 닫지 못한 핸들은 LRU 맨 앞에 되돌려 다음에 다시 닫기 시도
+            with self.lock:
+                for old_devid, old in busy:
+                    if old.handle and old_devid not in self.handles:
+                        self.handles[old_devid] = old
+                        self.handles.move_to_end(old_devid, last=False)
+        return trip.handle
+
+    def _close_handle(self, devid: str, trip: _Trip):
+        trip.handle.close()
+        trip.handle = None
+        with self.lock:
+            if self.handles.get(devid) is trip:
+                del self.handles[devid]
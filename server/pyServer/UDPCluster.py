@@ -0,0 +1,241 @@
+import time
+import queue
+import signal
+import logging
+import threading
+import multiprocessing
+from dataclasses import fields
+
+from UDPServer import UDPServer, UDP_MODE_ASYNCIO
+from Metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 워커가 보내지 않는 필드 (코디네이터가 관리하거나 별도로 전달)
+LOCAL_FIELDS = ('data', 'cache', 'cmd_count', 'version')
+
+
+class _CommandRelay:
+    """워커가 받은 명령 응답(EV=6)을 코디네이터의 명령 테이블로 바로 전달"""
+
+    def __init__(self, index, outbox):
+        self.index = index
+        self.outbox = outbox
+
+    def respond(self, devid, token, message):
+        self.outbox.put((self.index, [], None, [(devid, token, message)]))
+        return True
+
+
+class UDPCluster:
+    """SO_REUSEPORT 멀티 프로세스 UDP 수신 (디바이스별 워커 고정)"""
+
+    def __init__(self, port=33000, hub=None, workers=2, mode=UDP_MODE_ASYNCIO, rcvbuf=0,
+                 publish_interval=0.2, server_options=None):
+        self.port = port
+        self.hub = hub
+        self.workers = workers
+        self.mode = mode
+        self.rcvbuf = rcvbuf
+        self.server_options = server_options or {}  # 워커의 UDPServer 인자 (처리 대기열 설정)
+        self.publish_interval = publish_interval
+        self.context = multiprocessing.get_context('fork')
+        self.processes = []
+        self.inboxes = []
+        self.outbox = None
+        self.stop_event = None
+        self.merge_thread = None
+        self.running = False
+        self.shard_of = {}  # 디바이스 ID -> 워커 번호
+
+    def start(self, port=None):
+        """워커 프로세스 시작"""
+        if port:
+            self.port = port
+        try:
+            self.outbox = self.context.Queue()
+            self.stop_event = self.context.Event()
+            for index in range(self.workers):
+                inbox = self.context.Queue()
+                process = self.context.Process(target=self._worker_main, args=(index, inbox),
+                                               name=f"udp-worker-{index}", daemon=True)
+                process.start()
+                self.inboxes.append(inbox)
+                self.processes.append(process)
+            self.running = True
+            self.merge_thread = threading.Thread(target=self._merge_loop, daemon=True)
+            self.merge_thread.start()
+            logger.info(f"UDP 워커 {self.workers}개가 포트 {self.port}에서 시작되었습니다. (SO_REUSEPORT)")
+            return True
+        except Exception as e:
+            logger.error(f"UDP 워커 시작 실패: {e}")
+            self.stop()
+            return False
+
+    def stop(self):
+        """워커 프로세스 중지"""
+        if self.stop_event:
+            self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.running = False
+        if self.merge_thread:
+            self.merge_thread.join(timeout=5)
+            self.merge_thread = None
+        self.processes = []
+        self.inboxes = []
+        logger.info("UDP 워커가 중지되었습니다.")
+
+    def send_command(self, channel, command, token=None):
+        """채널을 담당하는 워커를 통해 명령 전송"""
+        index = self.shard_of.get(channel.devid)
+        if index is None or not channel.udp_peer:
+            logger.error("UDP 피어 정보가 없습니다.")
+            return False
+        if token is None:
+            token = channel.cmd_count + 1
+            channel.cmd_count += 1
+        self.inboxes[index].put(('command', channel.devid, command, token))
+        channel.server_data_tick = int(time.time() * 1000)
+        return token
+
+    def forget(self, channel):
+        """제거된 채널을 담당 워커에서도 제거"""
+        index = self.shard_of.pop(channel.devid, None)
+        if index is not None and index < len(self.inboxes):
+            self.inboxes[index].put(('forget', channel.devid, None, None))
+
+    # 워커 프로세스
+
+    def _worker_main(self, index, inbox):
+        """워커 프로세스 메인 (fork 로 서버 상태를 물려받음)"""
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        hub = self.hub
+        metrics.reset()
+        # DB 저장은 코디네이터가 담당, OBD 적재는 워커별 연결 사용
+        hub.db.write_enabled = False
+        if hub.db.engine is not None:
+            hub.db.engine.dispose(close=False)
+        if hub.config['obd_loader']:
+            hub.obd_loader.start()
+        # 트립 파일은 디바이스를 담당하는 워커가 기록
+        if hub.trips:
+            hub.trips.start()
+        # 명령 응답은 코디네이터의 명령 테이블로 전달
+        hub.commands = _CommandRelay(index, self.outbox)
+        hub.channels.next_num = index + 1
+        hub.channels.num_step = self.workers
+        # 만료 처리는 코디네이터가 하고 제거할 채널을 알려줌
+        hub.channels.expiry = None
+
+        server = UDPServer(self.port, hub, mode=self.mode, rcvbuf=self.rcvbuf, reuse_port=True,
+                           **self.server_options)
+        hub.udp_server = server
+        if not server.start():
+            return
+
+        published = {}
+        while not self.stop_event.is_set():
+            self._worker_commands(server, inbox, published)
+            self._worker_publish(index, published)
+            self.stop_event.wait(self.publish_interval)
+
+        server.stop()
+        self._worker_publish(index, published)
+        hub.obd_loader.stop()
+        if hub.trips:
+            hub.trips.stop()
+
+    def _worker_commands(self, server, inbox, published):
+        while True:
+            try:
+                kind, devid, command, token = inbox.get_nowait()
+            except queue.Empty:
+                return
+            channel = self.hub.channels.find_by_devid(devid)
+            if not channel:
+                continue
+            if kind == 'forget':
+                self.hub.channels.remove(channel.id)
+                server.forget(channel)
+                published.pop(channel.id, None)
+            else:
+                server.send_command(channel, command, token)
+
+    def _worker_publish(self, index, published):
+        """변경된 채널 상태와 메트릭을 코디네이터로 전송"""
+        snapshots = []
+        for channel in self.hub.channels.values():
+            key = (channel.recv_count, channel.tx_count, channel.flags, channel.server_data_tick,
+                   channel.server_ping_tick, channel.cache.total)
+            if published.get(channel.id) == key and not channel.cache.journal:
+                continue
+            state = {f.name: getattr(channel, f.name) for f in fields(channel) if f.name not in LOCAL_FIELDS}
+            state['data'] = {pid: (d.ts, d.value) for pid, d in list(channel.data.items())}
+            # 샘플 버퍼는 변경 기록(추가/늦은 삽입/초기화)으로 복제 (처음에는 버퍼 전체)
+            if channel.cache.journal is None:
+                state['samples'] = channel.cache.start_journal()
+            else:
+                state['samples'] = channel.cache.drain_journal()
+            snapshots.append(state)
+            published[channel.id] = key
+        self.outbox.put((index, snapshots, metrics.snapshot(), []))
+
+    # 코디네이터
+
+    def _merge_loop(self):
+        """워커 채널 상태를 API 용 채널 저장소에 병합"""
+        while self.running or not self.outbox.empty():
+            try:
+                index, snapshots, snapshot, acks = self.outbox.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if snapshot:
+                metrics.merge_remote(index, snapshot)
+            for devid, token, message in acks:
+                self.hub.commands.respond(devid, token, message)
+            for state in snapshots:
+                try:
+                    self._merge(index, state)
+                except Exception as e:
+                    logger.error(f"채널 상태 병합 실패: {e}")
+
+    def _merge(self, index, state):
+        hub = self.hub
+        data = state.pop('data')
+        samples = state.pop('samples')
+        channel = hub.channels.get(state['id']) or hub.channels.find_by_devid(state['devid'])
+        with hub.channel_lock:
+            if channel is None:
+                channel = hub.ChannelData(id=state['id'], devid=state['devid'], num=state['num'],
+                                          cache_size=state['cache_size'])
+                hub.channels.add(channel)
+            for name, value in state.items():
+                if name in ('id', 'num', 'vin'):
+                    continue
+                setattr(channel, name, value)
+            if state['vin'] != channel.vin:
+                hub.channels.set_vin(channel, state['vin'])
+            # 값이 같은 PID 는 기존 객체(버전) 유지
+            old = channel.data
+            changed = []
+            merged = {}
+            for pid, (ts, value) in data.items():
+                pid_data = old.get(pid)
+                if pid_data is None or pid_data.ts != ts or pid_data.value != value:
+                    pid_data = hub.PIDData(ts=ts, value=value)
+                    changed.append(pid)
+                merged[pid] = pid_data
+            channel.data = merged
+        if samples:
+            channel.cache.apply_journal(samples)
+        self.shard_of[channel.devid] = index
+        hub.touch_channel(channel, changed)
+        hub.db.save_channel(channel)
+        if len(hub.stream):
+            latest = {pid: (pid, ts, value) for kind, batch in samples for ts, pid, value in batch}
+            hub.stream.publish(channel, latest.values())
@@ -5,6 +5,7 @@ import datetime
 import threading
 import socket
 import struct
+import asyncio
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify, render_template, send_from_directory
 from flask_cors import CORS
@@ -20,78 +21,242 @@ from dataclasses import dataclass, asdict
 from typing import Dict, List, Optional
 import uuid
 
+from Metrics import metrics
+from PacketWindow import PacketWindow, payload_tick, PACKET_DUPLICATE, PACKET_LATE
+from IngestPipeline import IngestPipeline, POLICY_DROP_NEWEST
+
 logger = logging.getLogger(__name__)
 
+# 수신 경로 메트릭
+udp_received = metrics.counter('udp_datagrams_received_total', 'UDP 수신 데이터그램 수')
+udp_bad_checksum = metrics.counter('udp_checksum_errors_total', '체크섬 오류로 거부된 데이터그램 수')
+udp_malformed = metrics.counter('udp_malformed_total', '형식 오류 또는 채널 할당 실패로 거부된 데이터그램 수')
+udp_dropped = metrics.counter('udp_datagrams_dropped_total', '처리 대기열 초과로 폐기된 데이터그램 수')
+udp_send_errors = metrics.counter('udp_send_errors_total', 'UDP 응답/명령 전송 실패 수')
+udp_duplicates = metrics.counter('udp_duplicates_total', '재전송 등으로 중복되어 파싱 전에 폐기된 데이터 데이터그램 수')
+udp_reordered = metrics.counter('udp_reordered_total', '늦게 도착해 시간 순서 위치에 삽입된 데이터 데이터그램 수')
+
+# UDP 이벤트 상수
+EVENT_LOGIN = 1
+EVENT_LOGOUT = 2
+EVENT_SYNC = 3
+EVENT_RECONNECT = 4
+EVENT_COMMAND = 5
+EVENT_ACK = 6
+EVENT_PING = 7
+
+UDP_MODE_THREAD = 'thread'
+UDP_MODE_ASYNCIO = 'asyncio'
+
+MAX_DATAGRAM_SIZE = 4096
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+    """asyncio UDP 수신 프로토콜"""
+    
+    def __init__(self, server):
+        self.server = server
+    
+    def connection_made(self, transport):
+        self.server.transport = transport
+    
+    def datagram_received(self, data, addr):
+        self.server._receive_burst(data, addr)
+    
+    def error_received(self, exc):
+        udp_send_errors.inc()
+        logger.error(f"UDP 소켓 오류: {exc}")
+
+
 class UDPServer:
     """UDP 서버 클래스"""
     
-    def __init__(self, port=33000):
+    def __init__(self, port=33000, hub=None, mode=UDP_MODE_ASYNCIO, rcvbuf=0,
+                 burst=256, max_backlog=10000, reuse_port=False, workers=1, policy=POLICY_DROP_NEWEST,
+                 block_timeout=1.0):
         self.port = port
+        self.hub = hub  # 채널 처리 함수와 설정을 제공하는 서버 모듈 (app)
+        self.mode = mode
+        self.rcvbuf = rcvbuf  # SO_RCVBUF (0이면 OS 기본값)
+        self.burst = burst  # 한번에 읽을 최대 데이터그램 수
+        self.max_backlog = max_backlog  # 처리 대기 최대 데이터그램 수 (전체 샤드 합)
+        self.reuse_port = reuse_port  # SO_REUSEPORT (여러 프로세스가 같은 포트 수신)
         self.socket = None
         self.running = False
         self.thread = None
+        self.loop = None
+        self.transport = None
+        # 수신 스레드는 대기열에 넣기만 하고, 처리(체크섬/파싱/채널 갱신/응답)는 디바이스별 샤드에서 수행
+        self.pipeline = IngestPipeline(self._handle_message, workers, max_backlog, policy, block_timeout, 'udp-worker')
+        self.dropped = 0
+        self.drop_logged = 0.0
+        self.headers = {}  # 채널 번호 -> 응답 헤더 바이트
+        self.windows = {}  # 채널 번호 -> 최근 데이터그램 창 (중복/순서 확인)
     
-    def start(self, port=33000):
+    def start(self, port=None):
         """UDP 서버 시작"""
-        self.port = port
+        if port:
+            self.port = port
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            if self.rcvbuf:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            if self.reuse_port:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             self.socket.bind(('0.0.0.0', self.port))
-            self.socket.settimeout(1.0)  # 1초 타임아웃
             self.running = True
-            self.thread = threading.Thread(target=self._listen, daemon=True)
-            self.thread.start()
-            logger.info(f"UDP 서버가 포트 {self.port}에서 시작되었습니다.")
+            self.pipeline.start()
+            if self.mode == UDP_MODE_ASYNCIO:
+                self.socket.setblocking(False)
+                self.loop = asyncio.new_event_loop()
+                started = threading.Event()
+                self.thread = threading.Thread(target=self._run_loop, args=(started,), daemon=True)
+                self.thread.start()
+                started.wait(5)
+                if not self.transport:
+                    raise RuntimeError("asyncio UDP 전송 생성 실패")
+            else:
+                self.socket.settimeout(1.0)  # 1초 타임아웃
+                self.thread = threading.Thread(target=self._listen, daemon=True)
+                self.thread.start()
+            rcvbuf = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+            logger.info(f"UDP 서버가 포트 {self.port}에서 시작되었습니다. (mode={self.mode}, rcvbuf={rcvbuf}, "
+                        f"workers={len(self.pipeline.shards)}, policy={self.pipeline.policy})")
             return True
         except Exception as e:
             logger.error(f"UDP 서버 시작 실패: {e}")
+            self.running = False
+            self.pipeline.stop()
             return False
     
     def stop(self):
         """UDP 서버 중지"""
         self.running = False
-        if self.socket:
+        # 대기 중인 메시지 처리 및 응답 전송 완료 후 종료
+        self.pipeline.stop()
+        if self.loop:
+            if self.loop.is_running():
+                self.loop.call_soon_threadsafe(self._close_transport)
+            if self.thread:
+                self.thread.join(timeout=5)
+            self.loop = None
+            self.transport = None
+        elif self.socket:
             self.socket.close()
         logger.info("UDP 서버가 중지되었습니다.")
     
+    def _run_loop(self, started):
+        """asyncio 이벤트 루프 실행"""
+        asyncio.set_event_loop(self.loop)
+        
+        async def open_endpoint():
+            await self.loop.create_datagram_endpoint(lambda: _UDPProtocol(self), sock=self.socket)
+        
+        try:
+            self.loop.run_until_complete(open_endpoint())
+        except Exception as e:
+            logger.error(f"asyncio UDP 시작 실패: {e}")
+        started.set()
+        if self.transport:
+            self.loop.run_forever()
+        self.loop.close()
+    
+    def _close_transport(self):
+        if self.transport:
+            self.transport.close()
+        self.loop.stop()
+    
+    def _receive_burst(self, data, addr):
+        """수신된 데이터그램과 소켓에 대기 중인 데이터그램을 한번에 읽어 처리 대기열에 추가"""
+        if not self.running:
+            return
+        self._enqueue(data, addr)
+        # 전송 객체는 준비 이벤트당 1개만 읽으므로 남은 데이터그램은 직접 읽음
+        for _ in range(self.burst - 1):
+            try:
+                data, addr = self.socket.recvfrom(MAX_DATAGRAM_SIZE)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                logger.error(f"UDP 수신 오류: {e}")
+                break
+            self._enqueue(data, addr)
+    
+    @property
+    def backlog(self):
+        """처리 대기 중인 데이터그램 수"""
+        return len(self.pipeline)
+    
+    def _enqueue(self, data, addr):
+        """디바이스별 샤드 대기열에 추가 (수신 스레드에서 호출, 체크섬/파싱 없이 디바이스 ID만 확인)"""
+        sep = data.find(b'#')
+        device_id = data[:sep] if sep > 0 else b''
+        if 0 < len(device_id) <= 4:
+            # 숫자 채널 ID 는 디바이스 ID 로 바꿔 로그인 메시지와 같은 샤드 사용
+            channel = self.hub.channels.find_by_num(self.hub.hex_to_int(device_id.decode('latin-1')))
+            key = channel.devid if channel else device_id.decode('latin-1')
+        else:
+            key = device_id.decode('latin-1')
+        dropped = self.pipeline.submit(key, data, addr)
+        if dropped:
+            self.dropped += dropped
+            udp_dropped.inc(dropped)
+            now = time.monotonic()
+            if now - self.drop_logged >= 1.0:
+                self.drop_logged = now
+                logger.warning(f"UDP 처리 대기열 초과, 데이터그램 폐기 (누적 {self.dropped}, "
+                               f"policy={self.pipeline.policy})")
+    
+    def _sendto(self, data, addr):
+        """UDP 전송 (asyncio 모드에서는 이벤트 루프의 전송 객체 사용)"""
+        if self.transport and self.loop:
+            self.loop.call_soon_threadsafe(self.transport.sendto, data, addr)
+        else:
+            self.socket.sendto(data, addr)
+    
     def _listen(self):
-        """UDP 메시지 수신 루프"""
+        """UDP 메시지 수신 루프 (처리 대기열에 추가만 함)"""
         while self.running:
             try:
-                data, addr = self.socket.recvfrom(4096)
-                self._handle_message(data.decode('utf-8', errors='ignore'), addr)
+                data, addr = self.socket.recvfrom(MAX_DATAGRAM_SIZE)
+                self._enqueue(data, addr)
             except socket.timeout:
                 continue
             except Exception as e:
-                logger.error(f"UDP 메시지 처리 오류: {e}")
+                logger.error(f"UDP 수신 오류: {e}")
     
     def _handle_message(self, message, addr):
-        """UDP 메시지 처리"""
+        """UDP 메시지 처리 (bytes 그대로 처리, 필요한 부분만 디코딩)"""
         try:
-            logger.info(f"UDP 메시지 수신: {len(message)} bytes from {addr[0]}")
+            udp_received.inc()
             
             # 체크섬 검증
-            if not self._verify_checksum(message):
+            star = self._verify_checksum(message)
+            if star < 0:
+                udp_bad_checksum.inc()
                 logger.warning(f"체크섬 불일치: {message}")
                 return
             
             # 메시지 파싱
-            parts = message.split('#', 1)
-            if len(parts) != 2:
+            sep = message.find(b'#', 0, star)
+            if sep < 0:
+                udp_malformed.inc()
                 logger.warning(f"잘못된 메시지 형식: {message}")
                 return
             
-            device_id = parts[0]
-            data = parts[1]
+            device_id = message[:sep].decode('latin-1')
+            data = message[sep + 1:star].decode('latin-1')
             
-            # 채널 찾기
-            channel = find_channel_by_deviceID(device_id)
+            # 채널 찾기 (4자 이하는 숫자 채널 ID)
+            if len(device_id) > 4:
+                channel = self.hub.assign_channel(device_id)
+            else:
+                channel = self.hub.channels.find_by_num(self.hub.hex_to_int(device_id))
             if not channel:
-                # 새 채널 생성
-                channel = assign_channel(device_id)
-                if not channel:
-                    logger.error(f"채널 할당 실패: {device_id}")
-                    return
+                udp_malformed.inc()
+                logger.error(f"채널 할당 실패: {device_id}")
+                return
+            self.hub.packet_log.log(channel.devid, "UDP 메시지 수신: %d bytes from %s", len(message), addr[0])
             
             # 이벤트 파싱
             event_id = 0
@@ -140,35 +305,40 @@ class UDPServer:
         if event_id == EVENT_LOGIN:
             # 로그인 이벤트
             if vin and len(vin) == 17:
-                channel.vin = vin
+                self.hub.channels.set_vin(channel, vin)
             channel.rssi = rssi
             channel.devflags = devflags
             channel.udp_peer = addr
             
             # 서버 키 검증
-            if config['server_key'] and key != config['server_key']:
+            if self.hub.config['server_key'] and key != self.hub.config['server_key']:
                 logger.warning(f"서버 키 불일치: {key}")
                 return
             
             # 로그인 처리
             if not (channel.flags & 1) or current_time - channel.server_data_tick > 60000:  # 1분
-                device_login(channel)
+                self.hub.device_login(channel)
                 channel.server_data_tick = current_time
                 channel.session_start_tick = current_time
             else:
                 logger.info(f"디바이스 재로그인: {channel.devid}")
             
             channel.device_tick = device_tick
+            self.windows.pop(channel.num, None)
             # 캐시 초기화
+            channel.cache.clear()
             channel.cache_read_pos = 0
             channel.cache_write_pos = 0
             channel.data.clear()
+            self.hub.touch_channel(channel)
             
         elif event_id == EVENT_ACK:
             # 명령 응답 처리
             if msg and token:
-                # 명령 응답 처리 로직 (구현 필요)
-                logger.info(f"명령 응답: {token} - {msg}")
+                if self.hub.commands.respond(channel.devid, token, msg):
+                    logger.info(f"명령 응답: {token} - {msg}")
+                else:
+                    logger.warning(f"알 수 없는 명령 응답: {channel.devid} {token} - {msg}")
         
         # 응답 전송
         self._send_response(channel, event_id, addr)
@@ -177,66 +347,91 @@ class UDPServer:
         """데이터 메시지 처리"""
         current_time = int(time.time() * 1000)
         
+        window = self.windows.get(channel.num)
+        if window is None:
+            config = self.hub.config
+            window = self.windows[channel.num] = PacketWindow(config['udp_dedup_window'], config['udp_reorder_window'])
+        status = window.check(payload_tick(data), data)
+        if status == PACKET_DUPLICATE:
+            # 동기화 응답을 받지 못해 재전송한 것이므로 파싱 없이 응답만 다시 보냄
+            udp_duplicates.inc()
+            self.hub.packet_log.log(channel.devid, "중복 데이터그램 폐기: %d bytes", len(data))
+            self._send_response(channel, EVENT_SYNC, addr)
+            return
+        if status == PACKET_LATE:
+            udp_reordered.inc()
+        
         # 데이터 처리
-        count = process_payload(data, channel, 0)
         channel.ip_addr = addr[0]
+        count = self.hub.process_payload(data, channel, 0, status == PACKET_LATE)
         
         # 동기화 필요 여부 확인
-        if current_time - channel.server_sync_tick >= config['sync_interval'] * 1000:
+        if current_time - channel.server_sync_tick >= self.hub.config['sync_interval'] * 1000:
             channel.server_sync_tick = current_time
             self._send_response(channel, EVENT_SYNC, addr)
         else:
             # 응답 없음
             pass
     
+    def _header(self, channel):
+        """채널별 응답 헤더 (<채널 ID>#EV=) 바이트"""
+        header = self.headers.get(channel.num)
+        if header is None:
+            header = self.headers[channel.num] = b'%X#EV=' % channel.num
+        return header
+    
+    def forget(self, channel):
+        """제거된 채널의 응답 헤더와 데이터그램 창 삭제"""
+        self.headers.pop(channel.num, None)
+        self.windows.pop(channel.num, None)
+    
     def _send_response(self, channel, event_id, addr):
         """UDP 응답 전송"""
         try:
-            response = f"{channel.id:X}#EV={event_id},RX={channel.recv_count},TX={channel.tx_count + 1}"
+            response = self._header(channel) + b'%d,RX=%d,TX=%d' % (event_id, channel.recv_count, channel.tx_count + 1)
             response = self._add_checksum(response)
             
-            self.socket.sendto(response.encode('utf-8'), addr)
-            logger.info(f"UDP 응답 전송: {response}")
+            self._sendto(response, addr)
+            self.hub.packet_log.log(channel.devid, "UDP 응답 전송: %r", response)
             
             # 통계 업데이트
             channel.tx_count += 1
             
             # 이벤트별 처리
             if event_id == EVENT_LOGOUT:
-                device_logout(channel)
+                self.hub.device_logout(channel)
             elif event_id == EVENT_PING:
-                logger.info("Ping 수신")
+                self.hub.packet_log.log(channel.devid, "Ping 수신")
                 channel.server_ping_tick = int(time.time() * 1000)
                 channel.flags &= ~1  # FLAG_RUNNING 제거
                 channel.flags |= 2   # FLAG_SLEEPING 추가
+                self.hub.touch_channel(channel)
             elif event_id == EVENT_RECONNECT:
                 logger.info(f"디바이스 재연결: {channel.devid}")
                 
         except Exception as e:
+            udp_send_errors.inc()
             logger.error(f"UDP 응답 전송 실패: {e}")
     
     def _verify_checksum(self, data):
-        """체크섬 검증"""
-        if '*' not in data:
-            return False
-        
-        parts = data.rsplit('*', 1)
-        if len(parts) != 2:
-            return False
+        """체크섬 검증, 성공 시 '*' 위치 반환 (실패 시 -1)"""
+        star = data.rfind(b'*')
+        if star < 0:
+            return -1
         
-        message = parts[0]
-        checksum = parts[1]
+        try:
+            received_sum = int(data[star + 1:], 16)
+        except ValueError:
+            return -1
         
-        # 체크섬 계산
-        calculated_sum = sum(ord(c) for c in message) & 0xFF
-        received_sum = int(checksum, 16)
+        # 체크섬 계산 (바이트 합, C 레벨 반복)
+        calculated_sum = sum(memoryview(data)[:star]) & 0xFF
         
-        return calculated_sum == received_sum
+        return star if calculated_sum == received_sum else -1
     
     def _add_checksum(self, data):
         """체크섬 추가"""
-        checksum = sum(ord(c) for c in data) & 0xFF
-        return f"{data}*{checksum:X}"
+        return b'%s*%X' % (data, sum(data) & 0xFF)
     
     def send_command(self, channel, command, token=None):
         """명령 전송"""
@@ -249,10 +444,10 @@ class UDPServer:
             channel.cmd_count += 1
         
         try:
-            message = f"{channel.id:X}#EV={EVENT_COMMAND},TK={token},CMD={command}"
+            message = self._header(channel) + b'%d,TK=%d,CMD=%s' % (EVENT_COMMAND, token, command.encode('utf-8'))
             message = self._add_checksum(message)
             
-            self.socket.sendto(message.encode('utf-8'), channel.udp_peer)
+            self._sendto(message, channel.udp_peer)
             logger.info(f"명령 전송: {command} (토큰: {token})")
             
             # 명령 상태 업데이트
@@ -260,5 +455,6 @@ class UDPServer:
             
             return token
         except Exception as e:
+            udp_send_errors.inc()
             logger.error(f"명령 전송 실패: {e}")
             return False
@@ -0,0 +1,86 @@
+import zlib
+from typing import Iterator, Optional
+
+# 압축 해제 후 프레임 (페이로드 한 줄) 최대 길이
+MAX_FRAME_LEN = 64 * 1024
+READ_SIZE = 64 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class UploadError(ValueError):
+    """업로드 본문 오류 (status: 응답 HTTP 상태 코드)"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadStream:
+    """압축된 일괄 업로드 본문을 읽으며 프레임 단위로 반환
+
+    본문은 줄바꿈으로 구분한 페이로드 프레임이며 gzip, deflate (zlib 또는 raw) 또는
+    비압축입니다. READ_SIZE 씩 읽어 압축을 풀고 완성된 줄만 내보내므로 본문 전체를
+    메모리에 올리지 않습니다. max_bytes 는 압축 해제 후 전체 크기 제한입니다.
+    """
+
+    def __init__(self, stream, encoding: Optional[str] = None, max_bytes: int = 64 * 1024 * 1024):
+        self.stream = stream
+        self.encoding = (encoding or '').strip().lower()
+        self.max_bytes = max_bytes
+        self.received = 0  # 읽은 (압축된) 바이트
+        self.decoded = 0  # 압축 해제한 바이트
+
+    def _decompressor(self, head: bytes):
+        if self.encoding in ('gzip', 'x-gzip') or (not self.encoding and head.startswith(GZIP_MAGIC)):
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self.encoding == 'deflate':
+            # HTTP deflate 는 zlib 형식이지만 raw deflate 를 보내는 클라이언트도 있음
+            if len(head) >= 2 and head[0] & 0x0F == 8 and (head[0] << 8 | head[1]) % 31 == 0:
+                return zlib.decompressobj(zlib.MAX_WBITS)
+            return zlib.decompressobj(-zlib.MAX_WBITS)
+        if self.encoding in ('', 'identity'):
+            return None
+        raise UploadError(f"Unsupported encoding: {self.encoding}", 415)
+
+    def _chunks(self) -> Iterator[bytes]:
+        """압축 해제한 본문 조각"""
+        chunk = self.stream.read(READ_SIZE)
+        decompressor = self._decompressor(chunk)
+        while chunk:
+            self.received += len(chunk)
+            if decompressor is None:
+                yield chunk
+            else:
+                try:
+                    data = decompressor.decompress(chunk, READ_SIZE)
+                    while data:
+                        yield data
+                        # 압축률이 높은 입력은 READ_SIZE 단위로 나눠서 해제
+                        data = decompressor.decompress(decompressor.unconsumed_tail, READ_SIZE)
+                except zlib.error as e:
+                    raise UploadError(f"Corrupt body: {e}")
+                if decompressor.eof:
+                    return
+            chunk = self.stream.read(READ_SIZE)
+        if decompressor is not None and not decompressor.eof:
+            raise UploadError("Truncated body")
+
+    def __iter__(self) -> Iterator[str]:
+        """빈 줄을 제외한 프레임 (마지막 줄은 줄바꿈이 없어도 프레임)"""
+        rest = b''
+        for data in self._chunks():
+            self.decoded += len(data)
+            if self.decoded > self.max_bytes:
+                raise UploadError("Body too large", 413)
+            lines = (rest + data).split(b'\n')
+            rest = lines.pop()
+            if len(rest) > MAX_FRAME_LEN:
+                raise UploadError("Frame too long")
+            for line in lines:
+                line = line.strip()
+                if line:
+                    yield line.decode('utf-8', 'replace')
+        rest = rest.strip()
+        if rest:
+            yield rest.decode('utf-8', 'replace')
@@ -9,6 +9,7 @@ Visit https://freematics.com/hub for more information
 """
 
 import os
+import sys
 import json
 import time
 import datetime
@@ -16,7 +17,7 @@ import threading
 import socket
 import struct
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_file, send_from_directory
 from flask_cors import CORS
 import logging
 from werkzeug.security import check_password_hash, generate_password_hash
@@ -24,22 +25,34 @@ from werkzeug.utils import secure_filename
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from sqlalchemy import create_engine, Column, String, Integer, Float, DateTime, Text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dataclasses import dataclass, asdict
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 import uuid
-from UDPServer import UDPServer
-
-# 로깅 설정
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('teleserver.log'),
-        logging.StreamHandler()
-    ]
-)
+from UDPServer import (UDPServer, EVENT_LOGIN, EVENT_LOGOUT, EVENT_SYNC, EVENT_RECONNECT,
+                       EVENT_COMMAND, EVENT_ACK, EVENT_PING)
+from UDPCluster import UDPCluster
+from ChannelRegistry import ChannelRegistry
+from SampleBuffer import SampleBuffer, format_value
+from PayloadParser import parse_payload
+from OBDLoader import OBDLoader
+from LogPipeline import LogPipeline, PacketSampler, PACKET_LOGGER
+from Metrics import metrics, udp_socket_drops, LATENCY_BUCKETS, DB_BUCKETS
+from CommandTable import CommandTable, CMD_FLAG_RESPONDED, CMD_FLAG_CHECKED, CMD_FLAG_EXPIRED
+from StreamHub import StreamHub
+from SnapshotCache import SnapshotCache, PID_PENDING, channel_ages
+from TripWriter import TripWriter
+from TripIndex import TripIndex, is_trip_id, trip_file, trip_utc, value_json
+from TripExport import TripExporter
+from TripArchive import TripCompactor
+from QueryEngine import QueryEngine, parse_aggregates
+from ChannelSnapshot import ChannelSnapshot
+from ChannelExpiry import ChannelExpiry
+from HTTPCluster import HTTPCluster
+from UploadStream import UploadStream, UploadError
+
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -52,51 +65,143 @@ CORS(app)
 # 환경변수 로드
 load_dotenv()
 
-# UDP 이벤트 상수
-EVENT_LOGIN = 1
-EVENT_LOGOUT = 2
-EVENT_SYNC = 3
-EVENT_RECONNECT = 4
-EVENT_COMMAND = 5
-EVENT_ACK = 6
-EVENT_PING = 7
-
 # 기본 설정
 DEFAULT_CONFIG = {
     'http_port': int(os.getenv('HTTP_PORT', 8080)),
+    'http_workers': int(os.getenv('HTTP_WORKERS', 1)),  # 2 이상이면 공유 채널 상태를 읽는 멀티 프로세스 HTTP
+    'shared_state_file': os.getenv('SHARED_STATE_FILE', ''),  # 기본 /dev/shm/teleserver-<포트>.state
+    'shared_slot_size': int(os.getenv('SHARED_SLOT_SIZE', 0)),  # 채널별 슬롯 크기 (bytes, 0이면 CACHE_SIZE 기준)
+    'shared_publish_interval': float(os.getenv('SHARED_PUBLISH_INTERVAL', 0.1)),  # 공유 상태 발행 간격 (초)
     'udp_port': int(os.getenv('UDP_PORT', 33000)),
+    'udp_mode': os.getenv('UDP_MODE', 'asyncio'),  # asyncio 또는 thread
+    'udp_rcvbuf': int(os.getenv('UDP_RCVBUF', 4 * 1024 * 1024)),  # 소켓 수신 버퍼 (bytes)
+    'udp_workers': int(os.getenv('UDP_WORKERS', 1)),  # 2 이상이면 SO_REUSEPORT 멀티 프로세스
+    'udp_dedup_window': int(os.getenv('UDP_DEDUP_WINDOW', 64)),  # 채널별 중복 확인 데이터그램 수
+    'udp_reorder_window': int(os.getenv('UDP_REORDER_WINDOW', 60000)),  # 늦은 데이터그램으로 보는 ts 차이 (ms)
+    'udp_ingest_workers': int(os.getenv('UDP_INGEST_WORKERS', 4)),  # 디바이스별 샤드 처리 스레드 수
+    'udp_queue_size': int(os.getenv('UDP_QUEUE_SIZE', 10000)),  # 처리 대기 최대 데이터그램 수 (샤드 합)
+    'udp_queue_policy': os.getenv('UDP_QUEUE_POLICY', 'drop_newest'),  # block, drop_newest, drop_oldest
+    'udp_block_timeout': float(os.getenv('UDP_BLOCK_TIMEOUT', 1.0)),  # block 정책 최대 대기 (초)
     'max_channels': int(os.getenv('MAX_CHANNELS', 100)),
     'data_dir': os.getenv('DATA_DIR', 'data'),
     'log_dir': os.getenv('LOG_DIR', 'log'),
     'username': os.getenv('USERNAME', 'admin'),
     'password': os.getenv('PASSWORD', 'admin'),
     'cache_size': int(os.getenv('CACHE_SIZE', 1000)),
+    'pull_max_samples': int(os.getenv('PULL_MAX_SAMPLES', 10000)),
     'channel_timeout': int(os.getenv('CHANNEL_TIMEOUT', 300)),  # 5분
+    'channel_max_age': int(os.getenv('CHANNEL_MAX_AGE', 72 * 3600)),  # 수신 없는 채널 제거 (초, C MAX_CHANNEL_AGE)
     'db_host': os.getenv('DB_HOST', 'localhost'),
     'db_port': int(os.getenv('DB_PORT', 5432)),
     'db_name': os.getenv('DB_NAME', 'teleserver'),
     'db_user': os.getenv('DB_USER', 'postgres'),
     'db_password': os.getenv('DB_PASSWORD', 'postgres'),
     'server_key': os.getenv('SERVER_KEY', ''),
-    'sync_interval': int(os.getenv('SYNC_INTERVAL', 30))  # 30초
+    'sync_interval': int(os.getenv('SYNC_INTERVAL', 30)),  # 30초
+    'db_flush_interval': float(os.getenv('DB_FLUSH_INTERVAL', 1.0)),  # 최대 저장 지연 (초)
+    'db_flush_batch': int(os.getenv('DB_FLUSH_BATCH', 500)),
+    'obd_loader': os.getenv('OBD_LOADER', '1') == '1',
+    'obd_batch_size': int(os.getenv('OBD_BATCH_SIZE', 5000)),  # 행 수
+    'obd_flush_interval': float(os.getenv('OBD_FLUSH_INTERVAL', 1.0)),  # 초
+    'log_file': os.getenv('LOG_FILE', 'teleserver.log'),
+    'log_level': os.getenv('LOG_LEVEL', 'INFO'),
+    'log_levels': os.getenv('LOG_LEVELS', ''),  # 서브시스템별 레벨 (예: UDPServer=WARNING,packet=INFO)
+    'log_queue_size': int(os.getenv('LOG_QUEUE_SIZE', 10000)),
+    'log_packet_sample': int(os.getenv('LOG_PACKET_SAMPLE', 5)),  # 채널별 구간당 패킷 로그 수 (0이면 전부)
+    'log_packet_interval': float(os.getenv('LOG_PACKET_INTERVAL', 10.0)),  # 샘플링 구간 (초)
+    'metrics_per_channel': os.getenv('METRICS_PER_CHANNEL', '1') == '1',  # /api/metrics 채널별 게이지
+    'cmd_retry_interval': float(os.getenv('CMD_RETRY_INTERVAL', 5.0)),  # 응답 없는 명령 재전송 간격 (초)
+    'cmd_max_retries': int(os.getenv('CMD_MAX_RETRIES', 2)),
+    'cmd_expire': float(os.getenv('CMD_EXPIRE', 300.0)),  # 명령 보관 시간 (초)
+    'cmd_max_wait': int(os.getenv('CMD_MAX_WAIT', 30000)),  # /api/command long-poll 최대 대기 (ms)
+    'stream_queue_size': int(os.getenv('STREAM_QUEUE_SIZE', 256)),  # SSE 구독자별 대기 이벤트 수
+    'stream_max_subscribers': int(os.getenv('STREAM_MAX_SUBSCRIBERS', 1000)),
+    'trip_files': os.getenv('TRIP_FILES', '1') == '1',  # data_dir 에 트립 데이터 파일 기록
+    'trip_buffer_size': int(os.getenv('TRIP_BUFFER_SIZE', 64 * 1024)),  # 파일별 버퍼 크기 (bytes)
+    'trip_flush_interval': float(os.getenv('TRIP_FLUSH_INTERVAL', 2.0)),  # 최대 기록 지연 (초)
+    'trip_max_open': int(os.getenv('TRIP_MAX_OPEN', 256)),  # 동시에 열어 두는 파일 수
+    'trip_index_interval': int(os.getenv('TRIP_INDEX_INTERVAL', 64)),  # 트립 인덱스 간격 (줄 수)
+    'trip_export_cache': os.getenv('TRIP_EXPORT_CACHE', '1') == '1',  # GeoJSON/KML 결과 디스크 캐시
+    'trip_archive': os.getenv('TRIP_ARCHIVE', '1') == '1',  # 종료된 트립을 컬럼 아카이브로 변환
+    'trip_archive_keep_text': os.getenv('TRIP_ARCHIVE_KEEP_TEXT', '0') == '1',  # 변환 후 원본 트립 파일 유지 (기본은 확인 후 삭제)
+    'query_max_points': int(os.getenv('QUERY_MAX_POINTS', 500)),  # /api/query 최대 구간 수
+    'query_max_days': int(os.getenv('QUERY_MAX_DAYS', 1830)),  # /api/history, /api/query 최대 조회 기간 (일)
+    'snapshot_file': os.getenv('SNAPSHOT_FILE', ''),  # 채널 상태 스냅샷 (기본 data_dir/channels.snap)
+    'snapshot_interval': float(os.getenv('SNAPSHOT_INTERVAL', 60.0)),  # 스냅샷 저장 간격 (초, 0이면 종료 시에만)
+    'upload_max_bytes': int(os.getenv('UPLOAD_MAX_BYTES', 64 * 1024 * 1024))  # /api/upload 압축 해제 후 최대 크기
 }
 
 # 전역 변수
 config = DEFAULT_CONFIG.copy()
-channels: Dict[str, 'ChannelData'] = {}
-channel_lock = threading.Lock()
+
+# 로깅 설정 (기록은 백그라운드 스레드에서 수행, main 에서 시작)
+log_pipeline = LogPipeline(config['log_file'], config['log_level'], config['log_levels'],
+                           config['log_queue_size'])
+packet_log = PacketSampler(logging.getLogger(PACKET_LOGGER), config['log_packet_sample'],
+                           config['log_packet_interval'])
+channels = ChannelRegistry(config['max_channels'])
+channels.lock = metrics.timed_lock(channels.lock, 'channel_lock')
+channel_lock = channels.lock
+# 채널 만료 예정 시각 (세션 타임아웃, 오래된 채널 제거)
+channels.expiry = ChannelExpiry(config['channel_timeout'] * 1000, config['channel_max_age'] * 1000)
+
+# 메트릭
+payload_latency = metrics.histogram('process_payload_seconds', 'process_payload 처리 시간 (초)', LATENCY_BUCKETS)
+payloads_processed = metrics.counter('payloads_processed_total', '처리된 페이로드 수')
+samples_parsed = metrics.counter('samples_parsed_total', '파싱된 PID 샘플 수')
+save_channel_latency = metrics.histogram('db_save_channel_seconds', 'save_channel 호출 시간 (초)', LATENCY_BUCKETS)
+db_flush_latency = metrics.histogram('db_flush_seconds', '채널 일괄 저장(커밋) 시간 (초)', DB_BUCKETS)
+db_rows_saved = metrics.counter('db_channels_saved_total', 'DB에 저장된 채널 행 수')
+db_errors = metrics.counter('db_errors_total', 'DB 저장 실패 수')
+channel_timeouts = metrics.counter('channel_timeouts_total', 'check_channels 에서 타임아웃된 채널 수')
+channel_evictions = metrics.counter('channel_evictions_total', 'CHANNEL_MAX_AGE 동안 수신이 없어 제거된 채널 수')
+channel_expiry_checks = metrics.counter('channel_expiry_checks_total', 'check_channels 에서 확인한 만료 예정 채널 수')
+upload_latency = metrics.histogram('upload_seconds', '/api/upload 일괄 업로드 처리 시간 (초)', DB_BUCKETS)
+upload_frames = metrics.counter('upload_frames_total', '/api/upload 에서 반영한 프레임 수')
+upload_frames_skipped = metrics.counter('upload_frames_skipped_total', '/api/upload 에서 이미 수신했거나 비어 있어 건너뛴 프레임 수')
+upload_bytes = metrics.counter('upload_bytes_total', '/api/upload 요청 본문 바이트 수 (압축된 크기)')
+
+# API 응답 캐시 (채널 버전별 직렬화 결과)
+snapshots = SnapshotCache()
+
+# SSE 실시간 스트림
+stream = StreamHub(config['stream_queue_size'], config['stream_max_subscribers'])
+
+# 트립 데이터 파일 (C createDataFile)
+trips = TripWriter(config['data_dir'], config['trip_buffer_size'], config['trip_flush_interval'],
+                   config['trip_max_open']) if config['trip_files'] else None
+
+# 트립 조회 인덱스 (/api/history, /api/trip, /api/data)
+trip_index = TripIndex(config['data_dir'], config['trip_index_interval'])
+trip_export = TripExporter(trip_index, config['trip_export_cache'])
+trip_compactor = TripCompactor(config['data_dir'], trip_index,
+                               config['trip_archive_keep_text']) if config['trip_archive'] else None
+if trips and trip_compactor:
+    trips.on_close = trip_compactor.submit
+query_engine = QueryEngine(trip_index, config['query_max_points'])
+
+# 채널 상태 스냅샷 (재시작 시 DB 보다 먼저 복원)
+channel_snapshot = ChannelSnapshot(config['snapshot_file'] or os.path.join(config['data_dir'], 'channels.snap'),
+                                   config['snapshot_interval'])
+
+# 대기 명령 테이블 (C COMMAND_BLOCK)
+commands = CommandTable(retry_interval=config['cmd_retry_interval'], max_retries=config['cmd_max_retries'],
+                        expire=config['cmd_expire'])
 
 @dataclass
 class PIDData:
     """PID 데이터 구조"""
     ts: int = 0
     value: str = ""
+    version: int = PID_PENDING  # 마지막 변경 버전
 
 @dataclass
 class ChannelData:
     """채널 데이터 구조"""
     id: str
     devid: str
+    num: int = 0  # 숫자 채널 ID (C CHANNEL_DATA.id)
+    version: int = 0  # 마지막 변경 버전 (ChannelRegistry.touch)
     vin: str = ""
     flags: int = 0
     device_tick: int = 0
@@ -115,7 +220,7 @@ class ChannelData:
     cache_read_pos: int = 0
     cache_write_pos: int = 0
     data: Dict[int, PIDData] = None
-    cache: List[Dict] = None
+    cache: SampleBuffer = None
     ip_addr: str = ""
     created_at: str = ""
     udp_peer: tuple = None  # (ip, port)
@@ -126,7 +231,7 @@ class ChannelData:
         if self.data is None:
             self.data = {}
         if self.cache is None:
-            self.cache = []
+            self.cache = SampleBuffer(self.cache_size)
         self.created_at = datetime.datetime.now().isoformat()
 
 # SQLAlchemy 설정
@@ -187,10 +292,18 @@ class Database:
     def __init__(self):
         self.engine = None
         self.SessionLocal = None
-        self.init_db()
+        self.dirty: Dict[str, ChannelData] = {}
+        self.dirty_lock = threading.Lock()
+        self.flush_event = threading.Event()
+        self.writer_thread = None
+        self.writer_running = False
+        self.write_enabled = True
+        self.ready = False  # 테이블 확인 완료 (그 전에는 저장하지 않고 dirty 로 유지)
     
     def init_db(self):
-        """데이터베이스 초기화"""
+        """엔진/세션 팩토리 생성 (연결은 처음 사용할 때, import 시에는 하지 않음)"""
+        if self.engine is not None:
+            return
         try:
             # PostgreSQL 연결 문자열 생성
             db_url = f"postgresql://{config['db_user']}:{config['db_password']}@{config['db_host']}:{config['db_port']}/{config['db_name']}"
@@ -198,81 +311,124 @@ class Database:
             # 엔진 생성
             self.engine = create_engine(db_url, echo=False)
             
-            # 테이블 생성
-            Base.metadata.create_all(bind=self.engine)
-            
             # 세션 팩토리 생성
             self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
             
-            logger.info("PostgreSQL 데이터베이스 연결 성공")
-            
+        except Exception as e:
+            logger.error(f"PostgreSQL 데이터베이스 초기화 실패: {e}")
+    
+    def create_schema(self) -> bool:
+        """테이블 생성 (연결 성공 시 ready)"""
+        self.init_db()
+        if self.engine is None:
+            return False
+        try:
+            Base.metadata.create_all(bind=self.engine)
         except Exception as e:
             logger.error(f"PostgreSQL 데이터베이스 연결 실패: {e}")
+            return False
+        self.ready = True
+        self.flush_event.set()
+        logger.info("PostgreSQL 데이터베이스 연결 성공")
+        return True
     
     def save_channel(self, channel: ChannelData):
-        """채널 데이터 저장"""
-        self._save_channel_postgresql(channel)
+        """채널 데이터 저장 (dirty 표시 후 백그라운드에서 일괄 저장)"""
+        if not self.write_enabled:
+            return
+        started = time.perf_counter()
+        with self.dirty_lock:
+            self.dirty[channel.id] = channel
+            if len(self.dirty) >= config['db_flush_batch']:
+                self.flush_event.set()
+        save_channel_latency.observe(time.perf_counter() - started)
+    
+    def start_writer(self):
+        """백그라운드 저장 스레드 시작"""
+        if self.writer_thread and self.writer_thread.is_alive():
+            return
+        self.writer_running = True
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+    
+    def stop_writer(self):
+        """백그라운드 저장 스레드 중지 (남은 데이터 저장)"""
+        self.writer_running = False
+        self.flush_event.set()
+        if self.writer_thread:
+            self.writer_thread.join(timeout=10)
+            self.writer_thread = None
+        self.flush()
+    
+    def _writer_loop(self):
+        """주기 또는 배치 크기 도달 시 dirty 채널 저장"""
+        while self.writer_running:
+            self.flush_event.wait(config['db_flush_interval'])
+            self.flush_event.clear()
+            self.flush()
+    
+    def flush(self):
+        """dirty 채널을 한번에 저장"""
+        with self.dirty_lock:
+            if not self.dirty or not self.ready:
+                return
+            pending = self.dirty
+            self.dirty = {}
+        
+        with db_flush_latency.time():
+            saved = self._save_channels_postgresql(list(pending.values()))
+        if saved:
+            db_rows_saved.inc(len(pending))
+        else:
+            db_errors.inc()
+            # 실패한 채널은 다시 dirty 로 (그 사이 새로 표시된 채널 우선)
+            with self.dirty_lock:
+                for channel_id, channel in pending.items():
+                    self.dirty.setdefault(channel_id, channel)
     
-    def _save_channel_postgresql(self, channel: ChannelData):
-        """PostgreSQL에 채널 데이터 저장"""
+    def _save_channels_postgresql(self, channel_list: List[ChannelData]) -> bool:
+        """PostgreSQL에 채널 데이터 일괄 저장 (multi-row upsert)"""
+        now = datetime.datetime.now()
+        rows = []
+        for channel in channel_list:
+            rows.append({
+                'id': channel.id,
+                'devid': channel.devid,
+                'vin': channel.vin,
+                'flags': channel.flags,
+                'device_tick': channel.device_tick,
+                'server_data_tick': channel.server_data_tick,
+                'server_ping_tick': channel.server_ping_tick,
+                'session_start_tick': channel.session_start_tick,
+                'elapsed_time': channel.elapsed_time,
+                'recv_count': channel.recv_count,
+                'tx_count': channel.tx_count,
+                'data_received': channel.data_received,
+                'sample_rate': channel.sample_rate,
+                'rssi': channel.rssi,
+                'device_temp': channel.device_temp,
+                'devflags': channel.devflags,
+                'cache_size': channel.cache_size,
+                'cache_read_pos': channel.cache_read_pos,
+                'cache_write_pos': channel.cache_write_pos,
+                'ip_addr': channel.ip_addr,
+                'created_at': datetime.datetime.fromisoformat(channel.created_at),
+                'updated_at': now
+            })
+        
         try:
-            with self.SessionLocal() as session:
-                # 기존 채널 확인
-                existing = session.query(ChannelModel).filter(ChannelModel.id == channel.id).first()
-                
-                if existing:
-                    # 기존 데이터 업데이트
-                    existing.devid = channel.devid
-                    existing.vin = channel.vin
-                    existing.flags = channel.flags
-                    existing.device_tick = channel.device_tick
-                    existing.server_data_tick = channel.server_data_tick
-                    existing.server_ping_tick = channel.server_ping_tick
-                    existing.session_start_tick = channel.session_start_tick
-                    existing.elapsed_time = channel.elapsed_time
-                    existing.recv_count = channel.recv_count
-                    existing.tx_count = channel.tx_count
-                    existing.data_received = channel.data_received
-                    existing.sample_rate = channel.sample_rate
-                    existing.rssi = channel.rssi
-                    existing.device_temp = channel.device_temp
-                    existing.devflags = channel.devflags
-                    existing.cache_size = channel.cache_size
-                    existing.cache_read_pos = channel.cache_read_pos
-                    existing.cache_write_pos = channel.cache_write_pos
-                    existing.ip_addr = channel.ip_addr
-                    existing.updated_at = datetime.datetime.now()
-                else:
-                    # 새 채널 생성
-                    new_channel = ChannelModel(
-                        id=channel.id,
-                        devid=channel.devid,
-                        vin=channel.vin,
-                        flags=channel.flags,
-                        device_tick=channel.device_tick,
-                        server_data_tick=channel.server_data_tick,
-                        server_ping_tick=channel.server_ping_tick,
-                        session_start_tick=channel.session_start_tick,
-                        elapsed_time=channel.elapsed_time,
-                        recv_count=channel.recv_count,
-                        tx_count=channel.tx_count,
-                        data_received=channel.data_received,
-                        sample_rate=channel.sample_rate,
-                        rssi=channel.rssi,
-                        device_temp=channel.device_temp,
-                        devflags=channel.devflags,
-                        cache_size=channel.cache_size,
-                        cache_read_pos=channel.cache_read_pos,
-                        cache_write_pos=channel.cache_write_pos,
-                        ip_addr=channel.ip_addr,
-                        created_at=datetime.datetime.fromisoformat(channel.created_at),
-                        updated_at=datetime.datetime.now()
-                    )
-                    session.add(new_channel)
-                
-                session.commit()
+            stmt = pg_insert(ChannelModel).values(rows)
+            # 스냅샷 복원 후 DB 조회 전에 새로 만든 채널은 ID 가 다를 수 있으므로 devid 기준
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ChannelModel.devid],
+                set_={key: stmt.excluded[key] for key in rows[0] if key not in ('devid', 'created_at')}
+            )
+            with self.engine.begin() as conn:
+                conn.execute(stmt)
+            return True
         except Exception as e:
             logger.error(f"PostgreSQL 채널 저장 실패: {e}")
+            return False
         
     def load_channels(self) -> Dict[str, ChannelData]:
         """모든 채널 데이터 로드"""
@@ -313,11 +469,25 @@ class Database:
             logger.error(f"PostgreSQL 채널 로드 실패: {e}")
         return channels
     
-# 데이터베이스 인스턴스
+# 데이터베이스 인스턴스 (연결/테이블 생성은 시작 후 백그라운드에서)
 db = Database()
 
-# UDP 서버 인스턴스
-udp_server = UDPServer(config['udp_port'])
+# OBD 데이터 적재 인스턴스 (엔진은 시작 시 설정)
+obd_loader = OBDLoader(None, config['obd_batch_size'], config['obd_flush_interval'])
+
+# UDP 서버 인스턴스 (수신 -> 디바이스별 샤드 처리 -> DB/트립/OBD 일괄 저장)
+udp_options = {
+    'workers': config['udp_ingest_workers'],
+    'max_backlog': config['udp_queue_size'],
+    'policy': config['udp_queue_policy'],
+    'block_timeout': config['udp_block_timeout'],
+}
+if config['udp_workers'] > 1:
+    udp_server = UDPCluster(config['udp_port'], sys.modules[__name__], workers=config['udp_workers'],
+                            mode=config['udp_mode'], rcvbuf=config['udp_rcvbuf'], server_options=udp_options)
+else:
+    udp_server = UDPServer(config['udp_port'], sys.modules[__name__], mode=config['udp_mode'],
+                           rcvbuf=config['udp_rcvbuf'], **udp_options)
 
 def hex_to_int(hex_str: str) -> int:
     """16진수 문자열을 정수로 변환"""
@@ -338,20 +508,15 @@ def is_valid_devid(devid: str) -> bool:
 
 def find_channel_by_devid(devid: str) -> Optional[ChannelData]:
     """디바이스 ID로 채널 찾기"""
-    with channel_lock:
-        for channel in channels.values():
-            if channel.devid == devid:
-                return channel
-    return None
-
-def find_empty_channel() -> Optional[ChannelData]:
-    """빈 채널 찾기"""
-    with channel_lock:
-        if len(channels) >= config['max_channels']:
-            return None
-        
-        channel_id = str(uuid.uuid4())
-        return ChannelData(id=channel_id, devid="")
+    return channels.find_by_devid(devid)
+
+def new_channel(devid: str) -> ChannelData:
+    """새 채널 생성"""
+    channel_id = str(uuid.uuid4())
+    channel = ChannelData(id=channel_id, devid=devid, cache_size=config['cache_size'])
+    channel.session_start_tick = int(time.time() * 1000)
+    channel.server_data_tick = channel.session_start_tick
+    return channel
 
 def device_login(channel: ChannelData):
     """디바이스 로그인 처리"""
@@ -363,7 +528,11 @@ def device_login(channel: ChannelData):
     channel.recv_count = 0
     channel.tx_count = 0
     channel.elapsed_time = 0
+    if trips:
+        trips.open_trip(channel)
+    touch_channel(channel)
     db.save_channel(channel)
+    stream.publish(channel)
     logger.info(f"디바이스 로그인: {channel.devid}")
 
 def device_logout(channel: ChannelData):
@@ -371,39 +540,42 @@ def device_logout(channel: ChannelData):
     current_time = int(time.time() * 1000)
     channel.flags &= ~1  # FLAG_RUNNING 제거
     channel.server_ping_tick = current_time
+    if trips:
+        trips.close_trip(channel.devid)
+    touch_channel(channel)
     db.save_channel(channel)
+    stream.publish(channel)
     logger.info(f"디바이스 로그아웃: {channel.devid}")
 
+def touch_channel(channel: ChannelData, pids=()):
+    """채널 변경 표시 (버전 증가), pids 는 값이 바뀐 PID 목록"""
+    version = channels.touch(channel)
+    data = channel.data
+    for pid in pids:
+        pid_data = data.get(pid)
+        if pid_data:
+            pid_data.version = version
+
 def assign_channel(devid: str) -> Optional[ChannelData]:
     """채널 할당"""
     if not is_valid_devid(devid):
         logger.error(f"Invalid device ID: {devid}")
         return None
     
-    # 기존 채널 확인
-    channel = find_channel_by_devid(devid)
-    if channel:
-        return channel
-    
-    # 새 채널 생성
-    channel = find_empty_channel()
+    # 기존 채널 확인 또는 새 채널 생성
+    channel, created = channels.get_or_create(devid, new_channel)
     if not channel:
         logger.error("No available channels")
         return None
     
-    channel.devid = devid
-    channel.session_start_tick = int(time.time() * 1000)
-    channel.server_data_tick = channel.session_start_tick
-    
-    with channel_lock:
-        channels[channel.id] = channel
-    
-    db.save_channel(channel)
-    logger.info(f"New channel assigned: {devid} -> {channel.id}")
+    if created:
+        db.save_channel(channel)
+        logger.info(f"New channel assigned: {devid} -> {channel.id} ({channel.num:X})")
     return channel
 
-def process_payload(payload: str, channel: ChannelData, event_id: int = 0) -> int:
-    """페이로드 처리"""
+def process_payload(payload: str, channel: ChannelData, event_id: int = 0, late: bool = False) -> int:
+    """페이로드 처리 (late: 늦게 도착한 데이터그램, 최신 값과 device_tick 을 되돌리지 않음)"""
+    started = time.perf_counter()
     current_time = int(time.time() * 1000)
     
     if event_id == 0 and not (channel.flags & 1):  # FLAG_RUNNING
@@ -411,40 +583,16 @@ def process_payload(payload: str, channel: ChannelData, event_id: int = 0) -> in
         channel.session_start_tick = current_time
     
     # 페이로드 파싱
-    parts = payload.split(',')
-    count = 0
-    timestamp = 0
+    result = parse_payload(payload)
+    count = len(result)
+    timestamp = result.last_ts
+    latest = apply_samples(channel, result, late)
     
-    for part in parts:
-        if ':' not in part:
-            continue
-        
-        pid_str, value = part.split(':', 1)
-        pid = hex_to_int(pid_str)
-        
-        if pid == -1:
-            continue
-        
-        if pid == 0:  # 타임스탬프
-            timestamp = int(value)
-            continue
-        
-        if timestamp == 0:
-            continue
-        
-        # 데이터 저장
-        channel.data[pid] = PIDData(ts=timestamp, value=value)
-        
-        # 특별한 PID 처리
-        if pid == 0x100:  # RSSI
-            channel.rssi = int(value)
-        elif pid == 0x101:  # DEVICE_TEMP
-            channel.device_temp = int(value)
-        
-        count += 1
+    if timestamp == 0 or late:
+        timestamp = max(timestamp, channel.device_tick)
     
-    if timestamp == 0:
-        timestamp = channel.device_tick
+    if count:
+        obd_loader.add(channel.vin, result)
     
     # 통계 업데이트
     if channel.device_tick > 0:
@@ -458,32 +606,155 @@ def process_payload(payload: str, channel: ChannelData, event_id: int = 0) -> in
     channel.recv_count += 1
     channel.data_received += len(payload)
     
+    # 트립 데이터 파일 (데이터 이벤트만, 세션 간격 초과 시 새 파일)
+    if event_id == 0 and trips:
+        trips.write(channel, payload, current_time)
+    
     # 데이터베이스에 저장
+    touch_channel(channel, latest)
     db.save_channel(channel)
+    stream.publish(channel, ((pid, result.ts[i], result.value[i]) for pid, i in latest.items()))
     
-    logger.info(f"[{channel.id}] #{channel.recv_count} {len(payload)} bytes | Samples:{count} | Device Tick:{timestamp}")
+    packet_log.log(channel.devid, "[%s] #%d %d bytes | Samples:%d | Device Tick:%d",
+                   channel.id, channel.recv_count, len(payload), count, timestamp)
+    payloads_processed.inc()
+    samples_parsed.inc(count)
+    payload_latency.observe(time.perf_counter() - started)
     return count
 
+def apply_samples(channel: ChannelData, result, late: bool = False) -> Dict[int, int]:
+    """파싱 결과를 채널 최신 PID 값과 링 버퍼에 반영, 값을 갱신한 PID별 마지막 인덱스 반환
+
+    late 이면 샘플은 링 버퍼의 시간 순서 위치에 넣고, 최신 값은 더 새로운 값이 없는 PID 만 갱신합니다.
+    """
+    # PID별 최신 값 갱신 (기존 PIDData 재사용)
+    latest = result.latest()
+    if late:
+        latest = {pid: index for pid, index in latest.items()
+                  if pid not in channel.data or channel.data[pid].ts <= result.ts[index]}
+    for pid, index in latest.items():
+        pid_data = channel.data.get(pid)
+        if pid_data:
+            pid_data.ts = result.ts[index]
+            pid_data.value = result.value[index]
+            pid_data.version = PID_PENDING
+        else:
+            channel.data[pid] = PIDData(ts=result.ts[index], value=result.value[index])
+        
+        # 특별한 PID 처리
+        if pid == 0x100:  # RSSI
+            rssi = result.number(index)
+            if isinstance(rssi, int):
+                channel.rssi = rssi
+        elif pid == 0x101:  # DEVICE_TEMP
+            device_temp = result.number(index)
+            if isinstance(device_temp, int):
+                channel.device_temp = device_temp
+    
+    # 링 버퍼에 저장
+    if late:
+        channel.cache.insert(result)
+        channel.cache_read_pos = channel.cache.read_pos
+        channel.cache_write_pos = channel.cache.write_pos
+    elif len(result):
+        channel.cache.extend(result)
+        channel.cache_read_pos = channel.cache.read_pos
+        channel.cache_write_pos = channel.cache.write_pos
+    return latest
+
+def process_batch(frames: Iterable[str], channel: ChannelData) -> Tuple[int, int, int]:
+    """일괄 업로드 프레임 처리, (반영한 프레임 수, 건너뛴 프레임 수, 샘플 수) 반환
+
+    마지막 타임스탬프가 채널 device_tick 이후인 프레임만 반영하므로 같은 버퍼를 다시
+    올려도 중복되지 않습니다. 채널 갱신, DB 저장, 스트림 발행은 마지막에 한 번만 합니다.
+    프레임 중간에 오류가 나도 그때까지 읽은 프레임은 반영됩니다.
+    """
+    started = time.perf_counter()
+    current_time = int(time.time() * 1000)
+    if not (channel.flags & 1):  # FLAG_RUNNING
+        channel.flags |= 1
+        channel.session_start_tick = current_time
+    first_tick = channel.device_tick
+    applied = skipped = count = received = 0
+    touched = set()
+    try:
+        for frame in frames:
+            result = parse_payload(frame)
+            if not len(result) or result.last_ts <= channel.device_tick:
+                skipped += 1
+                continue
+            touched.update(apply_samples(channel, result))
+            obd_loader.add(channel.vin, result)
+            if trips:
+                trips.write(channel, frame, current_time)
+            channel.device_tick = result.last_ts
+            applied += 1
+            count += len(result)
+            received += len(frame)
+    finally:
+        if applied:
+            if first_tick > 0 and channel.device_tick - first_tick > 100:
+                channel.sample_rate = (count * 60000) / (channel.device_tick - first_tick)
+            channel.server_data_tick = current_time
+            channel.elapsed_time = int((current_time - channel.session_start_tick) / 1000)
+            channel.recv_count += applied
+            channel.data_received += received
+            touch_channel(channel, touched)
+            db.save_channel(channel)
+            stream.publish(channel, [(pid, channel.data[pid].ts, channel.data[pid].value) for pid in touched])
+        upload_frames.inc(applied)
+        upload_frames_skipped.inc(skipped)
+        payloads_processed.inc(applied)
+        samples_parsed.inc(count)
+        upload_latency.observe(time.perf_counter() - started)
+    return applied, skipped, count
+
+def evict_channel(channel: ChannelData):
+    """채널 제거 (마지막 상태는 DB 에 저장, 메모리/캐시 해제)"""
+    if not channels.remove(channel.id):
+        return
+    snapshots.discard(channel.id)
+    if trips:
+        trips.close_trip(channel.devid)
+    forget = getattr(udp_server, 'forget', None)
+    if forget:
+        forget(channel)
+    db.save_channel(channel)
+
 def check_channels():
-    """채널 상태 확인 및 정리"""
+    """만료 예정 시각이 지난 채널만 확인 (세션 타임아웃, 오래된 채널 제거)"""
+    expiry = channels.expiry
     current_time = int(time.time() * 1000)
-    timeout_ms = config['channel_timeout'] * 1000
-    
-    with channel_lock:
-        channels_to_remove = []
-        for channel_id, channel in channels.items():
-            if channel.flags & 1:  # FLAG_RUNNING
-                if current_time - channel.server_data_tick > timeout_ms:
-                    channel.flags &= ~1  # FLAG_RUNNING 제거
-                    logger.info(f"Channel {channel.devid} timed out")
-        
-        # 오래된 채널 제거 (선택적)
-        # for channel_id, channel in channels.items():
-        #     if current_time - channel.server_ping_tick > timeout_ms * 2:
-        #         channels_to_remove.append(channel_id)
-        
-        # for channel_id in channels_to_remove:
-        #     del channels[channel_id]
+    due = expiry.due(current_time)
+    ended = []
+    evicted = []
+    for channel_id in due:
+        channel = channels.get(channel_id)
+        if channel is None:
+            continue
+        with channel_lock:
+            if current_time < expiry.deadline(channel):
+                # 예약 후 수신이 있었음, 새 만료 시각으로 다시 예약
+                expiry.schedule(channel)
+            elif channel.flags & 1:  # FLAG_RUNNING
+                channel.flags &= ~1  # FLAG_RUNNING 제거
+                touch_channel(channel)
+                ended.append(channel.devid)
+                logger.info(f"Channel {channel.devid} timed out")
+            else:
+                evicted.append(channel)
+    
+    # 타임아웃된 세션의 트립 파일 닫기, 오래된 채널 제거 (락 밖에서 기록)
+    if trips:
+        for devid in ended:
+            trips.close_trip(devid)
+    for channel in evicted:
+        evict_channel(channel)
+        logger.info(f"Channel {channel.devid} removed (no data for {config['channel_max_age']}s)")
+    
+    channel_expiry_checks.inc(len(due))
+    channel_timeouts.inc(len(ended))
+    channel_evictions.inc(len(evicted))
 
 # API 라우트들
 
@@ -530,25 +801,20 @@ def api_notify():
             return jsonify({'result': 'failed', 'error': 'Channel assignment failed'}), 403
         
         if vin and len(vin) == 17:
-            channel.vin = vin
+            channels.set_vin(channel, vin)
         channel.devflags = devflags
         channel.rssi = rssi
         channel.session_start_tick = current_time
         channel.server_data_tick = current_time
-        channel.flags |= 1  # FLAG_RUNNING
-        
-        db.save_channel(channel)
-        logger.info(f"Device login: {devid}")
+        # UDP 로그인과 같은 처리 (트립 시작, 스트림 알림)
+        device_login(channel)
         
         return jsonify({'id': channel.id, 'result': 'done'})
     
     elif event == 2:  # EVENT_LOGOUT
         channel = find_channel_by_devid(devid)
         if channel:
-            channel.flags &= ~1  # FLAG_RUNNING 제거
-            channel.server_ping_tick = current_time
-            db.save_channel(channel)
-            logger.info(f"Device logout: {devid}")
+            device_logout(channel)
         
         return jsonify({'result': 'done'})
     
@@ -589,6 +855,7 @@ def api_post():
                 channel.data[0x203] = PIDData(ts=ts, value=alt)  # PID_GPS_ALTITUDE
             if heading:
                 channel.data[0x204] = PIDData(ts=ts, value=heading)  # PID_GPS_HEADING
+            touch_channel(channel, (0x200, 0x201, 0x202, 0x203, 0x204))
         
         logger.info(f"GET from {request.remote_addr} | LAT:{lat} LON:{lon} ALT:{alt}")
         return jsonify({'result': 'OK'})
@@ -599,78 +866,92 @@ def api_post():
         if not payload:
             return jsonify({'result': 'failed', 'error': 'No payload'}), 400
         
-        count = process_payload(payload, channel, 0)
         channel.ip_addr = request.remote_addr
+        count = process_payload(payload, channel, 0)
         
         logger.info(f"POST from {request.remote_addr} | {len(payload)} bytes")
         return jsonify({'result': f'OK {count}'})
 
+@app.route('/api/upload', methods=['POST'])
+def api_upload():
+    """일괄 업로드 (오프라인 중 버퍼링한 페이로드를 줄 단위로, gzip/deflate 압축 가능)"""
+    devid = request.args.get('id', '')
+    if not devid:
+        return jsonify({'result': 'failed', 'error': 'Missing device ID'}), 403
+    
+    channel = find_channel_by_devid(devid)
+    if not channel:
+        return jsonify({'result': 'failed', 'error': 'Channel not found'}), 403
+    
+    channel.ip_addr = request.remote_addr
+    body = UploadStream(request.stream, request.headers.get('Content-Encoding'), config['upload_max_bytes'])
+    error = None
+    try:
+        frames, skipped, count = process_batch(body, channel)
+    except UploadError as e:
+        # 오류 전까지 읽은 프레임은 반영됨, devtick 이후부터 다시 올리면 됨
+        error = e
+    upload_bytes.inc(body.received)
+    
+    if error:
+        logger.warning(f"UPLOAD from {request.remote_addr} | {devid} failed: {error}")
+        return jsonify({'result': 'failed', 'error': str(error), 'devtick': channel.device_tick}), error.status
+    logger.info(f"UPLOAD from {request.remote_addr} | {body.received} bytes ({body.decoded} decoded) | "
+                f"Frames:{frames} Skipped:{skipped} Samples:{count}")
+    return jsonify({'result': f'OK {count}', 'frames': frames, 'skipped': skipped,
+                    'devtick': channel.device_tick})
+
 @app.route('/api/channels')
 def api_channels():
-    """채널 목록 조회"""
+    """채널 목록 조회 (since 지정 시 그 버전 이후 바뀐 채널만)"""
     cmd = request.args.get('cmd', '')
     channel_id = request.args.get('id', '')
     devid = request.args.get('devid', '')
     extend = request.args.get('extend', '0') == '1'
     data = request.args.get('data', '0') == '1'
+    since = request.args.get('since', 0, type=int)
     
     if cmd == 'clear' and channel_id:
-        with channel_lock:
-            if channel_id in channels:
-                del channels[channel_id]
-                logger.info(f"Channel {channel_id} removed")
+        channel = channels.get(channel_id)
+        if channel:
+            evict_channel(channel)
+            logger.info(f"Channel {channel_id} removed")
+    
+    # 변경을 읽기 전에 버전을 먼저 기록 (읽는 도중 바뀐 채널은 다음 조회에 포함)
+    version = channels.version
+    etag = f"{version}"
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
     
     current_time = int(time.time() * 1000)
-    channel_list = []
     
-    with channel_lock:
-        for channel in channels.values():
-            if devid and channel.devid != devid:
-                continue
-            
-            age_data = current_time - channel.server_data_tick if channel.server_data_tick > 0 else 0
-            age_ping = current_time - channel.server_ping_tick if channel.server_ping_tick > 0 else 0
-            
-            channel_info = {
-                'id': channel.id,
-                'devid': channel.devid,
-                'recv': channel.data_received,
-                'rate': int(channel.sample_rate),
-                'tick': channel.server_data_tick,
-                'devtick': channel.device_tick,
-                'elapsed': channel.elapsed_time,
-                'age': {
-                    'data': age_data,
-                    'ping': age_ping
-                },
-                'rssi': channel.rssi,
-                'flags': channel.devflags,
-                'parked': 0 if (channel.flags & 1) else 1
-            }
-            
-            if extend:
-                if channel.vin:
-                    channel_info['vin'] = channel.vin
-                if channel.ip_addr:
-                    channel_info['ip'] = channel.ip_addr
-            
-            if data:
-                channel_info['data'] = []
-                for pid, pid_data in channel.data.items():
-                    if pid_data.ts > 0:
-                        age = age_data + (channel.device_tick - pid_data.ts) if channel.device_tick >= pid_data.ts else 0
-                        channel_info['data'].append([pid, pid_data.value, age])
-            
-            channel_list.append(channel_info)
+    if devid:
+        channel = channels.find_by_devid(devid)
+        channel_candidates = [channel] if channel else []
+    else:
+        channel_candidates = channels.values()
+    
+    removed = channels.removed_since(since) if since else []
+    if removed is None:
+        # 제거 기록이 잘려 델타를 알 수 없으면 전체 목록 반환
+        since = 0
+        removed = []
+    
+    channel_list = [snapshots.stats_json(channel, current_time, extend, data, since)
+                    for channel in channel_candidates if channel.version > since]
     
     if devid:
-        return jsonify(channel_list[0] if channel_list else {})
+        body = channel_list[0] if channel_list else '{}'
     else:
-        return jsonify({'channels': channel_list})
+        body = f'{{"channels":[{",".join(channel_list)}],"version":{version}'
+        if since:
+            body += f',"since":{since},"removed":{json.dumps(removed)}'
+        body += '}'
+    return json_response(body, etag)
 
 @app.route('/api/get')
 def api_get():
-    """채널 데이터 조회"""
+    """채널 데이터 조회 (since 지정 시 그 버전 이후 바뀐 PID 만)"""
     devid = request.args.get('id', '')
     if not devid:
         return jsonify({'result': 'failed', 'error': 'Missing device ID'}), 403
@@ -679,9 +960,14 @@ def api_get():
     if not channel:
         return jsonify({'result': 'failed', 'error': 'Channel not found'}), 403
     
+    since = request.args.get('since', 0, type=int)
+    version = channel.version
+    etag = f"{channel.id}-{version}"
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    
     current_time = int(time.time() * 1000)
-    age_data = current_time - channel.server_data_tick if channel.server_data_tick > 0 else 0
-    age_ping = current_time - channel.server_ping_tick if channel.server_ping_tick > 0 else 0
+    age_data, age_ping = channel_ages(channel, current_time)
     
     stats = {
         'tick': channel.server_data_tick,
@@ -693,18 +979,104 @@ def api_get():
         },
         'rssi': channel.rssi,
         'flags': channel.devflags,
+        'parked': 0 if (channel.flags & 1) else 1,
+        'version': version
+    }
+    
+    data = snapshots.data_json(channel, age_data, since)
+    return json_response(f'{{"stats":{json.dumps(stats, separators=(",", ":"))},"data":{data}}}', etag)
+
+def json_response(body: str, etag: str):
+    """직렬화된 JSON 응답 (약한 ETag 포함, age 값은 조회 시각에 따라 달라짐)"""
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag, weak=True)
+    return response
+
+def not_modified(etag: str):
+    response = app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+@app.route('/api/stream')
+def api_stream():
+    """채널 변경 실시간 스트림 (Server-Sent Events)"""
+    devids = {d for d in request.args.get('id', '').split(',') if d}
+    try:
+        pids = {int(p) for p in request.args.get('pid', '').split(',') if p}
+    except ValueError:
+        return jsonify({'result': 'failed', 'error': 'Invalid PID'}), 400
+    
+    subscriber = stream.subscribe(devids, pids)
+    if not subscriber:
+        return jsonify({'result': 'failed', 'error': 'Too many subscribers'}), 503
+    
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while not subscriber.closed or not subscriber.queue.empty():
+                message = subscriber.get(timeout=15)
+                # 15초 동안 이벤트가 없으면 연결 유지용 주석 전송
+                yield message if message is not None else ": keepalive\n\n"
+            # 대기열 초과로 끊긴 경우, 클라이언트는 재접속 후 /api/channels 로 다시 동기화
+            yield "event: reset\ndata: {}\n\n"
+        finally:
+            stream.unsubscribe(subscriber)
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/pull')
+def api_pull():
+    """채널 캐시 데이터 조회 (C uhPull)"""
+    devid = request.args.get('id', '')
+    if not devid:
+        return jsonify({'result': 'failed', 'error': 'Missing device ID'}), 403
+    
+    channel = find_channel_by_devid(devid)
+    if not channel:
+        return jsonify({'result': 'failed', 'error': 'Channel not found'}), 403
+    
+    start_ts = request.args.get('ts', 0, type=int)
+    end_ts = request.args.get('endts', 0, type=int)
+    rollback = request.args.get('rollback', 0, type=int)
+    pid = request.args.get('pid', 0, type=int)
+    
+    current_time = int(time.time() * 1000)
+    age_data = current_time - channel.server_data_tick if channel.server_data_tick > 0 else 0
+    age_ping = current_time - channel.server_ping_tick if channel.server_ping_tick > 0 else 0
+    
+    stats = {
+        'recv': channel.data_received,
+        'rate': int(channel.sample_rate),
+        'tick': channel.server_data_tick,
+        'devtick': channel.device_tick,
+        'elapsed': channel.elapsed_time,
+        'age': {
+            'data': age_data,
+            'ping': age_ping
+        },
         'parked': 0 if (channel.flags & 1) else 1
     }
     
-    data = []
-    for pid, pid_data in channel.data.items():
+    live = []
+    for live_pid, pid_data in list(channel.data.items()):
         if pid_data.ts > 0:
-            age = age_data + (channel.device_tick - pid_data.ts) if channel.device_tick >= pid_data.ts else 0
-            data.append([pid, pid_data.value, age])
+            live.append([live_pid, format_value(pid_data.value)])
+    
+    if rollback:
+        # 현재 디바이스 시간 기준으로 시작 ts 재계산
+        t = age_data + channel.device_tick
+        start_ts = t - rollback if t > rollback else 0
+    
+    samples, eos = channel.cache.read(start_ts, end_ts, pid, config['pull_max_samples'])
+    for sample in samples:
+        sample[2] = format_value(sample[2])
     
     return jsonify({
         'stats': stats,
-        'data': data
+        'live': live,
+        'data': samples,
+        'eos': 1 if eos else 0
     })
 
 @app.route('/api/push', methods=['GET', 'POST'])
@@ -721,19 +1093,23 @@ def api_push():
     current_time = int(time.time() * 1000)
     channel.device_tick = int(request.args.get('ts', 0))
     count = 0
+    pids = []
     
     # URL 파라미터에서 PID 데이터 처리
     for key, value in request.args.items():
-        if key.isdigit() or (len(key) == 4 and all(c in '0123456789ABCDEFabcdef' for c in key)):
+        # PID 는 페이로드 파서와 같이 최대 4자리 16진수 (0 ~ 0xFFFF)
+        if 0 < len(key) <= 4 and all(c in '0123456789ABCDEFabcdef' for c in key):
             pid = hex_to_int(key)
             if pid > 0:
                 channel.data[pid] = PIDData(ts=channel.device_tick, value=value)
+                pids.append(pid)
                 count += 1
     
     channel.server_data_tick = current_time
     channel.elapsed_time = int((current_time - channel.session_start_tick) / 1000)
     channel.recv_count += 1
     
+    touch_channel(channel, pids)
     db.save_channel(channel)
     
     logger.info(f"PUSH from {request.remote_addr} | {count} PIDs")
@@ -751,32 +1127,269 @@ def api_command():
         return jsonify({'result': 'failed', 'error': 'Channel not found'}), 403
     
     cmd = request.args.get('cmd', '')
-    token = request.args.get('token', '0')
+    try:
+        token = int(request.args.get('token', 0) or 0)
+        wait = max(min(int(request.args.get('wait', 0) or 0), config['cmd_max_wait']), 0)
+    except ValueError:
+        return jsonify({'result': 'failed', 'error': 'Invalid request'}), 400
     
     if not cmd and not token:
         return jsonify({'result': 'failed', 'error': 'Invalid request'}), 400
     
-    channel.server_data_tick = int(time.time() * 1000)
+    current_time = int(time.time() * 1000)
+    channel.server_data_tick = current_time
+    touch_channel(channel)
     
     if cmd:
         # UDP 명령 전송
         if channel.udp_peer:
-            token = udp_server.send_command(channel, cmd)
+            token = udp_server.send_command(channel, cmd, token or None)
             if token:
+                commands.issue(channel.devid, token, cmd)
                 return jsonify({'result': 'pending', 'token': token})
             else:
                 return jsonify({'result': 'failed', 'error': 'Command unsent'})
         else:
             return jsonify({'result': 'failed', 'error': 'Device not connected via UDP'})
-    else:
-        # 토큰 상태 확인 (구현 필요)
+    
+    # 토큰 상태 확인 (wait 지정 시 응답이 올 때까지 대기)
+    index, block = commands.wait(channel.devid, token, wait / 1000)
+    if not block:
         return jsonify({'result': 'failed', 'error': 'Invalid token'})
+    if block.flags & CMD_FLAG_RESPONDED:
+        block.flags |= CMD_FLAG_CHECKED
+        return jsonify({'result': 'done', 'idx': index, 'elapsed': block.elapsed, 'data': block.message})
+    if block.flags & CMD_FLAG_EXPIRED:
+        return jsonify({'result': 'failed', 'error': 'Command timeout', 'retries': block.retries})
+    return jsonify({'result': 'pending', 'elapsed': int(time.time() * 1000) - block.tick})
+
+def resend_command(devid: str, block) -> bool:
+    """응답 없는 명령 재전송 (같은 토큰 사용)"""
+    channel = find_channel_by_devid(devid)
+    if not channel or not channel.udp_peer:
+        return False
+    logger.info(f"명령 재전송: {devid} {block.command} (토큰: {block.token}, {block.retries}회)")
+    return bool(udp_server.send_command(channel, block.command, block.token))
+
+def parse_iso_time(text: str, end_of_day: bool = False) -> Optional[datetime.datetime]:
+    """ISO 8601 날짜/시각 (시각이 없으면 그날 시작 또는 끝)"""
+    try:
+        value = datetime.datetime.fromisoformat(text.rstrip('Z'))
+    except ValueError:
+        return None
+    if end_of_day and 'T' not in text:
+        value = value.replace(hour=23, minute=59, second=59)
+    return value
+
+@app.route('/api/history')
+def api_history():
+    """기간 내 트립 목록 (C uhHistory)"""
+    devid = request.args.get('devid', '')
+    begin = parse_iso_time(request.args.get('begin', ''))
+    end = parse_iso_time(request.args.get('end', ''), end_of_day=True)
+    if not is_valid_devid(devid) or not begin or not end or begin > end:
+        return jsonify({'result': 'failed', 'error': 'Invalid arguments'}), 400
+    if (end - begin).days > config['query_max_days']:
+        return jsonify({'result': 'failed', 'error': 'Range too large'}), 400
+    return jsonify(trip_index.history(devid, begin, end))
+
+def find_trip(devid: str, tripid: str) -> Optional[str]:
+    """트립 데이터 파일 경로, 인자가 잘못됐거나 파일이 없으면 None"""
+    if not is_valid_devid(devid) or not is_trip_id(tripid):
+        return None
+    path = trip_file(config['data_dir'], devid, tripid)
+    return path if trip_index.source(path) else None
+
+@app.route('/api/trip')
+@app.route('/api/trip/<devid>/<tripid>')
+def api_trip(devid: str = '', tripid: str = ''):
+    """트립 메타 정보 (C uhTrip), .raw 는 원본 데이터 파일, .geojson/.kml 은 GPS 궤적"""
+    devid = devid or request.args.get('devid', '')
+    tripid = tripid or request.args.get('tripid', '')
+    tripid, ext = os.path.splitext(tripid)
+    path = find_trip(devid, tripid)
+    if not path:
+        return jsonify({'status': 2, 'error': 'No data'}), 404
+    if ext == '.raw':
+        if os.path.isfile(path):
+            return send_file(os.path.abspath(path), mimetype='text/plain')
+        # 원본을 삭제한 트립은 아카이브에서 다시 만듦
+        chunks = trip_index.text(path)
+        if chunks is None:
+            return jsonify({'status': 2, 'error': 'Trip archived'}), 404
+        return Response(chunks, mimetype='text/plain')
+    key = trip_utc(tripid)
+    if ext in ('.geojson', '.kml'):
+        # simplify: 단순화 허용 오차 (m), zoom: 지도 줌 레벨 (픽셀 크기를 허용 오차로 사용)
+        tolerance = request.args.get('simplify', 0.0, type=float)
+        zoom = request.args.get('zoom', None, type=int)
+        chunks = trip_export.export(path, ext[1:], tolerance, zoom, {'devid': devid, 'id': tripid}, key)
+        mimetype = 'application/geo+json' if ext == '.geojson' else 'application/vnd.google-earth.kml+xml'
+        return Response(chunks, mimetype=mimetype)
+    if ext:
+        return jsonify({'result': 'failed', 'error': 'Unsupported format'}), 404
+    meta = trip_index.meta(path)
+    return jsonify(dict(id=tripid, devid=devid, key=key,
+                        utc=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(key)), **meta.info()))
+
+@app.route('/api/data')
+def api_data():
+    """트립 PID 데이터 [[offset + ts, value], ...] (C uhData), from/to 로 디바이스 ts 범위 지정"""
+    path = find_trip(request.args.get('devid', ''), request.args.get('tripid', ''))
+    if not path:
+        return jsonify({'result': 'failed', 'error': 'Data file not found'}), 404
+    pid = request.args.get('pid', 0, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    begin = request.args.get('from', 0, type=int)
+    end = request.args.get('to', 0, type=int)
+    if not pid:
+        return jsonify({'result': 'failed', 'error': 'Missing PID'}), 400
+    
+    def generate():
+        sep = '['
+        for ts, _, value in trip_index.read(path, pid, begin, end):
+            value = value_json(pid, value)
+            if value is not None:
+                yield f'{sep}[{offset + ts},{json.dumps(value, separators=(",", ":"))}]'
+                sep = ','
+        yield '[]' if sep == '[' else ']'
+    
+    return Response(generate(), mimetype='application/json')
+
+@app.route('/api/query')
+def api_query():
+    """PID 시간 구간 집계 (from/to: UTC ms, bucket: ms, agg: min,max,avg,sum,count,first,last,median,pNN)"""
+    devid = request.args.get('devid', '') or request.args.get('id', '')
+    if not is_valid_devid(devid):
+        return jsonify({'result': 'failed', 'error': 'Invalid device ID'}), 400
+    pid = request.args.get('pid', 0, type=int)
+    now = int(time.time() * 1000)
+    end = request.args.get('to', now, type=int)
+    start = request.args.get('from', end - 3600 * 1000, type=int)
+    bucket = request.args.get('bucket', 0, type=int)
+    dim = request.args.get('dim', 0, type=int)
+    source = request.args.get('source', 'auto')
+    aggs = parse_aggregates(request.args.get('agg', 'avg'))
+    if not pid or start >= end or aggs is None or source not in ('auto', 'buffer', 'trips'):
+        return jsonify({'result': 'failed', 'error': 'Invalid arguments'}), 400
+    if end - start > config['query_max_days'] * 86400 * 1000:
+        return jsonify({'result': 'failed', 'error': 'Range too large'}), 400
+    return jsonify(query_engine.query(devid, find_channel_by_devid(devid), pid, start, end, bucket, aggs,
+                                      source, dim))
+
+def collect_metrics():
+    """조회 시점 게이지 (채널 상태, 대기열, 채널별 통계)"""
+    channel_list = channels.values()
+    active = sum(1 for c in channel_list if c.flags & 1)
+    parked = sum(1 for c in channel_list if not c.flags & 1 and c.flags & 2)
+    gauges = [
+        ('channels', '등록된 채널 수', [({}, len(channel_list))]),
+        ('channels_by_state', '상태별 채널 수 (active/parked/idle)',
+         [({'state': 'active'}, active), ({'state': 'parked'}, parked),
+          ({'state': 'idle'}, len(channel_list) - active - parked)]),
+        ('channel_expiry_scheduled', '만료 시각이 예약된 채널 수', [({}, len(channels.expiry))]),
+        ('udp_backlog', 'UDP 처리 대기 중인 데이터그램 수', [({}, getattr(udp_server, 'backlog', 0))]),
+        ('db_dirty_channels', 'DB 저장 대기 중인 채널 수', [({}, len(db.dirty))]),
+        ('log_dropped', '로그 큐 초과로 버려진 로그 수', [({}, log_pipeline.dropped)]),
+    ]
+    # 단계별 대기열 (처리: 샤드별 데이터그램, db: 저장 대기 채널, obd: 적재 대기 행, trip: 기록 대기 줄)
+    depths = []
+    pipeline = getattr(udp_server, 'pipeline', None)
+    if pipeline is not None:
+        depths += [({'stage': 'process', 'shard': i}, depth) for i, depth in enumerate(pipeline.depths())]
+    depths += [({'stage': 'db'}, len(db.dirty)), ({'stage': 'obd'}, obd_loader.pending_rows)]
+    if trips:
+        depths.append(({'stage': 'trip'}, trips.pending()))
+    gauges.append(('ingest_queue_depth', '수신 파이프라인 단계별 대기 항목 수', depths))
+    if pipeline is not None:
+        gauges.append(('ingest_queue_capacity', '처리 단계 샤드별 최대 대기 데이터그램 수',
+                       [({'stage': 'process'}, pipeline.capacity)]))
+    kernel_drops = udp_socket_drops(udp_server.port)
+    if kernel_drops is not None:
+        gauges.append(('udp_kernel_drops', '소켓 수신 버퍼 초과로 커널이 폐기한 데이터그램 수',
+                       [({}, kernel_drops)]))
+    if config['metrics_per_channel']:
+        gauges += [
+            ('channel_recv_count', '채널별 수신 페이로드 수',
+             [({'devid': c.devid}, c.recv_count) for c in channel_list]),
+            ('channel_data_received_bytes', '채널별 수신 바이트',
+             [({'devid': c.devid}, c.data_received) for c in channel_list]),
+            ('channel_sample_rate', '채널별 분당 샘플 수',
+             [({'devid': c.devid}, c.sample_rate) for c in channel_list]),
+            ('channel_rssi', '채널별 신호 세기',
+             [({'devid': c.devid}, c.rssi) for c in channel_list]),
+        ]
+    return gauges
+
+metrics.register_collector(collect_metrics)
+
+@app.route('/api/metrics')
+def api_metrics():
+    """Prometheus 메트릭"""
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+def restore_channels():
+    """스냅샷에서 채널 상태 복원 (DB 연결 없이)"""
+    started = time.perf_counter()
+    for channel in channel_snapshot.load(ChannelData, PIDData):
+        channels.add(channel)
+        touch_channel(channel, channel.data)
+    logger.info(f"Restored {len(channels)} channels from snapshot in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+def reconcile_channels():
+    """DB 연결/테이블 생성 후 OBD 적재 시작, 스냅샷에 없는 채널 로드 (연결될 때까지 재시도)"""
+    delay = 1
+    while not db.create_schema():
+        time.sleep(delay)
+        delay = min(delay * 2, 60)
+    if config['obd_loader']:
+        delay = 1
+        while obd_loader.start() is None:
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+    loaded = 0
+    oldest = int(time.time() * 1000) - config['channel_max_age'] * 1000
+    for channel in db.load_channels().values():
+        if max(channel.server_data_tick, channel.server_ping_tick) < oldest:
+            continue
+        # 스냅샷 또는 시작 후 로그인으로 이미 있는 채널은 메모리 상태 유지
+        with channel_lock:
+            if channels.find_by_devid(channel.devid):
+                continue
+            channels.add(channel)
+        loaded += 1
+    logger.info(f"Loaded {loaded} channels from database")
+
+# HTTP 워커가 공유 채널 상태로 직접 처리하는 조회 요청 (그 외는 수신 프로세스로 전달)
+LOCAL_ENDPOINTS = {'index', 'static', 'api_test', 'api_channels', 'api_get', 'api_pull',
+                   'api_history', 'api_trip', 'api_data', 'api_query'}
+
+def serve_locally() -> bool:
+    """HTTP 워커에서 직접 처리할 요청인지 (채널 제거 명령은 전달)"""
+    if request.endpoint == 'api_channels' and request.args.get('cmd'):
+        return False
+    return request.endpoint in LOCAL_ENDPOINTS
+
+def start_http_cluster() -> Optional[HTTPCluster]:
+    """멀티 프로세스 HTTP 서버 시작 (HTTP_WORKERS 2 이상), 실패하면 None"""
+    if config['http_workers'] < 2:
+        return None
+    path = config['shared_state_file']
+    if not path:
+        name = f"teleserver-{config['http_port']}.state"
+        path = os.path.join('/dev/shm', name) if os.path.isdir('/dev/shm') else os.path.join(config['data_dir'], name)
+    # 샘플당 ts(8) + pid(2) + 길이(1) + 값(최대 24) 바이트, 나머지는 PID 값과 채널 필드
+    slot_size = config['shared_slot_size'] or config['cache_size'] * 35 + 16 * 1024
+    cluster = HTTPCluster(sys.modules[__name__], config['http_port'], config['http_workers'], path, slot_size,
+                          config['shared_publish_interval'], serve_locally)
+    return cluster if cluster.start() else None
 
 def background_tasks():
     """백그라운드 작업"""
     while True:
         try:
             check_channels()
+            packet_log.summarize()
             time.sleep(10)  # 10초마다 체크
         except Exception as e:
             logger.error(f"Background task error: {e}")
@@ -786,14 +1399,31 @@ if __name__ == '__main__':
     os.makedirs(config['data_dir'], exist_ok=True)
     os.makedirs(config['log_dir'], exist_ok=True)
     
-    # 기존 채널 로드
-    channels.update(db.load_channels())
-    logger.info(f"Loaded {len(channels)} channels from database")
+    # 로그 기록 스레드 시작 (fork 된 자식 프로세스는 LogPipeline 이 다시 시작)
+    log_pipeline.start()
+    
+    # 기존 채널 복원 (DB 는 연결 후 백그라운드에서 병합)
+    db.init_db()
+    obd_loader.engine = db.engine
+    restore_channels()
     
-    # UDP 서버 시작
+    # 멀티 프로세스 HTTP (스레드를 시작하기 전에 fork)
+    http_cluster = start_http_cluster()
+    
+    # UDP 서버 시작 (멀티 프로세스 모드는 fork 하므로 다른 스레드보다 먼저 시작)
     if not udp_server.start():
         logger.warning("UDP 서버 시작 실패, HTTP 서버만 실행됩니다.")
     
+    # 백그라운드 DB 저장 시작
+    db.start_writer()
+    threading.Thread(target=reconcile_channels, daemon=True).start()
+    channel_snapshot.start(channels.values)
+    commands.start(resend_command)
+    if trips:
+        trips.start()
+    if trip_compactor:
+        trip_compactor.start()
+    
     # 백그라운드 작업 시작
     background_thread = threading.Thread(target=background_tasks, daemon=True)
     background_thread.start()
@@ -801,13 +1431,31 @@ if __name__ == '__main__':
     # Flask 서버 시작
     logger.info(f"Starting Flask TeleServer on port {config['http_port']}")
     try:
-        app.run(
-            host='0.0.0.0',
-            port=config['http_port'],
-            debug=False,
-            threaded=True
-        )
+        if http_cluster:
+            http_cluster.serve()
+        else:
+            app.run(
+                host='0.0.0.0',
+                port=config['http_port'],
+                debug=False,
+                threaded=True
+            )
     except KeyboardInterrupt:
+        pass
+    finally:
         logger.info("서버 종료 중...")
-        udp_server.stop()
+        # 한 단계가 실패해도 나머지 (DB/OBD 적재 등) 는 계속 종료 처리
+        shutdown = [commands.stop, udp_server.stop]
+        if http_cluster:
+            shutdown.insert(0, http_cluster.stop)
+        if trips:
+            shutdown.append(trips.stop)
+        if trip_compactor:
+            shutdown.append(trip_compactor.stop)
+        shutdown += [channel_snapshot.stop, db.stop_writer, obd_loader.stop]
+        for stop in shutdown:
+            try:
+                stop()
+            except Exception as e:
+                logger.error(f"종료 처리 오류 ({stop.__qualname__}): {e}")
         logger.info("서버가 종료되었습니다.") 
\ No newline at end of file
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+페이로드 파서 마이크로벤치마크
+
+기존 process_payload 의 split 기반 파싱과 PayloadParser.parse_payload 를
+Freematics 텔레로거 형식의 페이로드로 비교합니다.
+
+    python tools/bench_parser.py
+"""
+
+import os
+import sys
+import timeit
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PayloadParser import parse_payload  # noqa: E402
+
+# 텔레로거 형식 페이로드 (OBD, GPS, MEMS 다중 값, 타임스탬프 그룹)
+PAYLOADS = {
+    'obd': "0:81234,104:35,10C:1875,10D:62,111:18,110:412,105:88,10B:101,10F:31,142:14210",
+    'gps': "0:81234,A:37.566535,B:126.977969,C:38.2,D:42,E:271,F:11,10:103512,11:160826,12:0.9",
+    'mems': "0:81234,20:0.02;-0.01;0.98,21:0.45;-1.20;0.03,22:12;-4;41,25:1.2;-0.4;271.0,24:1384,82:41",
+    'groups': ",".join(f"0:{81234 + i * 100},10D:{60 + i},10C:{1800 + i * 5},20:0.0{i};-0.01;0.98"
+                       for i in range(10)),
+}
+
+
+@dataclass
+class PIDData:
+    ts: int = 0
+    value: str = ""
+
+
+def hex_to_int(hex_str: str) -> int:
+    try:
+        return int(hex_str, 16)
+    except ValueError:
+        return -1
+
+
+def legacy_parse(payload: str, data: dict):
+    """기존 process_payload 파싱 부분"""
+    samples = []
+    timestamp = 0
+    for part in payload.split(','):
+        if ':' not in part:
+            continue
+        pid_str, value = part.split(':', 1)
+        pid = hex_to_int(pid_str)
+        if pid == -1:
+            continue
+        if pid == 0:
+            timestamp = int(value)
+            continue
+        if timestamp == 0:
+            continue
+        data[pid] = PIDData(ts=timestamp, value=value)
+        samples.append((timestamp, pid, value))
+    return data, samples
+
+
+def new_parse(payload: str, data: dict):
+    """parse_payload 및 최신 값 갱신"""
+    result = parse_payload(payload)
+    for pid, index in result.latest().items():
+        pid_data = data.get(pid)
+        if pid_data:
+            pid_data.ts = result.ts[index]
+            pid_data.value = result.value[index]
+        else:
+            data[pid] = PIDData(ts=result.ts[index], value=result.value[index])
+    return data, result
+
+
+def main():
+    number = 20000
+    print(f"{'payload':>8} {'samples':>8} {'legacy us':>10} {'parser us':>10} {'speedup':>8}")
+    for name, payload in PAYLOADS.items():
+        legacy_samples = legacy_parse(payload, {})[1]
+        assert legacy_samples == list(parse_payload(payload)), name
+        # 채널의 최신 값 테이블은 패킷마다 유지됨
+        legacy_data, new_data = {}, {}
+        legacy = min(timeit.repeat(lambda: legacy_parse(payload, legacy_data), number=number, repeat=5)) / number
+        new = min(timeit.repeat(lambda: new_parse(payload, new_data), number=number, repeat=5)) / number
+        print(f"{name:>8} {len(legacy_samples):>8} {legacy * 1e6:>10.2f} {new * 1e6:>10.2f} {legacy / new:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
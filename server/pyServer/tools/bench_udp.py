@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+UDP 수신 처리량 벤치마크
+
+UDP_WORKERS 값을 바꿔가며 서버(app.py)를 실행하고, 시뮬레이션 디바이스가
+최대 속도로 데이터를 보낸 뒤 /api/channels 의 수신 바이트로 처리량을 측정합니다.
+
+    python tools/bench_udp.py --workers 1,2,4 --devices 200 --seconds 10
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+import urllib.request
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def add_checksum(message: str) -> bytes:
+    return f"{message}*{sum(message.encode()) & 0xFF:X}".encode()
+
+
+def sender(port, devices, seconds, result):
+    """디바이스별 소켓(소스 포트)으로 데이터 전송"""
+    socks = []
+    for devid in devices:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.sendto(add_checksum(f"{devid}#EV=1,TS=0,VIN="), ('127.0.0.1', port))
+        socks.append((devid, s))
+    sent = 0
+    sent_bytes = 0
+    tick = 1000
+    end = time.time() + seconds
+    while time.time() < end:
+        tick += 100
+        payload = f"0:{tick},10D:{tick % 200},11:{tick % 100},0C:{tick % 7000}"
+        for devid, s in socks:
+            s.sendto(add_checksum(f"{devid}#{payload}"), ('127.0.0.1', port))
+            sent += 1
+            sent_bytes += len(payload)
+    result.put((sent, sent_bytes))
+
+
+def run(workers, args):
+    env = dict(os.environ, UDP_WORKERS=str(workers), UDP_PORT=str(args.udp_port),
+               HTTP_PORT=str(args.http_port), OBD_LOADER='0', MAX_CHANNELS=str(args.devices * 2))
+    workdir = tempfile.mkdtemp(prefix='bench_udp_')
+    server = subprocess.Popen([sys.executable, os.path.join(SERVER_DIR, 'app.py')], cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(args.startup)
+        result = multiprocessing.Queue()
+        names = [f"BENCH{i:05d}" for i in range(args.devices)]
+        procs = [multiprocessing.Process(target=sender, args=(args.udp_port, names[i::args.senders],
+                                                              args.seconds, result))
+                 for i in range(args.senders)]
+        start = time.time()
+        for p in procs:
+            p.start()
+        totals = [result.get() for _ in procs]
+        sent = sum(t[0] for t in totals)
+        sent_bytes = sum(t[1] for t in totals)
+        for p in procs:
+            p.join()
+        elapsed = time.time() - start
+        time.sleep(args.settle)
+        with urllib.request.urlopen(f"http://127.0.0.1:{args.http_port}/api/channels") as r:
+            channels = json.loads(r.read())['channels']
+        # recv 는 처리된 페이로드 바이트 수
+        received_bytes = sum(c['recv'] for c in channels if c['devid'].startswith('BENCH'))
+        received = sent * received_bytes / sent_bytes if sent_bytes else 0
+        return sent, received, elapsed
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='UDP 수신 처리량 벤치마크')
+    parser.add_argument('--workers', default='1,2,4', help='비교할 UDP_WORKERS 값 (쉼표 구분)')
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--senders', type=int, default=2, help='전송 프로세스 수')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--udp-port', type=int, default=43000)
+    parser.add_argument('--http-port', type=int, default=48080)
+    parser.add_argument('--startup', type=float, default=3, help='서버 시작 대기 (초)')
+    parser.add_argument('--settle', type=float, default=2, help='전송 후 처리 완료 대기 (초)')
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'workers':>7} {'sent/s':>10} {'processed/s':>12} {'loss':>7} {'speedup':>8}")
+    for workers in [int(w) for w in args.workers.split(',')]:
+        sent, received, elapsed = run(workers, args)
+        rate = received / elapsed
+        baseline = baseline or rate
+        loss = 1 - received / sent if sent else 0
+        print(f"{workers:>7} {sent / elapsed:>10.0f} {rate:>12.0f} {loss:>6.1%} {rate / baseline:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
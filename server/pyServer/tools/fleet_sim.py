@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Freematics 디바이스 플릿 시뮬레이터 / 부하 테스트
+
+N개의 디바이스가 실제 프로토콜로 서버와 통신합니다.
+    UDP : EV=1 로그인(VIN, SK) -> devid#0:ts,10D:..*XX 데이터 -> EV=7 핑 -> EV=2 로그아웃
+    HTTP: /api/notify?EV=1 로그인 -> /api/post 데이터 -> /api/notify?EV=2 로그아웃
+
+수락된 패킷 수/초, 응답 지연 백분위수, 손실률, 서버 CPU 사용률을 출력합니다.
+UDP 수락 수는 서버 응답의 RX(수신 카운트) 증가분으로 계산합니다.
+
+    python tools/fleet_sim.py --devices 500 --rate 2 --seconds 30
+    python tools/fleet_sim.py --spawn --env UDP_WORKERS=2 --min-rate 800 --max-drop 0.01
+    python tools/fleet_sim.py --mode http --devices 50 --rate 1 --server-pid 1234
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import selectors
+import tempfile
+import subprocess
+import http.client
+import multiprocessing
+import urllib.parse
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def add_checksum(message: str) -> bytes:
+    data = message.encode()
+    return b'%s*%X' % (data, sum(data) & 0xFF)
+
+
+def parse_response(data: bytes):
+    """서버 응답 (<채널 ID>#EV=x,RX=y,TX=z*XX) -> (이벤트, RX)"""
+    body = data.rsplit(b'*', 1)[0].partition(b'#')[2]
+    fields = dict(item.partition(b'=')[::2] for item in body.split(b','))
+    try:
+        return int(fields.get(b'EV', 0)), int(fields.get(b'RX', -1))
+    except ValueError:
+        return 0, -1
+
+
+def make_vin(index: int) -> str:
+    return f"SIMVIN{index:011d}"[:17]
+
+
+def make_payload(tick: int, seq: int) -> str:
+    """주행 데이터 한 프레임 (속도, RPM, 냉각수, GPS, 가속도)"""
+    speed = 40 + seq % 60
+    return (f"0:{tick},10D:{speed},10C:{800 + speed * 30},105:{80 + seq % 10},"
+            f"A:{37.5 + seq * 1e-5:.6f},B:{127.0 + seq * 1e-5:.6f},D:{speed},"
+            f"20:{seq % 5};{-seq % 3};{98 + seq % 2}")
+
+
+class Device:
+    """시뮬레이션 디바이스 상태"""
+
+    __slots__ = ('devid', 'vin', 'sock', 'tick', 'seq', 'sent', 'rx_start', 'rx_last', 'pending')
+
+    def __init__(self, devid, vin):
+        self.devid = devid
+        self.vin = vin
+        self.sock = None
+        self.tick = 0
+        self.seq = 0
+        self.sent = 0
+        self.rx_start = -1
+        self.rx_last = -1
+        self.pending = {}  # 이벤트 -> 요청 전송 시각
+
+
+def udp_worker(args, names, result):
+    """디바이스별 소켓(소스 포트)으로 UDP 프로토콜 실행"""
+    target = (args.host, args.udp_port)
+    selector = selectors.DefaultSelector()
+    devices = []
+    for name, vin in names:
+        device = Device(name, vin)
+        device.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        device.sock.setblocking(False)
+        device.sock.connect(target)
+        selector.register(device.sock, selectors.EVENT_READ, device)
+        devices.append(device)
+
+    latencies = {'login': [], 'ping': [], 'logout': []}
+    stats = {'sent': 0, 'send_errors': 0, 'responses': 0, 'login_failed': 0, 'ping_lost': 0}
+
+    def send(device, message, event=None):
+        try:
+            device.sock.send(add_checksum(message))
+            if event:
+                device.pending[event] = time.perf_counter()
+            return True
+        except OSError:
+            stats['send_errors'] += 1
+            return False
+
+    def receive(timeout):
+        for key, _ in selector.select(timeout):
+            device = key.data
+            while True:
+                try:
+                    data = device.sock.recv(4096)
+                except (BlockingIOError, ConnectionRefusedError):
+                    break
+                stats['responses'] += 1
+                event, rx = parse_response(data)
+                if rx >= 0:
+                    device.rx_last = rx
+                    if event == 1:
+                        device.rx_start = rx
+                started = device.pending.pop(event, None)
+                if started is not None:
+                    name = {1: 'login', 7: 'ping', 2: 'logout'}.get(event)
+                    if name:
+                        latencies[name].append((time.perf_counter() - started) * 1000)
+
+    def drain(event, timeout):
+        end = time.perf_counter() + timeout
+        while time.perf_counter() < end and any(event in d.pending for d in devices):
+            receive(0.05)
+
+    # 로그인
+    for device in devices:
+        device.tick = random.randint(1000, 100000)
+        send(device, f"{device.devid}#EV=1,TS={device.tick},VIN={device.vin},SK={args.server_key}", 1)
+    drain(1, args.timeout)
+    for device in devices:
+        if device.pending.pop(1, None) is not None:
+            stats['login_failed'] += 1
+
+    # 데이터 / 핑
+    interval = 1.0 / (args.rate * len(devices)) if devices else 1.0
+    ping_every = max(int(args.ping_interval * args.rate), 1) if args.ping_interval > 0 else 0
+    start = time.perf_counter()
+    end = start + args.seconds
+    next_send = start
+    index = 0
+    while True:
+        now = time.perf_counter()
+        if now >= end:
+            break
+        while next_send <= now:
+            device = devices[index]
+            index = (index + 1) % len(devices)
+            device.tick += int(1000 / args.rate)
+            device.seq += 1
+            if send(device, f"{device.devid}#{make_payload(device.tick, device.seq)}"):
+                device.sent += 1
+                stats['sent'] += 1
+            if ping_every and device.seq % ping_every == 0:
+                if 7 in device.pending:
+                    stats['ping_lost'] += 1
+                send(device, f"{device.devid}#EV=7,TS={device.tick}", 7)
+            next_send += interval
+        receive(max(min(next_send, end) - time.perf_counter(), 0))
+    elapsed = time.perf_counter() - start
+
+    # 로그아웃 (RX 로 최종 수락 수 확인)
+    drain(7, args.timeout)
+    stats['ping_lost'] += sum(1 for d in devices if d.pending.pop(7, None) is not None)
+    for device in devices:
+        send(device, f"{device.devid}#EV=2,TS={device.tick}", 2)
+    drain(2, args.timeout)
+
+    accepted = 0
+    unknown = 0
+    for device in devices:
+        if device.rx_start < 0 or 2 in device.pending:
+            # 로그아웃 응답이 없으면 마지막 응답의 RX 사용 (최소값)
+            unknown += 1
+        if device.rx_start >= 0 and device.rx_last >= device.rx_start:
+            accepted += device.rx_last - device.rx_start
+        device.sock.close()
+    stats['accepted'] = accepted
+    stats['unconfirmed_devices'] = unknown
+    stats['elapsed'] = elapsed
+    result.put((stats, latencies))
+
+
+def http_worker(args, names, result):
+    """/api/notify 로그인 후 /api/post 로 데이터 전송 (프로세스별 keep-alive 연결)"""
+    conn = http.client.HTTPConnection(args.host, args.http_port, timeout=args.timeout)
+    latencies = {'login': [], 'post': [], 'logout': []}
+    stats = {'sent': 0, 'send_errors': 0, 'responses': 0, 'login_failed': 0, 'accepted': 0}
+
+    def request(method, path, body=None, kind=None):
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers={'Content-Type': 'text/plain'})
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            stats['send_errors'] += 1
+            conn.close()
+            return None, None
+        stats['responses'] += 1
+        if kind:
+            latencies[kind].append((time.perf_counter() - started) * 1000)
+        return response.status, data
+
+    devices = [Device(name, vin) for name, vin in names]
+    for device in devices:
+        device.tick = random.randint(1000, 100000)
+        query = urllib.parse.urlencode({'id': device.devid, 'EV': 1, 'VIN': device.vin})
+        status, _ = request('GET', f"/api/notify?{query}", kind='login')
+        if status != 200:
+            stats['login_failed'] += 1
+
+    interval = 1.0 / (args.rate * len(devices)) if devices else 1.0
+    start = time.perf_counter()
+    end = start + args.seconds
+    next_send = start
+    index = 0
+    while time.perf_counter() < end:
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        device = devices[index]
+        index = (index + 1) % len(devices)
+        device.tick += int(1000 / args.rate)
+        device.seq += 1
+        stats['sent'] += 1
+        status, data = request('POST', f"/api/post?id={urllib.parse.quote(device.devid)}",
+                               make_payload(device.tick, device.seq), kind='post')
+        if status == 200 and data and b'OK' in data:
+            stats['accepted'] += 1
+        next_send += interval
+    stats['elapsed'] = time.perf_counter() - start
+
+    for device in devices:
+        query = urllib.parse.urlencode({'id': device.devid, 'EV': 2})
+        request('GET', f"/api/notify?{query}", kind='logout')
+    conn.close()
+    result.put((stats, latencies))
+
+
+def process_tree(pid):
+    """pid 와 그 자식 프로세스 목록 (Linux /proc)"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        pids.append(p)
+        stack.extend(children.get(p, []))
+    return pids
+
+
+def cpu_seconds(pid):
+    """프로세스 트리의 누적 CPU 시간 (user + system, 초), 측정 불가 시 None"""
+    if not pid or not os.path.isdir('/proc'):
+        return None
+    total = 0
+    for p in process_tree(pid):
+        try:
+            with open(f'/proc/{p}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / os.sysconf('SC_CLK_TCK')
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def spawn_server(args):
+    env = dict(os.environ, UDP_PORT=str(args.udp_port), HTTP_PORT=str(args.http_port),
+               OBD_LOADER='0', MAX_CHANNELS=str(args.devices * 2), LOG_LEVEL='WARNING')
+    for item in args.env:
+        name, _, value = item.partition('=')
+        env[name] = value
+    workdir = tempfile.mkdtemp(prefix='fleet_sim_')
+    server = subprocess.Popen([sys.executable, os.path.join(SERVER_DIR, 'app.py')], cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(args.startup)
+    if server.poll() is not None:
+        raise SystemExit(f"서버 시작 실패 (종료 코드 {server.returncode})")
+    return server
+
+
+def run(args):
+    server = spawn_server(args) if args.spawn else None
+    server_pid = server.pid if server else args.server_pid
+    try:
+        names = [(f"{args.prefix}{i:05d}", make_vin(i)) for i in range(args.devices)]
+        worker = udp_worker if args.mode == 'udp' else http_worker
+        result = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=worker, args=(args, names[i::args.procs], result))
+                 for i in range(min(args.procs, args.devices))]
+        cpu_start = cpu_seconds(server_pid)
+        wall_start = time.perf_counter()
+        for p in procs:
+            p.start()
+        outputs = [result.get() for _ in procs]
+        wall = time.perf_counter() - wall_start
+        cpu_end = cpu_seconds(server_pid)
+        for p in procs:
+            p.join()
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+
+    totals = {}
+    latencies = {}
+    for stats, lat in outputs:
+        for key, value in stats.items():
+            totals[key] = max(totals.get(key, 0), value) if key == 'elapsed' else totals.get(key, 0) + value
+        for key, values in lat.items():
+            latencies.setdefault(key, []).extend(values)
+
+    elapsed = totals.get('elapsed') or args.seconds
+    sent = totals.get('sent', 0)
+    accepted = totals.get('accepted', 0)
+    report = {
+        'mode': args.mode,
+        'devices': args.devices,
+        'seconds': round(elapsed, 2),
+        'sent': sent,
+        'accepted': accepted,
+        'sent_per_sec': round(sent / elapsed, 1),
+        'accepted_per_sec': round(accepted / elapsed, 1),
+        'drop_rate': round(1 - accepted / sent, 4) if sent else 0.0,
+        'login_failed': totals.get('login_failed', 0),
+        'send_errors': totals.get('send_errors', 0),
+        'latency_ms': {key: {'count': len(values),
+                             'p50': round(percentile(values, 0.50), 3),
+                             'p90': round(percentile(values, 0.90), 3),
+                             'p99': round(percentile(values, 0.99), 3),
+                             'max': round(max(values), 3) if values else None}
+                       for key, values in latencies.items()},
+    }
+    if args.mode == 'udp':
+        report['ping_lost'] = totals.get('ping_lost', 0)
+        report['unconfirmed_devices'] = totals.get('unconfirmed_devices', 0)
+    if cpu_start is not None and cpu_end is not None:
+        report['server_cpu_percent'] = round((cpu_end - cpu_start) / wall * 100, 1)
+    return report
+
+
+def print_report(report):
+    print(f"mode={report['mode']} devices={report['devices']} seconds={report['seconds']}")
+    print(f"sent      {report['sent']:>10} ({report['sent_per_sec']:.1f}/s)")
+    print(f"accepted  {report['accepted']:>10} ({report['accepted_per_sec']:.1f}/s)")
+    print(f"drop rate {report['drop_rate']:>10.2%}")
+    if report['login_failed'] or report['send_errors']:
+        print(f"login failed {report['login_failed']}, send errors {report['send_errors']}")
+    if 'ping_lost' in report:
+        print(f"ping lost {report['ping_lost']}, unconfirmed devices {report['unconfirmed_devices']}")
+    if 'server_cpu_percent' in report:
+        print(f"server CPU {report['server_cpu_percent']:.1f}%")
+    print(f"{'latency':<8} {'count':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  (ms)")
+    for key, lat in report['latency_ms'].items():
+        if lat['count']:
+            print(f"{key:<8} {lat['count']:>7} {lat['p50']:>9.3f} {lat['p90']:>9.3f} {lat['p99']:>9.3f} {lat['max']:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Freematics 디바이스 플릿 시뮬레이터 / 부하 테스트')
+    parser.add_argument('--mode', choices=('udp', 'http'), default='udp')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--udp-port', type=int, default=33000)
+    parser.add_argument('--http-port', type=int, default=8080)
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=1.0, help='디바이스당 초당 데이터 프레임 수')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--procs', type=int, default=2, help='전송 프로세스 수')
+    parser.add_argument('--ping-interval', type=float, default=5, help='디바이스별 EV=7 핑 간격 (초, 0이면 사용 안 함)')
+    parser.add_argument('--server-key', default='', help='로그인 SK 값 (SERVER_KEY)')
+    parser.add_argument('--prefix', default='SIM', help='디바이스 ID 접두어')
+    parser.add_argument('--timeout', type=float, default=3, help='응답 대기 시간 (초)')
+    parser.add_argument('--server-pid', type=int, default=0, help='CPU 측정할 서버 프로세스 ID')
+    parser.add_argument('--spawn', action='store_true', help='임시 디렉토리에서 app.py 를 실행하여 측정')
+    parser.add_argument('--env', action='append', default=[], help='--spawn 서버 환경변수 (NAME=VALUE)')
+    parser.add_argument('--startup', type=float, default=3, help='서버 시작 대기 (초)')
+    parser.add_argument('--json', action='store_true', help='결과를 JSON 으로 출력')
+    parser.add_argument('--min-rate', type=float, default=0, help='수락 패킷/초가 이보다 낮으면 실패 (종료 코드 1)')
+    parser.add_argument('--max-drop', type=float, default=1.0, help='손실률이 이보다 높으면 실패 (종료 코드 1)')
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failed = report['accepted_per_sec'] < args.min_rate or report['drop_rate'] > args.max_drop
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()